@@ -0,0 +1,112 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.context import DEFAULT_TOKEN_BUDGET
+from agent.session import AsyncAgentSession, DEFAULT_MAX_TURNS
+
+
+def parse_batch_line(line: str, index: int):
+    """Parse one NDJSON input line into an (id, prompt) pair.
+
+    A line may be a JSON object with a "prompt" key (and an optional "id"),
+    or a bare JSON string. Returns None for blank lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    item = json.loads(line)
+    if isinstance(item, str):
+        return index, item
+    if isinstance(item, dict) and isinstance(item.get('prompt'), str):
+        return item.get('id', index), item['prompt']
+    raise ValueError('expected a JSON string or an object with a "prompt" field')
+
+
+async def _run_one(client, item_id, prompt, executor, max_turns, max_tokens, verbose, context_budget):
+    """Run a single prompt to completion and return its NDJSON record."""
+    record = {"id": item_id, "prompt": prompt}
+    session = AsyncAgentSession(client, executor=executor, verbose=verbose, context_budget=context_budget,
+                                max_turns=max_turns, max_tokens=max_tokens)
+    try:
+        record["text"] = await session.run(prompt)
+        record["done"] = session.done
+    except Exception as e:
+        record["error"] = str(e)
+    record["stop_reason"] = session.stop_reason
+    record["turns"] = session.turns
+    # Summed over every model call of the session.
+    record["prompt_tokens"] = session.usage.prompt
+    record["cached_tokens"] = session.usage.cached
+    record["response_tokens"] = session.usage.candidates
+    record["total_tokens"] = session.usage.total
+    return record
+
+
+async def run_batch(client, source, out, concurrency: int = 4, max_turns: int = DEFAULT_MAX_TURNS,
+                    max_tokens: int = None, verbose: bool = False, context_budget: int = DEFAULT_TOKEN_BUDGET):
+    """Run every prompt read from `source` through its own session and write NDJSON results to `out`.
+
+    At most `concurrency` sessions are in flight at once. Every non-blank
+    input line gets exactly one record, written in input order as soon as it
+    and every record before it are ready; a line that cannot be parsed gets
+    an "error" record. Reading stops `concurrency * 4` lines ahead of the
+    oldest unwritten record, so a slow prompt holds back a bounded number of
+    finished ones. max_turns and max_tokens apply to each session
+    separately. Returns the number of records written.
+    """
+    concurrency = max(1, concurrency)
+    queue = asyncio.Queue()
+    window = asyncio.Semaphore(concurrency * 4)
+    ready = {}
+    next_to_write = 0
+    written = 0
+
+    def finish(position, record):
+        nonlocal next_to_write, written
+        ready[position] = record
+        while next_to_write in ready:
+            out.write(json.dumps(ready.pop(next_to_write), default=str) + "\n")
+            next_to_write += 1
+            written += 1
+            window.release()
+        out.flush()
+
+    async def worker(executor):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            position, item_id, prompt = item
+            finish(position, await _run_one(client, item_id, prompt, executor, max_turns, max_tokens, verbose,
+                                            context_budget))
+
+    # One shared pool for tool execution across every session in the batch.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        workers = [asyncio.create_task(worker(executor)) for _ in range(concurrency)]
+        loop = asyncio.get_running_loop()
+        index = 0
+        position = 0
+        while True:
+            await window.acquire()
+            # Read in the default executor so a slow stdin does not stall running sessions.
+            line = await loop.run_in_executor(None, source.readline)
+            if not line:
+                break
+            index += 1
+            try:
+                parsed = parse_batch_line(line, index)
+            except ValueError as e:
+                finish(position, {"id": index, "error": f"invalid input line: {e}"})
+                position += 1
+                continue
+            if parsed is None:
+                window.release()
+                continue
+            await queue.put((position, *parsed))
+            position += 1
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return written
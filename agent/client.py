@@ -0,0 +1,419 @@
+import os
+import time
+import random
+import threading
+from collections import namedtuple
+
+from functions.tracing import span
+
+
+# Process-wide request and token rates for model calls; 0 leaves them unlimited.
+REQUESTS_PER_MINUTE = int(os.environ.get('AGENT_RPM', '0'))
+TOKENS_PER_MINUTE = int(os.environ.get('AGENT_TPM', '0'))
+
+# Consecutive transient failures that open the circuit, and how long it stays open.
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+# HTTP statuses worth retrying; anything else (bad request, auth, not found) fails at once.
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Exception class names of transport failures raised by httpx/requests/aiohttp.
+_TRANSPORT_ERRORS = {'TransportError', 'TimeoutException', 'ConnectionError', 'ClientConnectionError', 'Timeout'}
+
+
+ErrorInfo = namedtuple('ErrorInfo', 'retryable status retry_after')
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+
+def _status_of(error):
+    for attr in ('code', 'status_code', 'status'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def _parse_delay(value):
+    """Parse a Retry-After value (seconds or an HTTP date) or a "12.5s" duration."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value[:-1] if value.endswith('s') else value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _retry_after(error):
+    """Return the delay the server asked for, from a Retry-After header or a RetryInfo detail."""
+    for source in (error, getattr(error, 'response', None)):
+        headers = getattr(source, 'headers', None)
+        if headers is not None:
+            delay = _parse_delay(headers.get('Retry-After'))
+            if delay is not None:
+                return delay
+    # google.genai's APIError carries the JSON error body, which may hold RetryInfo.
+    details = getattr(error, 'details', None)
+    if isinstance(details, dict):
+        details = details.get('error', details).get('details')
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and 'retryDelay' in detail:
+            return _parse_delay(detail['retryDelay'])
+    return None
+
+
+def classify_error(error) -> ErrorInfo:
+    """Decide whether a failed model call is worth retrying.
+
+    Retryable: HTTP 408/429/5xx and connection or timeout failures.
+    Everything else, including authentication and invalid requests, is not.
+    """
+    status = _status_of(error)
+    if status is not None:
+        return ErrorInfo(status in RETRYABLE_STATUSES, status, _retry_after(error))
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return ErrorInfo(True, None, None)
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & _TRANSPORT_ERRORS or (isinstance(error, OSError) and 'URLError' in names):
+        return ErrorInfo(True, None, None)
+    return ErrorInfo(False, None, None)
+
+
+class TokenBucket:
+    """A token bucket refilled at `per_minute` tokens per minute.
+
+    take() always succeeds and returns how long the caller must wait before
+    using what it took; the level may go negative, so concurrent callers
+    queue up in the order they asked.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = None
+
+    def _refill(self, now: float, scale: float):
+        if self.updated is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * scale)
+        self.updated = now
+
+    def take(self, amount: float, now: float, scale: float = 1.0) -> float:
+        self._refill(now, scale)
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / (self.rate * scale)
+
+    def give(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Process-wide request and token rate limits shared by every session.
+
+    Before each model call a caller reserves one request and its estimated
+    prompt tokens and sleeps for the returned delay. When the server answers
+    429 the limiter pauses all callers for the Retry-After delay and halves
+    its rates; each later success restores them gradually.
+    """
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE,
+                 clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.clock = clock
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limits_tokens(self) -> bool:
+        return self.tokens is not None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve one request and `tokens` prompt tokens; return the seconds to wait first."""
+        with self._lock:
+            now = self.clock()
+            delay = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                delay = max(delay, self.requests.take(1, now, self.scale))
+            if self.tokens is not None and tokens:
+                delay = max(delay, self.tokens.take(tokens, now, self.scale))
+            return delay
+
+    def settle(self, reserved: int, used: int):
+        """Correct a token reservation once the actual usage is known."""
+        if self.tokens is None or used is None:
+            return
+        with self._lock:
+            self.tokens.give(reserved - used)
+
+    def throttle(self, delay: float):
+        """Pause every caller for `delay` seconds and slow the rates down after a 429."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + delay)
+            self.scale = max(0.1, self.scale / 2)
+            self.throttled += 1
+
+    def record_success(self):
+        with self._lock:
+            self.scale = min(1.0, self.scale + 0.05)
+
+
+class CircuitBreaker:
+    """Stop calling the model after repeated transient failures.
+
+    After `failure_threshold` consecutive retryable failures the circuit
+    opens and calls fail at once with CircuitOpenError. Once `reset_timeout`
+    seconds have passed a single trial call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_SECONDS,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if self.probing or self.clock() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go ahead now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (self.clock() - self.opened_at)
+            if self.probing or remaining > 0:
+                raise CircuitOpenError(
+                    f"Model API unavailable after {self.failures} consecutive failures; "
+                    f"circuit open for another {max(remaining, 0):.0f}s"
+                )
+            self.probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self.probing = False
+
+    def record_abandoned(self):
+        """Note a call that ended without an outcome, e.g. cancelled or interrupted.
+
+        It says nothing about the API, so the failure count is left alone,
+        but an abandoned trial call opens the circuit again rather than
+        leaving it claimed forever.
+        """
+        with self._lock:
+            if self.probing:
+                self.opened_at = self.clock()
+                self.probing = False
+
+
+# Shared by every session in the process so concurrent sessions back off together.
+rate_limiter = RateLimiter()
+circuit_breaker = CircuitBreaker()
+
+
+def _estimate_tokens(contents) -> int:
+    if isinstance(contents, str):
+        from agent.context import CHARS_PER_TOKEN
+        return len(contents) // CHARS_PER_TOKEN
+    from agent.context import estimate_tokens
+    return estimate_tokens(contents)
+
+
+def _used_tokens(response):
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None) if usage is not None else None
+
+
+class _Models:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, *, model, contents, config=None):
+        owner = self._owner
+        return owner._call(lambda: owner.client.models.generate_content(model=model, contents=contents, config=config),
+                           owner._estimate(contents))
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        """Stream a response, retrying only until the first chunk arrives."""
+        owner = self._owner
+
+        def first_chunk():
+            stream = iter(owner.client.models.generate_content_stream(model=model, contents=contents, config=config))
+            return stream, next(stream, None)
+
+        reserved = owner._estimate(contents)
+        stream, chunk = owner._call(first_chunk, reserved, settle=False)
+        used = None
+        while chunk is not None:
+            used = _used_tokens(chunk) or used
+            yield chunk
+            chunk = next(stream, None)
+        owner.limiter.settle(reserved, used)
+
+
+class _AsyncModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def generate_content(self, *, model, contents, config=None):
+        owner = self._owner
+        return await owner._call_async(
+            lambda: owner.client.aio.models.generate_content(model=model, contents=contents, config=config),
+            owner._estimate(contents),
+        )
+
+
+class _Aio:
+    def __init__(self, owner):
+        self.models = _AsyncModels(owner)
+
+
+class RateLimitedClient:
+    """Wrap a genai client so model calls are rate limited, retried and guarded.
+
+    Exposes the same models.generate_content, models.generate_content_stream
+    and aio.models.generate_content calls as the wrapped client. Each call
+    waits for the shared RateLimiter, fails fast while the CircuitBreaker is
+    open, and retries transient errors (see classify_error) with
+    decorrelated-jitter backoff, never waiting less than the server's
+    Retry-After. Other attributes are passed through to the wrapped client.
+    """
+
+    # Tells AgentSession not to wrap this client again.
+    handles_retries = True
+
+    def __init__(self, client, limiter: RateLimiter = None, breaker: CircuitBreaker = None, max_attempts: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0, verbose: bool = False, sleep=time.sleep):
+        self.client = client
+        self.limiter = limiter if limiter is not None else rate_limiter
+        self.breaker = breaker if breaker is not None else circuit_breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.verbose = verbose
+        self.sleep = sleep
+        self.models = _Models(self)
+        self.aio = _Aio(self)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _estimate(self, contents) -> int:
+        """Estimate the prompt tokens to reserve; 0 when tokens per minute are not limited."""
+        return _estimate_tokens(contents) if self.limiter.limits_tokens else 0
+
+    def _before_attempt(self, reserved: int) -> float:
+        self.breaker.check()
+        return self.limiter.reserve(reserved)
+
+    def _after_failure(self, attempt: int, error: Exception, reserved: int, backoff: float):
+        """Return (delay, backoff) before the next attempt, or re-raise if the error should not be retried."""
+        self.limiter.settle(reserved, 0)
+        info = classify_error(error)
+        if not info.retryable:
+            # The API answered (or the request itself is at fault), so it is not down.
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        if attempt >= self.max_attempts:
+            raise error
+        backoff = min(self.max_delay, random.uniform(self.base_delay, backoff * 3))
+        delay = max(backoff, info.retry_after or 0.0)
+        if info.status == 429:
+            self.limiter.throttle(delay)
+        if self.verbose:
+            print(f"Transient error calling model (attempt {attempt}/{self.max_attempts}): {error}. "
+                  f"Retrying in {delay:.1f}s...")
+        return delay, backoff
+
+    def _after_abandon(self, reserved: int):
+        self.limiter.settle(reserved, 0)
+        self.breaker.record_abandoned()
+
+    def _after_success(self, result, reserved: int, settle: bool = True):
+        self.breaker.record_success()
+        self.limiter.record_success()
+        if settle:
+            self.limiter.settle(reserved, _used_tokens(result))
+
+    def _call(self, request, reserved: int, settle: bool = True):
+        backoff = self.base_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            delay = self._before_attempt(reserved)
+            try:
+                if delay:
+                    with span('rate_limit_wait', 'model', delay=delay):
+                        self.sleep(delay)
+                with span('model_request', 'model', attempt=attempt):
+                    result = request()
+            except Exception as e:
+                delay, backoff = self._after_failure(attempt, e, reserved, backoff)
+                with span('retry_backoff', 'model', attempt=attempt, delay=delay):
+                    self.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: a trial call must not stay claimed.
+                self._after_abandon(reserved)
+                raise
+            self._after_success(result, reserved, settle)
+            return result
+
+    async def _call_async(self, request, reserved: int):
+        import asyncio
+
+        backoff = self.base_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            delay = self._before_attempt(reserved)
+            try:
+                if delay:
+                    with span('rate_limit_wait', 'model', delay=delay):
+                        await asyncio.sleep(delay)
+                with span('model_request', 'model', attempt=attempt):
+                    result = await request()
+            except Exception as e:
+                delay, backoff = self._after_failure(attempt, e, reserved, backoff)
+                with span('retry_backoff', 'model', attempt=attempt, delay=delay):
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: a trial call must not stay claimed.
+                self._after_abandon(reserved)
+                raise
+            self._after_success(result, reserved)
+            return result
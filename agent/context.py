@@ -0,0 +1,152 @@
+import json
+
+
+# Rough size of one token in characters, used to estimate prompt size locally.
+CHARS_PER_TOKEN = 4
+
+# Default prompt budget before old tool output starts being compacted.
+DEFAULT_TOKEN_BUDGET = 32000
+
+# Tool results shorter than this are cheaper to keep than to stub out.
+MIN_COMPACT_CHARS = 200
+
+
+def _part_chars(part) -> int:
+    """Return the approximate serialized size of a single part."""
+    text = getattr(part, 'text', None)
+    if text:
+        return len(text)
+    function_call = getattr(part, 'function_call', None)
+    if function_call is not None:
+        return len(function_call.name or '') + len(json.dumps(function_call.args or {}, default=str))
+    function_response = getattr(part, 'function_response', None)
+    if function_response is not None:
+        return len(function_response.name or '') + len(json.dumps(function_response.response or {}, default=str))
+    return 0
+
+
+def _read_key(args):
+    """Return what identifies the content of a get_file_content call: the file and the range read."""
+    return (
+        args.get('file_path'), args.get('offset'), args.get('length'),
+        args.get('start_line'), args.get('end_line'), bool(args.get('head_tail')),
+    )
+
+
+def estimate_tokens(messages) -> int:
+    """Estimate the prompt tokens needed to send `messages`."""
+    chars = 0
+    for content in messages:
+        for part in content.parts or []:
+            chars += _part_chars(part)
+    return chars // CHARS_PER_TOKEN
+
+
+class ContextManager:
+    """Keep the message history under a token budget by compacting old tool output.
+
+    Once the estimated history size exceeds `token_budget`, compact() first
+    replaces earlier get_file_content results for a file and range that was
+    read again later, then replaces the oldest remaining tool results with short stubs
+    until the history fits. The first user prompt and the last
+    `keep_recent_turns` model turns with their tool results are never
+    touched. The system prompt lives in the request config and is always sent.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, keep_recent_turns: int = 2):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.saved_per_turn = []
+
+    def _tool_results(self, messages):
+        """Yield (message_index, part_index, call_args) for each compactable tool result.
+
+        Function responses are paired with the function calls of the preceding
+        model message by position, so call_args holds the arguments the model
+        passed (or {} when they cannot be recovered).
+        """
+        pending_args = []
+        for i, content in enumerate(messages):
+            parts = content.parts or []
+            if content.role == 'model':
+                pending_args = [
+                    dict(p.function_call.args or {}) for p in parts if getattr(p, 'function_call', None) is not None
+                ]
+                continue
+            for j, part in enumerate(parts):
+                function_response = getattr(part, 'function_response', None)
+                if function_response is None:
+                    continue
+                args = pending_args[j] if j < len(pending_args) else {}
+                yield i, j, args
+
+    def _protected_from(self, messages) -> int:
+        """Return the index of the first message belonging to the recent turns."""
+        seen = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].role == 'model':
+                seen += 1
+                if seen >= self.keep_recent_turns:
+                    return i
+        return 0
+
+    @staticmethod
+    def _stub(messages, i, j, note) -> int:
+        """Replace one function response with a short note and return the tokens saved."""
+        content = messages[i]
+        part = content.parts[j]
+        function_response = part.function_response
+        payload = function_response.response or {}
+        if payload.get('compacted'):
+            return 0
+        before = _part_chars(part)
+        if before < MIN_COMPACT_CHARS:
+            return 0
+        from google.genai import types
+
+        stub = types.Part.from_function_response(
+            name=function_response.name,
+            response={"result": note, "compacted": True},
+        )
+        parts = list(content.parts)
+        parts[j] = stub
+        messages[i] = types.Content(role=content.role, parts=parts)
+        return (before - _part_chars(stub)) // CHARS_PER_TOKEN
+
+    def compact(self, messages) -> int:
+        """Compact `messages` in place if it exceeds the budget and return the tokens saved."""
+        total = estimate_tokens(messages)
+        if total <= self.token_budget:
+            self.saved_per_turn.append(0)
+            return 0
+
+        protected_from = self._protected_from(messages)
+        results = [r for r in self._tool_results(messages) if r[0] < protected_from]
+        saved = 0
+
+        # Earlier reads of a range that was read again later carry stale content.
+        latest_read = {}
+        for i, j, args in self._tool_results(messages):
+            if messages[i].parts[j].function_response.name == 'get_file_content' and 'file_path' in args:
+                latest_read[_read_key(args)] = (i, j)
+        for i, j, args in results:
+            name = messages[i].parts[j].function_response.name
+            if name != 'get_file_content' or 'file_path' not in args:
+                continue
+            if latest_read.get(_read_key(args), (i, j)) != (i, j):
+                saved += self._stub(messages, i, j, f'[superseded by a later read of "{args["file_path"]}"]')
+
+        # Then stub out the oldest remaining tool output until the history fits.
+        for i, j, args in results:
+            if total - saved <= self.token_budget:
+                break
+            name = messages[i].parts[j].function_response.name
+            target = args.get('file_path') or args.get('directory')
+            where = f' for "{target}"' if target else ''
+            saved += self._stub(
+                messages, i, j,
+                f'[earlier {name} output{where} removed to save context; call it again if you need it]',
+            )
+
+        self.saved_per_turn.append(saved)
+        return saved
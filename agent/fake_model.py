@@ -0,0 +1,132 @@
+import json
+import time
+import asyncio
+import threading
+
+from google.genai import types
+
+from agent.context import estimate_tokens, CHARS_PER_TOKEN
+from agent.replay import response_from_dict
+
+
+def _turn_response(turn) -> dict:
+    """Expand one script entry into a GenerateContentResponse dict.
+
+    An entry is either a recorded {"request", "response"} pair, a response
+    dict as stored by ResponseStore, or a shorthand with "text" and/or
+    "function_calls" ([{"name", "args"}]).
+    """
+    if 'response' in turn:
+        return turn['response']
+    if 'candidates' in turn:
+        return turn
+    parts = [{'function_call': {'name': c['name'], 'args': c.get('args', {})}} for c in turn.get('function_calls', [])]
+    if turn.get('text'):
+        parts.insert(0, {'text': turn['text']})
+    return {'candidates': [{'content': {'role': 'model', 'parts': parts}}]}
+
+
+def load_script(path: str):
+    """Load a fake-model script: a JSON list of turns, or {"latency": s, "turns": [...]}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data, 0.0
+    return data['turns'], float(data.get('latency', 0.0))
+
+
+class _Models:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, *, model, contents, config=None):
+        response, latency = self._owner._respond(contents)
+        self._owner._wait(latency)
+        return response
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        """Yield the scripted response one part at a time, spreading the latency over the parts."""
+        response, latency = self._owner._respond(contents)
+        parts = response.candidates[0].content.parts or []
+        if not parts:
+            self._owner._wait(latency)
+            yield response
+            return
+        for index, part in enumerate(parts):
+            self._owner._wait(latency / len(parts))
+            yield types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+                usage_metadata=response.usage_metadata if index == len(parts) - 1 else None,
+            )
+
+
+class _AsyncModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def generate_content(self, *, model, contents, config=None):
+        response, latency = self._owner._respond(contents)
+        if latency:
+            await asyncio.sleep(latency)
+        with self._owner._lock:
+            self._owner.model_time += latency
+        return response
+
+
+class _Aio:
+    def __init__(self, owner):
+        self.models = _AsyncModels(owner)
+
+
+class FakeModelClient:
+    """A local stand-in for the genai client that plays back a script.
+
+    The script is a list of turns (see _turn_response); a turn may also set
+    "latency" in seconds, otherwise `latency` applies. The reply to a request
+    is the turn whose index equals the number of model messages already in
+    its history, so one client can serve many concurrent sessions, each
+    walking through the same script. Past the end of the script the last
+    turn is repeated. Usage metadata is estimated from the request and reply.
+    """
+
+    # Nothing to rate limit or retry; sessions use this client as is.
+    handles_retries = True
+
+    def __init__(self, script, latency: float = 0.0):
+        if not script:
+            raise ValueError('the fake model script has no turns')
+        self.turns = [(_turn_response(turn), float(turn.get('latency', latency))) for turn in script]
+        self.calls = 0
+        self.model_time = 0.0
+        self._lock = threading.Lock()
+        self.models = _Models(self)
+        self.aio = _Aio(self)
+
+    @classmethod
+    def from_file(cls, path: str):
+        script, latency = load_script(path)
+        return cls(script, latency)
+
+    def _respond(self, contents):
+        if not isinstance(contents, list):
+            contents = [types.Content(role="user", parts=[types.Part(text=str(contents))])]
+        turn = sum(1 for content in contents if getattr(content, 'role', None) == 'model')
+        data, latency = self.turns[min(turn, len(self.turns) - 1)]
+        response = response_from_dict(data)
+        if response.usage_metadata is None:
+            prompt_tokens = estimate_tokens(contents)
+            reply_tokens = len(json.dumps(data)) // CHARS_PER_TOKEN
+            response.usage_metadata = types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=reply_tokens,
+                total_token_count=prompt_tokens + reply_tokens,
+            )
+        with self._lock:
+            self.calls += 1
+        return response, latency
+
+    def _wait(self, latency: float):
+        if latency:
+            time.sleep(latency)
+        with self._lock:
+            self.model_time += latency
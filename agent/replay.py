@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import hashlib
+
+from agent.client import RateLimitedClient
+from functions.write_file import atomic_write
+
+
+REPLAY_MODES = ('passthrough', 'record', 'replay')
+
+# Where recorded responses are kept unless --replay-dir / AGENT_REPLAY_DIR say otherwise.
+DEFAULT_REPLAY_DIR = os.environ.get(
+    'AGENT_REPLAY_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'python_ai_agent', 'replay')
+)
+
+# Tool output that changes from run to run without changing its meaning; it is
+# masked before hashing so a replayed session sends the same requests it recorded.
+_VOLATILE = [
+    (re.compile(r'Resource usage: [^\n]*'), 'Resource usage: <elided>'),
+]
+
+# Response fields that describe the transport rather than the answer.
+_RESPONSE_EXCLUDE = {'sdk_http_response', 'automatic_function_calling_history', 'parsed'}
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode when no response was recorded for a request."""
+
+
+def _dump(value):
+    """Convert SDK objects into plain JSON data with volatile tool output masked."""
+    if hasattr(value, 'model_dump'):
+        value = value.model_dump(mode='json', exclude_none=True)
+    if isinstance(value, dict):
+        return {k: _dump(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_dump(v) for v in value]
+    if isinstance(value, str):
+        for pattern, replacement in _VOLATILE:
+            value = pattern.sub(replacement, value)
+    return value
+
+
+def canonical_request(model, contents, config=None) -> dict:
+    """Return the parts of a request that determine its response, as plain JSON data."""
+    if not isinstance(contents, list):
+        contents = [contents]
+    request = {'model': model, 'contents': _dump(contents)}
+    if config is not None:
+        request['system_instruction'] = _dump(getattr(config, 'system_instruction', None))
+        request['tools'] = _dump(getattr(config, 'tools', None))
+    return request
+
+
+def request_key(request: dict) -> str:
+    data = json.dumps(request, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def response_to_dict(response) -> dict:
+    return response.model_dump(mode='json', exclude_none=True, exclude=_RESPONSE_EXCLUDE)
+
+
+def response_from_dict(data: dict):
+    from google.genai import types
+
+    return types.GenerateContentResponse.model_validate(data)
+
+
+def merge_chunks(chunks):
+    """Combine streamed chunks into one response: text deltas joined, other parts kept in order."""
+    from google.genai import types
+
+    parts = []
+    usage = None
+    for chunk in chunks:
+        if getattr(chunk, 'usage_metadata', None) is not None:
+            usage = chunk.usage_metadata
+        candidates = getattr(chunk, 'candidates', None)
+        content = getattr(candidates[0], 'content', None) if candidates else None
+        for part in (content.parts or []) if content is not None else []:
+            if part.text and not part.function_call and parts and parts[-1].text and not parts[-1].function_call:
+                parts[-1] = types.Part(text=parts[-1].text + part.text)
+            else:
+                parts.append(part)
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+        usage_metadata=usage,
+    )
+
+
+class ResponseStore:
+    """Recorded model responses on disk, one JSON file per request hash.
+
+    Each file holds {"request": <canonical request>, "response": <response>},
+    where the response is a GenerateContentResponse dumped to JSON. The local
+    fake model reads responses in the same form.
+    """
+
+    def __init__(self, directory: str = DEFAULT_REPLAY_DIR):
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key: str):
+        """Return the recorded response dict for key, or None."""
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)['response']
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, request: dict, response: dict):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps({'request': request, 'response': response}, indent=1, ensure_ascii=False))
+
+
+class _Models:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, *, model, contents, config=None):
+        owner = self._owner
+        if owner.mode == 'passthrough':
+            return owner.client.models.generate_content(model=model, contents=contents, config=config)
+        request, key = owner._lookup(model, contents, config)
+        if owner.mode == 'replay':
+            return owner._replay(key)
+        response = owner.client.models.generate_content(model=model, contents=contents, config=config)
+        owner._record(key, request, response)
+        return response
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        owner = self._owner
+        if owner.mode == 'passthrough':
+            yield from owner.client.models.generate_content_stream(model=model, contents=contents, config=config)
+            return
+        request, key = owner._lookup(model, contents, config)
+        if owner.mode == 'replay':
+            # A recording is replayed as a single chunk.
+            yield owner._replay(key)
+            return
+        chunks = []
+        for chunk in owner.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append(chunk)
+            yield chunk
+        owner._record(key, request, merge_chunks(chunks))
+
+
+class _AsyncModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def generate_content(self, *, model, contents, config=None):
+        owner = self._owner
+        if owner.mode == 'passthrough':
+            return await owner.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        request, key = owner._lookup(model, contents, config)
+        if owner.mode == 'replay':
+            return owner._replay(key)
+        response = await owner.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        owner._record(key, request, response)
+        return response
+
+
+class _Aio:
+    def __init__(self, owner):
+        self.models = _AsyncModels(owner)
+
+
+class ReplayClient:
+    """Record model responses to a ResponseStore and serve them back.
+
+    Modes:
+      - passthrough: call the wrapped client, store nothing
+      - record: call the wrapped client and store every response
+      - replay: answer only from the store, never touching the network;
+        a request that was not recorded raises ReplayMissError
+
+    Requests are matched on a hash of the model, contents, system instruction
+    and tool declarations. In replay mode `client` may be None.
+    """
+
+    # Sessions use this client as is; the wrapped client is already rate limited.
+    handles_retries = True
+
+    def __init__(self, client, store: ResponseStore = None, mode: str = 'replay', verbose: bool = False):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f'unknown replay mode "{mode}"; expected one of {", ".join(REPLAY_MODES)}')
+        if client is None and mode != 'replay':
+            raise ValueError(f'a client is required in {mode} mode')
+        if client is not None and not getattr(client, 'handles_retries', False):
+            client = RateLimitedClient(client, verbose=verbose)
+        self.client = client
+        self.store = store if store is not None else ResponseStore()
+        self.mode = mode
+        self.hits = 0
+        self.recorded = 0
+        self.models = _Models(self)
+        self.aio = _Aio(self)
+
+    def _lookup(self, model, contents, config):
+        request = canonical_request(model, contents, config)
+        return request, request_key(request)
+
+    def _replay(self, key):
+        data = self.store.get(key)
+        if data is None:
+            raise ReplayMissError(
+                f'No recorded response for request {key[:12]} in {self.store.directory}; '
+                'run it once with --replay-mode record'
+            )
+        self.hits += 1
+        return response_from_dict(data)
+
+    def _record(self, key, request, response):
+        self.store.put(key, request, response_to_dict(response))
+        self.recorded += 1
+
+    def stats(self) -> dict:
+        return {'mode': self.mode, 'hits': self.hits, 'recorded': self.recorded}
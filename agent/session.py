@@ -0,0 +1,381 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from functions.schemas import get_available_functions
+from functions.call_function import call_function, call_functions, MAX_PARALLEL_CALLS, MUTATING_FUNCTIONS
+from functions.tracing import span, tracer
+from agent.context import ContextManager, DEFAULT_TOKEN_BUDGET, estimate_tokens
+from agent.client import RateLimitedClient
+from agent.usage import DEFAULT_MAX_TURNS, TokenUsage
+
+
+MODEL_NAME = 'gemini-2.0-flash-001'
+
+# System prompt to instruct the model about using tools
+SYSTEM_PROMPT = """
+You are a helpful AI coding agent.
+
+When a user asks a question or makes a request, make a function call plan. You can perform the following operations:
+
+- List files and directories
+- Read file contents
+- Search file contents for text or a regular expression
+- Execute Python files with optional arguments
+- Write or overwrite files
+- Edit several files at once, all or nothing
+
+All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
+"""
+
+
+class AgentSession:
+    """A conversation with the model that survives across tool-loop iterations.
+
+    The session owns the client, the message history and the usage counters.
+    A plain genai client is wrapped in a RateLimitedClient, so model calls
+    share the process-wide rate limiter and circuit breaker and transient
+    errors are retried up to max_attempts times. Clients that set
+    handles_retries (RateLimitedClient, ReplayClient) are used as they are.
+    Each call to step() makes one model request, appends the reply to the
+    history and executes any function calls it asked for. The session is
+    finished once the model answers without requesting a function call.
+
+    Token usage is summed over every model call (`usage`, with one entry per
+    turn in `turn_usage`). The session stops cleanly, setting stop_reason,
+    before a call that would exceed max_turns, or max_tokens given the
+    tokens used so far plus the estimated size of the next prompt.
+    """
+
+    def __init__(self, client, model: str = MODEL_NAME, system_prompt: str = SYSTEM_PROMPT,
+                 verbose: bool = False, max_attempts: int = 5, context_budget: int = DEFAULT_TOKEN_BUDGET,
+                 stream: bool = False, max_turns: int = DEFAULT_MAX_TURNS, max_tokens: int = None):
+        if not getattr(client, 'handles_retries', False):
+            client = RateLimitedClient(client, max_attempts=max_attempts, verbose=verbose)
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt
+        self.verbose = verbose
+        self.stream = stream
+        self.max_attempts = max_attempts
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+
+        # The system instruction is passed separately via GenerateContentConfig.system_instruction
+        self.messages = []
+        self.config = types.GenerateContentConfig(system_instruction=system_prompt, tools=[get_available_functions()])
+        # Compacts old tool output once the history outgrows the budget; None disables it.
+        self.context = ContextManager(context_budget) if context_budget else None
+
+        self.turns = 0
+        self.usage = TokenUsage()
+        self.turn_usage = []
+        self.last_response = None
+        self.done = False
+        # 'answered', 'max_turns' or 'max_tokens' once the session has stopped.
+        self.stop_reason = None
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Prompt tokens summed over every model call of the session."""
+        return self.usage.prompt
+
+    @property
+    def response_tokens(self) -> int:
+        """Response tokens summed over every model call of the session."""
+        return self.usage.candidates
+
+    def add_user_message(self, prompt: str):
+        """Append a user prompt to the history and reopen the session."""
+        self.messages.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+        self.done = False
+        self.stop_reason = None
+
+    def _over_budget(self) -> bool:
+        """Return True, recording why, if another model call would break max_turns or max_tokens."""
+        if self.max_turns is not None and self.turns >= self.max_turns:
+            self.stop_reason = 'max_turns'
+        elif self.max_tokens is not None and self.usage.total + estimate_tokens(self.messages) > self.max_tokens:
+            self.stop_reason = 'max_tokens'
+        else:
+            return False
+        if self.verbose:
+            print(f"Stopping: {self.stop_reason} budget reached after {self.turns} turns "
+                  f"and {self.usage.total} tokens")
+        return True
+
+    def _compact_history(self):
+        """Shrink the history to the context budget before the next model request."""
+        if self.context is None:
+            return
+        with span('compact_history', 'session') as compact_span:
+            saved = self.context.compact(self.messages)
+            compact_span.set(saved_tokens=saved)
+        if self.verbose and saved:
+            print(f"Context compacted: saved ~{saved} tokens this turn")
+
+    def _model_span(self):
+        """Open a trace span for one model call, sized by the history it sends."""
+        model_span = span('model', 'model', model=self.model, messages=len(self.messages))
+        if tracer.enabled:
+            model_span.set(estimated_prompt_tokens=estimate_tokens(self.messages))
+        return model_span
+
+    @staticmethod
+    def _trace_usage(model_span, usage):
+        if tracer.enabled:
+            usage = TokenUsage.from_metadata(usage)
+            model_span.set(prompt_tokens=usage.prompt, cached_tokens=usage.cached,
+                           response_tokens=usage.candidates, total_tokens=usage.total)
+
+    def _generate(self):
+        """Call the model; the client handles rate limits and retries transient errors."""
+        with self._model_span() as model_span:
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=self.messages,
+                config=self.config,
+            )
+            self._trace_usage(model_span, getattr(response, 'usage_metadata', None))
+        return response
+
+    def _generate_stream(self):
+        """Yield response chunks from the streaming API.
+
+        Retries happen only until the first chunk arrives; once output has been
+        shown a failure is raised rather than replayed.
+        """
+        return self.client.models.generate_content_stream(
+            model=self.model,
+            contents=self.messages,
+            config=self.config,
+        )
+
+    def _step_stream(self) -> bool:
+        """Streaming variant of step().
+
+        Text deltas are printed as they arrive. Read-only function calls start
+        executing as soon as their part is received; writes and script runs,
+        and any call after them, wait for the stream to end and then run with
+        the usual ordering guarantees of call_functions.
+        """
+        parts = []
+        usage = None
+        function_calls = []
+        early = []
+        deferred = []
+        printed = False
+
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_CALLS) as pool:
+            with self._model_span() as stream_span:
+                for chunk in self._generate_stream():
+                    if getattr(chunk, 'usage_metadata', None) is not None:
+                        usage = chunk.usage_metadata
+                    candidates = getattr(chunk, 'candidates', None)
+                    content = getattr(candidates[0], 'content', None) if candidates else None
+                    for part in (content.parts or []) if content is not None else []:
+                        if part.text and not part.function_call:
+                            print(part.text, end='', flush=True)
+                            printed = True
+                            # Merge consecutive text deltas into one part for the history.
+                            if parts and parts[-1].text and not parts[-1].function_call:
+                                parts[-1] = types.Part(text=parts[-1].text + part.text)
+                            else:
+                                parts.append(part)
+                            continue
+                        parts.append(part)
+                        if part.function_call is None:
+                            continue
+                        function_calls.append(part.function_call)
+                        if deferred or part.function_call.name in MUTATING_FUNCTIONS:
+                            deferred.append(part.function_call)
+                        else:
+                            early.append(pool.submit(call_function, part.function_call, self.verbose))
+                self._trace_usage(stream_span, usage)
+
+            if printed:
+                print()
+
+            response = types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+                usage_metadata=usage,
+            )
+            if self._record_response(response) is None:
+                return True
+
+            results = [future.result() for future in early]
+
+        results.extend(call_functions(deferred, verbose=self.verbose))
+        self._append_tool_results(results)
+        return False
+
+    def _append_model_content(self, response):
+        """Append the model's reply to the history exactly as it was returned.
+
+        The candidate's Content keeps role "model" and its function_call parts,
+        so the following function responses pair up with the calls that asked
+        for them.
+        """
+        candidates = getattr(response, 'candidates', None)
+        if not candidates:
+            return
+        content = getattr(candidates[0], 'content', None)
+        if content is not None and content.parts:
+            self.messages.append(content)
+
+    def _record_response(self, response):
+        """Record a model response and return the function calls it requests.
+
+        Marks the session done when the model answered without calling a function.
+        """
+        self.turns += 1
+        self.last_response = response
+
+        # Some client implementations return usage_metadata as an attribute or a dict.
+        usage = TokenUsage.from_metadata(getattr(response, "usage_metadata", None))
+        self.turn_usage.append(usage)
+        self.usage = self.usage + usage
+
+        self._append_model_content(response)
+
+        function_calls = getattr(response, 'function_calls', None)
+        if not function_calls:
+            # No function calls requested — the model has answered
+            self.done = True
+            self.stop_reason = 'answered'
+            return None
+
+        if self.verbose:
+            for fc in function_calls:
+                print(f"Calling function: {getattr(fc, 'name', None)}({getattr(fc, 'args', None)})")
+        return function_calls
+
+    def _append_tool_results(self, function_call_results):
+        """Append the results of call_functions to the history."""
+        with span('append_tool_results', 'session', results=len(function_call_results)):
+            self._append_tool_parts(function_call_results)
+
+    def _append_tool_parts(self, function_call_results):
+        tool_parts = []
+        for function_call_result in function_call_results:
+            # Ensure we got a types.Content back
+            if not (hasattr(function_call_result, 'parts') and function_call_result.parts):
+                raise RuntimeError('Invalid function result returned by call_function')
+
+            part = function_call_result.parts[0]
+            if getattr(part, 'function_response', None) is None:
+                raise RuntimeError('Invalid function result: missing function_response')
+            if getattr(part.function_response, 'response', None) is None:
+                raise RuntimeError('Invalid function result: missing response payload')
+
+            tool_parts.append(part)
+
+        # Append exactly one function response per call, in request order, as
+        # a single tool message so the model can continue.
+        self.messages.append(types.Content(role="tool", parts=tool_parts))
+
+    def step(self) -> bool:
+        """Make one model request and run the function calls it asks for.
+
+        Returns True when the session should stop: the model produced a final
+        answer (done) or a budget ran out (stop_reason).
+        """
+        if self.done or self._over_budget():
+            return True
+
+        with span('turn', 'session', turn=self.turns + 1):
+            self._compact_history()
+            if self.stream:
+                return self._step_stream()
+
+            function_calls = self._record_response(self._generate())
+            if function_calls is None:
+                return True
+
+            # Execute the calls concurrently using our helper
+            self._append_tool_results(call_functions(function_calls, verbose=self.verbose))
+            return False
+
+    @property
+    def text(self) -> str:
+        """Text of the most recent model response."""
+        response = self.last_response
+        if response is None:
+            return ""
+        text = getattr(response, 'text', None)
+        if text is None:
+            candidates = getattr(response, 'candidates', None)
+            content = getattr(candidates[0], 'content', None) if candidates else None
+            if content is not None and content.parts:
+                text = "".join(p.text for p in content.parts if getattr(p, 'text', None))
+        return text or ""
+
+    def run(self, prompt: str = None, max_turns: int = None) -> str:
+        """Send an optional prompt and step until the model answers or a budget runs out.
+
+        max_turns, when given, replaces the session's turn budget.
+        """
+        if max_turns is not None:
+            self.max_turns = max_turns
+        if prompt is not None:
+            self.add_user_message(prompt)
+        while not self.step():
+            pass
+        return self.text
+
+
+class AsyncAgentSession(AgentSession):
+    """An AgentSession driven by the client's asyncio API.
+
+    Model calls go through client.aio and back off with asyncio.sleep, and
+    tools run in an executor, so many sessions can share one event loop.
+    """
+
+    def __init__(self, client, executor=None, **kwargs):
+        super().__init__(client, **kwargs)
+        self.executor = executor
+
+    async def _generate(self):
+        """Call the model without blocking the event loop while waiting or backing off."""
+        with self._model_span() as model_span:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=self.messages,
+                config=self.config,
+            )
+            self._trace_usage(model_span, getattr(response, 'usage_metadata', None))
+        return response
+
+    async def step(self) -> bool:
+        """Make one model request and run the function calls it asks for.
+
+        Returns True when the session should stop: the model produced a final
+        answer (done) or a budget ran out (stop_reason).
+        """
+        if self.done or self._over_budget():
+            return True
+
+        with span('turn', 'session', turn=self.turns + 1):
+            self._compact_history()
+            function_calls = self._record_response(await self._generate())
+            if function_calls is None:
+                return True
+
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self.executor, call_functions, function_calls, self.verbose)
+            self._append_tool_results(results)
+            return False
+
+    async def run(self, prompt: str = None, max_turns: int = None) -> str:
+        """Send an optional prompt and step until the model answers or a budget runs out.
+
+        max_turns, when given, replaces the session's turn budget.
+        """
+        if max_turns is not None:
+            self.max_turns = max_turns
+        if prompt is not None:
+            self.add_user_message(prompt)
+        while not await self.step():
+            pass
+        return self.text
@@ -0,0 +1,1241 @@
+# test_agent.py
+# Run from the repository root: python -m unittest agent.test_agent
+
+import io
+import os
+import re
+import json
+import time
+import signal
+import asyncio
+import subprocess
+import tempfile
+import contextlib
+import threading
+import unittest
+import urllib.request
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from google.genai import types
+
+from agent.client import (
+    CircuitBreaker, CircuitOpenError, RateLimitedClient, RateLimiter, classify_error,
+)
+from agent.batch import run_batch
+from agent.context import ContextManager, estimate_tokens
+from agent.fake_model import FakeModelClient
+from agent.session import AgentSession
+from agent.usage import TokenUsage, format_usage_table
+from functions import call_function as dispatch
+from functions.call_function import ToolResultCache, call_function, call_functions, tool_cache
+from functions.registry import Tool, ToolArgumentError, registry
+from functions.interpreter_pool import InterpreterPool
+from functions.process_utils import BoundedCapture, apply_limits, read_bounded_file
+from functions.run_python_file import _run_subprocess, run_python_file
+from functions.schemas import get_available_functions
+from functions.tracing import Tracer, tracer
+from functions.workspace import OutsideWorkspaceError, Workspace, get_workspace
+from functions.get_file_content import get_file_content
+from functions.get_files_info import get_files_info
+from functions.search_files import _regex_literals, notify_write, search_files
+from functions.write_file import apply_edit, stage_file, write_file
+from functions.write_files import write_files
+from agent.replay import ReplayClient, ReplayMissError, ResponseStore, canonical_request, request_key
+
+
+class FakeModelServer:
+    """A local HTTP server that answers each POST with the next scripted (status, headers) pair."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server.requests += 1
+                status, headers = server.script.pop(0) if server.script else (200, {})
+                body = json.dumps({"text": "ok"} if status == 200 else {"error": {"code": status}}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/generate'
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class HTTPModelClient:
+    """Just enough of the genai client surface to call the fake server over HTTP."""
+
+    def __init__(self, url):
+        self.url = url
+        self.models = SimpleNamespace(generate_content=self._generate)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_async))
+
+    def _generate(self, model, contents, config=None):
+        data = json.dumps({"model": model, "contents": contents}).encode()
+        with urllib.request.urlopen(urllib.request.Request(self.url, data=data), timeout=5) as response:
+            return SimpleNamespace(text=json.loads(response.read())["text"], usage_metadata=None)
+
+    async def _generate_async(self, model, contents, config=None):
+        return await asyncio.get_running_loop().run_in_executor(None, self._generate, model, contents, config)
+
+
+class TestRateLimitedClient(unittest.TestCase):
+    def make_client(self, script, **kwargs):
+        self.server = FakeModelServer(script)
+        self.addCleanup(self.server.close)
+        self.sleeps = []
+        kwargs.setdefault('limiter', RateLimiter(0, 0))
+        kwargs.setdefault('breaker', CircuitBreaker())
+        kwargs.setdefault('base_delay', 0.01)
+        kwargs.setdefault('max_delay', 0.05)
+        return RateLimitedClient(HTTPModelClient(self.server.url), sleep=self.sleeps.append, **kwargs)
+
+    def generate(self, client):
+        return client.models.generate_content(model='fake', contents='hello')
+
+    def test_retries_transient_errors(self):
+        client = self.make_client([(503, {}), (503, {}), (200, {})])
+        self.assertEqual(self.generate(client).text, 'ok')
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(all(0.01 <= s <= 0.05 for s in self.sleeps))
+
+    def test_respects_retry_after_and_pauses_everyone(self):
+        limiter = RateLimiter(0, 0)
+        client = self.make_client([(429, {'Retry-After': '2'}), (200, {})], limiter=limiter)
+        self.assertEqual(self.generate(client).text, 'ok')
+        self.assertGreaterEqual(self.sleeps[0], 2)
+        self.assertEqual(limiter.throttled, 1)
+        # Another session sharing the limiter waits out the rest of the pause.
+        self.assertGreater(limiter.reserve(), 1)
+
+    def test_does_not_retry_auth_errors(self):
+        client = self.make_client([(401, {}), (200, {})])
+        with self.assertRaises(Exception) as cm:
+            self.generate(client)
+        self.assertEqual(classify_error(cm.exception).status, 401)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_gives_up_after_max_attempts(self):
+        client = self.make_client([(500, {})] * 5, max_attempts=3)
+        with self.assertRaises(Exception):
+            self.generate(client)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_circuit_opens_and_fails_fast(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+        client = self.make_client([(503, {})] * 10, breaker=breaker)
+        with self.assertRaises(CircuitOpenError):
+            self.generate(client)
+        self.assertEqual(self.server.requests, 2)
+        with self.assertRaises(CircuitOpenError):
+            self.generate(client)
+        self.assertEqual(self.server.requests, 2)
+
+        # After the reset timeout one trial call goes through and closes the circuit.
+        now[0] = 31.0
+        self.server.script = [(200, {})]
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertEqual(self.generate(client).text, 'ok')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_cancelled_trial_call_reopens_the_circuit(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        started = []
+
+        async def hang(**kwargs):
+            started.append(kwargs)
+            await asyncio.Event().wait()
+
+        async def cancel_probe(client):
+            task = asyncio.ensure_future(client.aio.models.generate_content(model='fake', contents='hello'))
+            while not started:
+                await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        hanging = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=hang)))
+        client = RateLimitedClient(hanging, limiter=RateLimiter(0, 0), breaker=breaker)
+        now[0] = 31.0
+        asyncio.run(cancel_probe(client))
+        self.assertFalse(breaker.probing)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker.failures, 1)
+
+        # Once the timeout has passed again another trial goes through, here interrupted from the keyboard.
+        now[0] = 62.0
+        interrupted = SimpleNamespace(models=SimpleNamespace(generate_content=mock.Mock(side_effect=KeyboardInterrupt)))
+        client = RateLimitedClient(interrupted, limiter=RateLimiter(0, 0), breaker=breaker)
+        with self.assertRaises(KeyboardInterrupt):
+            self.generate(client)
+        self.assertEqual(breaker.state, 'open')
+        now[0] = 93.0
+        self.server = FakeModelServer([(200, {})])
+        self.addCleanup(self.server.close)
+        client = RateLimitedClient(HTTPModelClient(self.server.url), limiter=RateLimiter(0, 0), breaker=breaker)
+        self.assertEqual(self.generate(client).text, 'ok')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_async_retries(self):
+        client = self.make_client([(502, {}), (200, {})])
+        response = asyncio.run(client.aio.models.generate_content(model='fake', contents='hello'))
+        self.assertEqual(response.text, 'ok')
+        self.assertEqual(self.server.requests, 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_per_minute(self):
+        now = [0.0]
+        limiter = RateLimiter(requests_per_minute=60, clock=lambda: now[0])
+        self.assertEqual([limiter.reserve() for _ in range(60)], [0.0] * 60)
+        self.assertAlmostEqual(limiter.reserve(), 1.0)
+        self.assertAlmostEqual(limiter.reserve(), 2.0)
+        now[0] = 2.0
+        self.assertAlmostEqual(limiter.reserve(), 1.0)
+
+    def test_tokens_per_minute_settles_actual_usage(self):
+        now = [0.0]
+        limiter = RateLimiter(tokens_per_minute=600, clock=lambda: now[0])
+        self.assertEqual(limiter.reserve(500), 0.0)
+        self.assertAlmostEqual(limiter.reserve(200), 10.0)
+        # The first call used far fewer tokens than estimated.
+        limiter.settle(500, 100)
+        self.assertEqual(limiter.reserve(200), 0.0)
+
+    def test_throttle_slows_refill(self):
+        now = [0.0]
+        limiter = RateLimiter(requests_per_minute=60, clock=lambda: now[0])
+        for _ in range(60):
+            limiter.reserve()
+        limiter.throttle(0)
+        self.assertAlmostEqual(limiter.reserve(), 2.0)
+
+
+def model_response(text):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+    )
+
+
+def tool_result(result):
+    return types.Content(role="tool", parts=[types.Part.from_function_response(name="run_python_file", response={"result": result})])
+
+
+class TestReplayClient(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ResponseStore(tmp.name)
+        self.calls = 0
+
+        def generate(model, contents, config=None):
+            self.calls += 1
+            return model_response(f"answer {self.calls}")
+
+        self.live = SimpleNamespace(models=SimpleNamespace(generate_content=generate))
+
+    def generate(self, client, prompt):
+        return client.models.generate_content(model='fake', contents=[types.Content(role="user", parts=[types.Part(text=prompt)])])
+
+    def test_record_then_replay_offline(self):
+        recorder = ReplayClient(self.live, self.store, mode='record')
+        self.assertEqual(self.generate(recorder, 'a').text, 'answer 1')
+        self.assertEqual(self.generate(recorder, 'b').text, 'answer 2')
+
+        replayer = ReplayClient(None, self.store, mode='replay')
+        self.assertEqual(self.generate(replayer, 'b').text, 'answer 2')
+        self.assertEqual(self.generate(replayer, 'a').text, 'answer 1')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(replayer.stats()['hits'], 2)
+
+    def test_replay_miss(self):
+        with self.assertRaises(ReplayMissError):
+            self.generate(ReplayClient(None, self.store, mode='replay'), 'never recorded')
+
+    def test_passthrough_stores_nothing(self):
+        client = ReplayClient(self.live, self.store, mode='passthrough')
+        self.generate(client, 'a')
+        self.generate(client, 'a')
+        self.assertEqual(self.calls, 2)
+        with self.assertRaises(ReplayMissError):
+            self.generate(ReplayClient(None, self.store, mode='replay'), 'a')
+
+    def test_volatile_tool_output_does_not_change_the_key(self):
+        first = canonical_request('fake', [tool_result("STDOUT:\n8\nResource usage: wall time 0.05s")])
+        second = canonical_request('fake', [tool_result("STDOUT:\n8\nResource usage: wall time 0.31s")])
+        third = canonical_request('fake', [tool_result("STDOUT:\n9\nResource usage: wall time 0.05s")])
+        self.assertEqual(request_key(first), request_key(second))
+        self.assertNotEqual(request_key(first), request_key(third))
+
+
+class TestFakeModelClient(unittest.TestCase):
+    script = [
+        {"function_calls": [{"name": "get_files_info", "args": {"directory": "."}}], "latency": 0.01},
+        {"text": "done"},
+    ]
+
+    def test_turn_follows_the_history(self):
+        client = FakeModelClient(self.script)
+        user = types.Content(role="user", parts=[types.Part(text="hi")])
+        first = client.models.generate_content(model='fake', contents=[user])
+        self.assertEqual(first.function_calls[0].name, 'get_files_info')
+        second = client.models.generate_content(model='fake', contents=[user, first.candidates[0].content])
+        self.assertEqual(second.text, 'done')
+        self.assertIsNotNone(second.usage_metadata.prompt_token_count)
+        self.assertAlmostEqual(client.model_time, 0.01)
+
+    def test_responses_can_be_replayed_from_a_recording(self):
+        recorded = {"request": {}, "response": model_response("recorded").model_dump(mode='json', exclude_none=True)}
+        client = FakeModelClient([recorded])
+        self.assertEqual(client.models.generate_content(model='fake', contents='hi').text, 'recorded')
+
+
+def usage_turn(text, prompt, cached, response, function_call=False):
+    """A scripted turn with fixed usage metadata."""
+    response_dict = model_response(text).model_dump(mode='json', exclude_none=True)
+    if function_call:
+        response_dict['candidates'][0]['content']['parts'] = [
+            {'function_call': {'name': 'get_files_info', 'args': {'directory': '.'}}}
+        ]
+    response_dict['usage_metadata'] = {
+        'prompt_token_count': prompt, 'cached_content_token_count': cached,
+        'candidates_token_count': response, 'total_token_count': prompt + response,
+    }
+    return response_dict
+
+
+class TestTokenUsage(unittest.TestCase):
+    script = [usage_turn('', 100, 0, 10, function_call=True), usage_turn('', 150, 80, 12, function_call=True),
+              usage_turn('done', 200, 120, 5)]
+
+    def setUp(self):
+        tool_cache.clear()
+
+    def test_usage_is_summed_over_the_session(self):
+        session = AgentSession(FakeModelClient(self.script))
+        self.assertEqual(session.run('hi'), 'done')
+        self.assertEqual(session.stop_reason, 'answered')
+        self.assertEqual([u.prompt for u in session.turn_usage], [100, 150, 200])
+        self.assertEqual((session.usage.calls, session.usage.prompt, session.usage.cached,
+                          session.usage.candidates, session.usage.total), (3, 450, 200, 27, 477))
+        self.assertEqual(session.prompt_tokens, 450)
+        self.assertIn('477', format_usage_table(session.turn_usage).splitlines()[-1])
+
+    def test_missing_usage_counts_as_zero(self):
+        usage = TokenUsage.from_metadata(None) + TokenUsage.from_metadata({'prompt_token_count': 7})
+        self.assertEqual((usage.calls, usage.prompt, usage.total), (2, 7, 7))
+
+    def test_max_turns_stops_cleanly(self):
+        session = AgentSession(FakeModelClient(self.script), max_turns=2)
+        session.run('hi')
+        self.assertFalse(session.done)
+        self.assertEqual((session.stop_reason, session.turns, session.usage.calls), ('max_turns', 2, 2))
+
+    def test_max_tokens_stops_before_the_call_that_would_exceed_it(self):
+        session = AgentSession(FakeModelClient(self.script), max_tokens=300)
+        session.run('hi')
+        self.assertFalse(session.done)
+        self.assertEqual(session.stop_reason, 'max_tokens')
+        self.assertEqual(session.turns, 2)
+        self.assertLessEqual(session.usage.total, 300)
+
+
+class TestStreaming(unittest.TestCase):
+    script = [usage_turn('', 100, 0, 10, function_call=True), usage_turn('done', 150, 0, 5)]
+
+    def setUp(self):
+        tool_cache.clear()
+
+    def test_read_only_calls_start_mid_stream_and_usage_comes_from_the_last_chunk(self):
+        fake = FakeModelClient(self.script)
+        dispatched = threading.Event()
+        seen_before_last_chunk = []
+
+        def generate_content_stream(**kwargs):
+            chunks = list(fake.models.generate_content_stream(**kwargs))
+            if not chunks[-1].function_calls:
+                yield from chunks
+                return
+            # Hold the final chunk, which carries the usage, until the call has been dispatched.
+            usage = chunks[-1].usage_metadata
+            chunks[-1].usage_metadata = None
+            yield from chunks
+            seen_before_last_chunk.append(dispatched.wait(5))
+            yield types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text='still streaming')]))],
+                usage_metadata=usage,
+            )
+
+        real_call_function = dispatch.call_function
+
+        def recording_call_function(function_call, verbose=False):
+            dispatched.set()
+            return real_call_function(function_call, verbose)
+
+        client = SimpleNamespace(handles_retries=True, models=SimpleNamespace(generate_content_stream=generate_content_stream))
+        session = AgentSession(client, stream=True)
+        out = io.StringIO()
+        with mock.patch('agent.session.call_function', side_effect=recording_call_function), \
+                contextlib.redirect_stdout(out):
+            self.assertEqual(session.run('hi'), 'done')
+        self.assertEqual(seen_before_last_chunk, [True])
+        self.assertTrue(out.getvalue().endswith('still streaming\ndone\n'))
+        # Usage arrives with the final chunk of each turn only.
+        self.assertEqual([(u.prompt, u.candidates) for u in session.turn_usage], [(100, 10), (150, 5)])
+        self.assertEqual(session.usage.total, 265)
+        # The history keeps the streamed call and its result in order.
+        self.assertEqual([m.role for m in session.messages], ['user', 'model', 'tool', 'model'])
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        fake = FakeModelClient([{"text": "answer"}])
+
+        async def generate_content(*, model, contents, config=None):
+            prompt = contents[0].parts[0].text
+            if prompt == 'boom':
+                raise RuntimeError('model exploded')
+            if prompt.startswith('slow'):
+                await asyncio.sleep(0.05)
+            return await fake.aio.models.generate_content(model=model, contents=contents, config=config)
+
+        self.client = SimpleNamespace(handles_retries=True,
+                                      aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+
+    def run_batch(self, text, **kwargs):
+        out = io.StringIO()
+        count = asyncio.run(run_batch(self.client, io.StringIO(text), out, **kwargs))
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(count, len(records))
+        return records
+
+    def test_one_record_per_line_in_input_order(self):
+        records = self.run_batch('"slow first"\n{"id": "b", "prompt": "fast"}\n\nnot json\n"boom"\n'
+                                 '{"prompt": 3}\n"fast again"\n', concurrency=4)
+        self.assertEqual([r['id'] for r in records], [1, 'b', 4, 5, 6, 7])
+        self.assertEqual([r.get('text') for r in records], ['answer', 'answer', None, None, None, 'answer'])
+        self.assertEqual(records[0]['prompt'], 'slow first')
+        self.assertTrue(records[2]['error'].startswith('invalid input line: '))
+        self.assertEqual(records[3]['error'], 'model exploded')
+        self.assertEqual(records[4]['error'],
+                         'invalid input line: expected a JSON string or an object with a "prompt" field')
+        self.assertEqual((records[1]['stop_reason'], records[1]['turns']), ('answered', 1))
+
+    def test_a_slow_prompt_holds_back_a_bounded_number_of_records(self):
+        lines = ['"slow"\n'] + [f'"fast {i}"\n' for i in range(20)]
+        records = self.run_batch(''.join(lines), concurrency=1)
+        self.assertEqual([r['id'] for r in records], list(range(1, 22)))
+        self.assertTrue(all(r['text'] == 'answer' for r in records))
+
+
+class TestContextManager(unittest.TestCase):
+    def history(self, *calls):
+        """Build a history of one prompt followed by one model turn and tool result per (name, args, output)."""
+        messages = [types.Content(role='user', parts=[types.Part(text='start')])]
+        for name, args, output in calls:
+            messages.append(types.Content(role='model', parts=[types.Part.from_function_call(name=name, args=args)]))
+            messages.append(types.Content(role='tool', parts=[
+                types.Part.from_function_response(name=name, response={'result': output})]))
+        return messages
+
+    @staticmethod
+    def outputs(messages):
+        return [m.parts[0].function_response.response['result'] for m in messages if m.role == 'tool']
+
+    def test_under_budget_leaves_history_alone(self):
+        messages = self.history(('get_file_content', {'file_path': 'a.py'}, 'x' * 1000))
+        manager = ContextManager(token_budget=10000)
+        self.assertEqual(manager.compact(messages), 0)
+        self.assertEqual(self.outputs(messages), ['x' * 1000])
+        self.assertEqual(manager.saved_per_turn, [0])
+
+    def test_chunks_of_one_file_are_not_superseded_by_each_other(self):
+        chunks = [('get_file_content', {'file_path': 'big.py', 'start_line': start, 'end_line': start + 99},
+                   f'chunk {start} ' + 'x' * 1000) for start in (1, 101, 201)]
+        offsets = [('get_file_content', {'file_path': 'big.py', 'offset': offset, 'length': 1000},
+                    f'bytes {offset} ' + 'y' * 1000) for offset in (0, 1000)]
+        messages = self.history(*chunks, *offsets, ('get_files_info', {}, 'z'), ('get_files_info', {}, 'z'))
+        # One token over budget: only the oldest output has to go, and no chunk supersedes another.
+        ContextManager(token_budget=estimate_tokens(messages) - 1).compact(messages)
+        outputs = self.outputs(messages)
+        self.assertIn('removed to save context', outputs[0])
+        self.assertEqual(outputs[1:5], [call[2] for call in chunks[1:] + offsets])
+
+    def test_rereading_the_same_range_supersedes_the_earlier_read(self):
+        messages = self.history(
+            ('get_file_content', {'file_path': 'a.py'}, 'old ' + 'x' * 1000),
+            ('get_file_content', {'file_path': 'a.py', 'start_line': 1, 'end_line': 50}, 'lines ' + 'x' * 1000),
+            ('get_file_content', {'file_path': 'a.py'}, 'new ' + 'x' * 1000),
+            ('get_files_info', {}, 'z'),
+            ('get_files_info', {}, 'z'),
+        )
+        saved = ContextManager(token_budget=estimate_tokens(messages) - 1).compact(messages)
+        self.assertGreater(saved, 0)
+        outputs = self.outputs(messages)
+        self.assertEqual(outputs[0], '[superseded by a later read of "a.py"]')
+        self.assertTrue(outputs[1].startswith('lines '))
+        self.assertTrue(outputs[2].startswith('new '))
+
+    def test_oldest_output_is_stubbed_until_the_history_fits(self):
+        messages = self.history(*[('get_files_info', {'directory': f'd{n}'}, f'{n}' * 2000) for n in range(5)])
+        manager = ContextManager(token_budget=estimate_tokens(messages) - 600, keep_recent_turns=2)
+        manager.compact(messages)
+        outputs = self.outputs(messages)
+        self.assertIn('removed to save context', outputs[0])
+        self.assertIn('"d0"', outputs[0])
+        self.assertIn('removed to save context', outputs[1])
+        self.assertEqual(outputs[2:], ['2' * 2000, '3' * 2000, '4' * 2000])
+        self.assertEqual(messages[0].parts[0].text, 'start')
+        self.assertLessEqual(estimate_tokens(messages), manager.token_budget)
+        # The two most recent turns stay whole even when the budget cannot be met.
+        ContextManager(token_budget=0).compact(messages)
+        self.assertEqual(self.outputs(messages)[3:], ['3' * 2000, '4' * 2000])
+
+
+class TestCallFunctions(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+        # Calls named "wait" meet at this barrier, so it breaks unless they run at the same time.
+        self.barrier = threading.Barrier(2, timeout=5)
+        patcher = mock.patch.object(dispatch, 'call_function', self.fake_call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_call(self, call, verbose=False):
+        with self.lock:
+            self.events.append(('start', call.id))
+        if call.name == 'wait':
+            self.barrier.wait()
+        time.sleep(call.args.get('sleep', 0))
+        with self.lock:
+            self.events.append(('end', call.id))
+        return call.id
+
+    @staticmethod
+    def calls(*specs):
+        return [SimpleNamespace(id=i, name=name, args=args) for i, (name, args) in enumerate(specs)]
+
+    def assert_sequential(self, ids):
+        """Assert the calls with these ids ran one after another, in this order."""
+        events = [event for event in self.events if event[1] in ids]
+        self.assertEqual(events, [(edge, i) for i in ids for edge in ('start', 'end')])
+
+    def test_results_keep_request_order(self):
+        calls = self.calls(('get_file_content', {'file_path': 'a', 'sleep': 0.05}),
+                           ('get_file_content', {'file_path': 'b'}), ('get_files_info', {}))
+        self.assertEqual(call_functions(calls), [0, 1, 2])
+
+    def test_independent_calls_run_concurrently(self):
+        calls = self.calls(('wait', {'file_path': 'a'}), ('wait', {'file_path': 'b'}))
+        self.assertEqual(call_functions(calls), [0, 1])
+
+    def test_calls_on_a_written_path_keep_their_order(self):
+        calls = self.calls(
+            ('get_file_content', {'file_path': 'a.py', 'sleep': 0.05}),
+            ('write_file', {'file_path': './a.py', 'content': 'x', 'sleep': 0.02}),
+            ('get_file_content', {'file_path': 'other.py', 'sleep': 0.05}),
+            ('get_file_content', {'file_path': 'a.py'}),
+            ('run_python_file', {'file_path': 'a.py'}),
+        )
+        self.assertEqual(call_functions(calls), [0, 1, 2, 3, 4])
+        self.assert_sequential([0, 1, 3, 4])
+        # The unrelated read did not wait for the chain.
+        self.assertLess(self.events.index(('start', 2)), self.events.index(('end', 0)))
+
+    def test_write_files_runs_the_whole_turn_in_order(self):
+        calls = self.calls(
+            ('get_file_content', {'file_path': 'a', 'sleep': 0.02}),
+            ('write_files', {'operations': [{'file_path': 'b', 'content': 'x'}]}),
+            ('get_file_content', {'file_path': 'c', 'sleep': 0.01}),
+            ('get_files_info', {}),
+        )
+        self.assertEqual(call_functions(calls), [0, 1, 2, 3])
+        self.assert_sequential([0, 1, 2, 3])
+
+    def test_single_worker_runs_in_order(self):
+        calls = self.calls(*[('get_file_content', {'file_path': name, 'sleep': 0.01}) for name in 'abc'])
+        self.assertEqual(call_functions(calls, max_workers=1), [0, 1, 2])
+        self.assert_sequential([0, 1, 2])
+
+
+class TestToolResultCache(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        os.mkdir(os.path.join(self.root, 'sub'))
+        with open(os.path.join(self.root, 'sub', 'a.txt'), 'w') as f:
+            f.write('one\n')
+        patcher = mock.patch.object(dispatch, 'WORKING_DIRECTORY', self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tool_cache.clear()
+        self.addCleanup(tool_cache.clear)
+
+    def call(self, name, **args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = call_function(SimpleNamespace(name=name, args=args)).parts[0].function_response.response
+        return response.get('result', response.get('error'))
+
+    def listing(self):
+        return self.call('get_files_info', directory='.', recursive=True)
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        self.assertEqual(self.call('get_file_content', file_path='sub/a.txt'), 'one\n')
+        with mock.patch.object(dispatch.TOOLS['get_file_content'], 'func', side_effect=AssertionError('not cached')):
+            self.assertEqual(self.call('get_file_content', file_path='sub/a.txt'), 'one\n')
+        self.assertEqual((tool_cache.hits, tool_cache.misses), (1, 1))
+        # Different arguments are a different entry.
+        self.assertEqual(self.call('get_file_content', file_path='sub/a.txt', start_line=1), 'one\n')
+        self.assertEqual(tool_cache.misses, 2)
+
+    def test_a_file_changed_outside_the_tools_misses(self):
+        self.call('get_file_content', file_path='sub/a.txt')
+        with open(os.path.join(self.root, 'sub', 'a.txt'), 'w') as f:
+            f.write('changed\n')
+        self.assertEqual(self.call('get_file_content', file_path='sub/a.txt'), 'changed\n')
+
+    def test_write_invalidates_the_file(self):
+        self.call('get_file_content', file_path='sub/a.txt')
+        self.assertTrue(self.call('write_file', file_path='sub/a.txt', content='two\n').startswith('Success'))
+        self.assertEqual(self.call('get_file_content', file_path='sub/a.txt'), 'two\n')
+        self.assertEqual(tool_cache.hits, 0)
+
+    def test_listings_are_not_cached(self):
+        self.assertIn('a.txt: file_size=4 bytes', self.listing())
+        # Neither the listed directory nor sub changes its stat when a file in sub grows.
+        with open(os.path.join(self.root, 'sub', 'a.txt'), 'a') as f:
+            f.write('two\n')
+        self.assertIn('a.txt: file_size=8 bytes', self.listing())
+        with open(os.path.join(self.root, 'sub', 'b.txt'), 'w') as f:
+            f.write('new\n')
+        self.assertIn('b.txt: file_size=4 bytes', self.listing())
+        self.assertEqual((tool_cache.hits, tool_cache.misses), (0, 0))
+
+    def test_script_run_invalidates_everything(self):
+        with open(os.path.join(self.root, 'grow.py'), 'w') as f:
+            f.write('with open("sub/a.txt", "a") as f:\n    f.write("two\\n")\n')
+        self.assertIn('a.txt: file_size=4 bytes', self.listing())
+        self.call('run_python_file', file_path='grow.py')
+        self.assertIn('a.txt: file_size=8 bytes', self.listing())
+
+    def test_failed_write_keeps_the_cache(self):
+        self.call('get_file_content', file_path='sub/a.txt')
+        self.assertTrue(self.call('write_file', file_path='sub/a.txt', mode='replace',
+                                  edits=[{'search': 'missing', 'replace': 'x'}]).startswith('Error:'))
+        self.call('get_file_content', file_path='sub/a.txt')
+        self.assertEqual(tool_cache.hits, 1)
+
+    def test_entries_are_evicted_by_size(self):
+        cache = ToolResultCache(max_bytes=10)
+        cache.put('a', 'x' * 6)
+        cache.put('b', 'y' * 4)
+        self.assertEqual(cache.get('a'), (True, 'x' * 6))
+        cache.put('c', 'z' * 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 'x' * 6))
+        cache.put('big', 'w' * 11)
+        self.assertEqual(cache.get('big'), (False, None))
+
+
+class TestToolRegistry(unittest.TestCase):
+    def test_declarations_follow_the_signatures(self):
+        declarations = {d.name: d for d in get_available_functions().function_declarations}
+        self.assertEqual(set(declarations), set(registry.tools))
+        run = declarations['run_python_file'].parameters
+        self.assertEqual(run.required, ['file_path'])
+        # Keyword-only limits are never offered to the model.
+        self.assertNotIn('timeout', run.properties)
+        operation = declarations['write_files'].parameters.properties['operations'].items
+        self.assertEqual(operation.required, ['file_path'])
+        self.assertEqual(operation.properties['mode'].enum, ['overwrite', 'patch', 'replace', 'lines'])
+        self.assertIs(get_available_functions(), get_available_functions())
+
+    def test_arguments_are_coerced(self):
+        kwargs = registry.get('get_files_info').bind(
+            {'directory': 'pkg', 'max_depth': 2.0, 'recursive': 'true', 'include': '*.py', 'limit': None,
+             'working_directory': '/'})
+        self.assertEqual(kwargs, {'directory': 'pkg', 'max_depth': 2, 'recursive': True, 'include': ['*.py']})
+        self.assertEqual(registry.get('run_python_file').bind('{"file_path": "main.py", "args": [3, "+", 5]}'),
+                         {'file_path': 'main.py', 'args': ['3', '+', '5']})
+
+    def test_invalid_arguments_are_rejected(self):
+        cases = [
+            ('get_file_content', {}, 'missing required argument "file_path"'),
+            ('get_file_content', {'file_path': 'a', 'timeout': 1}, 'unknown argument "timeout"'),
+            ('get_file_content', {'file_path': 'a', 'offset': 1.5}, 'offset must be an integer'),
+            ('write_files', {'operations': [{'file_path': 'a', 'edits': [{'search': 'x'}]}]},
+             'operations[0].edits[0] is missing "replace"'),
+            ('write_file', {'file_path': 'a', 'mode': 'append'}, 'mode must be one of'),
+        ]
+        for name, args, message in cases:
+            with self.assertRaises(ToolArgumentError) as raised:
+                registry.get(name).bind(args)
+            self.assertIn(message, str(raised.exception))
+
+    def test_call_function_reports_invalid_arguments(self):
+        call = SimpleNamespace(name='get_file_content', args={'file_path': 'main.py', 'offset': 'start'})
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = call_function(call).parts[0].function_response.response
+        self.assertEqual(response, {'error': 'Invalid arguments for get_file_content: offset must be an integer'})
+
+    def test_tools_need_type_hints(self):
+        def untyped(working_directory, path):
+            return path
+        with self.assertRaises(TypeError):
+            Tool(untyped, 'Has no hints.')
+
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.outside = os.path.join(tmp.name, 'outside')
+        self.root = os.path.join(tmp.name, 'root')
+        os.makedirs(os.path.join(self.root, 'pkg'))
+        os.mkdir(self.outside)
+        for path in ('pkg/a.py', '../outside/secret.txt'):
+            with open(os.path.join(self.root, path), 'w') as f:
+                f.write('text\n')
+        os.symlink('pkg', os.path.join(self.root, 'alias'))
+        os.symlink(os.path.join(self.root, 'pkg', 'a.py'), os.path.join(self.root, 'absolute.py'))
+        os.symlink('../outside', os.path.join(self.root, 'escape'))
+        os.symlink(self.outside, os.path.join(self.root, 'escape_absolute'))
+        self.workspace = Workspace(self.root)
+        self.addCleanup(self.workspace.close)
+
+    def test_resolve_follows_symlinks_that_stay_inside(self):
+        resolve = self.workspace.resolve
+        self.assertEqual(resolve('.'), '')
+        self.assertEqual(resolve('alias/a.py'), 'pkg/a.py')
+        self.assertEqual(resolve('absolute.py'), 'pkg/a.py')
+        self.assertEqual(resolve(os.path.join(self.root, 'pkg')), 'pkg')
+        self.assertEqual(resolve('new/dir/../file.txt'), 'new/file.txt')
+        self.assertEqual(resolve('pkg/../alias/./a.py'), 'pkg/a.py')
+        for path in ('..', 'pkg/../../outside', 'escape/secret.txt', 'escape_absolute', self.outside,
+                     'new/../../outside'):
+            with self.assertRaises(OutsideWorkspaceError, msg=path):
+                resolve(path)
+
+    def test_resolutions_are_cached_until_invalidated(self):
+        self.workspace.resolve('alias/a.py')
+        self.workspace.resolve('alias/a.py')
+        self.assertEqual((self.workspace.hits, self.workspace.misses), (1, 1))
+        self.workspace.invalidate('pkg')
+        self.workspace.resolve('alias/a.py')
+        self.assertEqual(self.workspace.misses, 2)
+
+    def test_open_refuses_a_symlink_swapped_in_after_the_check(self):
+        # Both paths are checked, and cached, while pkg is still a real directory.
+        self.assertEqual(self.workspace.resolve('pkg/a.py'), 'pkg/a.py')
+        self.assertEqual(self.workspace.resolve('pkg'), 'pkg')
+        os.rename(os.path.join(self.root, 'pkg'), os.path.join(self.root, 'moved'))
+        os.symlink(self.outside, os.path.join(self.root, 'pkg'))
+        with open(os.path.join(self.outside, 'a.py'), 'w') as f:
+            f.write('outside\n')
+        with self.assertRaises(OSError):
+            self.workspace.open('pkg/a.py')
+        with self.assertRaises(OSError):
+            self.workspace.open_dir('pkg')
+
+    def test_tools_stay_inside(self):
+        root = self.root
+        self.assertIs(get_workspace(root), get_workspace(root))
+        self.assertEqual(get_file_content(root, 'alias/a.py'), 'text\n')
+        for path in ('escape/secret.txt', 'escape_absolute/secret.txt', '../outside/secret.txt'):
+            self.assertIn('outside the permitted working directory', get_file_content(root, path))
+            self.assertIn('outside the permitted working directory', write_file(root, path, 'x'))
+        self.assertIn('outside the permitted working directory', get_files_info(root, 'escape'))
+        self.assertEqual(get_files_info(root, 'alias'), '- a.py: file_size=5 bytes, is_dir=False')
+        self.assertIn('outside the permitted working directory',
+                      write_files(root, [{'file_path': 'pkg/b.py', 'content': 'b'},
+                                         {'file_path': 'escape/c.txt', 'content': 'c'}]))
+        self.assertFalse(os.path.exists(os.path.join(root, 'pkg', 'b.py')))
+
+        self.assertTrue(write_file(root, 'alias/new/deep.py', 'x = 1\n').startswith('Successfully'))
+        self.assertEqual(get_file_content(root, 'pkg/new/deep.py'), 'x = 1\n')
+        self.assertTrue(write_files(root, [{'file_path': 'made/one.txt', 'content': '1'},
+                                           {'file_path': 'alias/a.py', 'mode': 'replace',
+                                            'edits': [{'search': 'text', 'replace': 'edited'}]}])
+                        .startswith('Successfully'))
+        self.assertEqual(get_file_content(root, 'pkg/a.py'), 'edited\n')
+        with open(os.path.join(self.outside, 'secret.txt')) as f:
+            self.assertEqual(f.read(), 'text\n')
+
+
+class TestGetFileContent(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def write(self, name, data):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(data)
+
+    def test_byte_ranges_always_make_progress(self):
+        self.write('cut.txt', 'h\u00e9llo'.encode() + b'\xe2')
+        # The incomplete character at the end of the file is replaced, not left for a next call.
+        self.assertEqual(get_file_content(self.root, 'cut.txt', offset=6), '\ufffd')
+        self.assertEqual(get_file_content(self.root, 'cut.txt'), 'h\u00e9llo\ufffd')
+        # A range that ends inside its only character returns it replaced.
+        self.assertEqual(get_file_content(self.root, 'cut.txt', offset=1, length=1), '\ufffd')
+        self.assertEqual(get_file_content(self.root, 'cut.txt', offset=0, length=2), 'h')
+
+    def test_notices_continue_where_the_range_stopped(self):
+        text = 'a\u00e9\u20acb\n' * 3
+        self.write('multi.txt', text.encode())
+        notice = re.compile(r'\[\.\.\.Read (\d+) bytes of "multi.txt" from offset (\d+); at most 4 are read per call\. '
+                            r'Call get_file_content with offset=(\d+)(?:, length=(\d+))?[^\]]*\]$')
+        with mock.patch('functions.get_file_content.MAX_FILE_CHARS', 4):
+            pieces, offset, length = [], 0, 100
+            for _ in range(len(text.encode())):
+                result = get_file_content(self.root, 'multi.txt', offset=offset, length=length)
+                match = notice.search(result)
+                if match is None:
+                    pieces.append(result)
+                    break
+                pieces.append(result[:match.start()])
+                self.assertEqual(int(match.group(2)), offset)
+                offset, length = int(match.group(3)), int(match.group(4))
+                self.assertEqual(length, 100 - offset)
+            self.assertEqual(''.join(pieces), text)
+
+    def test_line_ranges(self):
+        self.write('lines.txt', b'one\ntwo\nthree\nfour\n')
+        with mock.patch('functions.get_file_content.MAX_FILE_CHARS', 11):
+            self.assertEqual(
+                get_file_content(self.root, 'lines.txt', start_line=1, end_line=4),
+                'one\ntwo\n[...Lines 1-2 of "lines.txt" shown; the next line would pass the 11 character limit. '
+                'Call get_file_content with start_line=3, end_line=4 to read the rest of the requested lines.]')
+            self.assertEqual(get_file_content(self.root, 'lines.txt', start_line=3, end_line=4), 'three\nfour\n')
+            self.assertTrue(get_file_content(self.root, 'lines.txt', start_line=2).endswith(
+                'Call get_file_content with start_line=4 to read more.]'))
+        self.write('cut.txt', b'first\nsecond\xe2')
+        self.assertEqual(get_file_content(self.root, 'cut.txt', start_line=2), 'second\ufffd')
+
+
+class TestGetFilesInfo(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = root = tmp.name
+        files = {
+            '.gitignore': '*.log\nbuild/\n!keep.log\n',
+            'a.txt': 'abc',
+            'b.log': 'log',
+            'keep.log': 'kept',
+            'build/out.txt': 'x',
+            'pkg/.gitignore': 'secret.py\n',
+            'pkg/mod.py': 'x = 1\n',
+            'pkg/secret.py': 's',
+            'pkg/sub/deep.py': '',
+        }
+        for path, text in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+            with open(os.path.join(root, path), 'w') as f:
+                f.write(text)
+        os.symlink('missing.txt', os.path.join(root, 'dangling'))
+        os.symlink('pkg', os.path.join(root, 'dirlink'))
+
+    def listing(self, **kwargs):
+        return get_files_info(self.root, **kwargs).splitlines()
+
+    def test_recursive_listing_respects_gitignore(self):
+        self.assertEqual(self.listing(recursive=True), [
+            '- .gitignore: file_size=23 bytes, is_dir=False',
+            '- a.txt: file_size=3 bytes, is_dir=False',
+            '- dangling: file_size=11 bytes, is_dir=False, symlink to missing.txt',
+            '- dirlink: file_size=3 bytes, is_dir=False, symlink to pkg',
+            '- keep.log: file_size=4 bytes, is_dir=False',
+            '- pkg: file_size=0 bytes, is_dir=True',
+            '- pkg/.gitignore: file_size=10 bytes, is_dir=False',
+            '- pkg/mod.py: file_size=6 bytes, is_dir=False',
+            '- pkg/sub: file_size=0 bytes, is_dir=True',
+            '- pkg/sub/deep.py: file_size=0 bytes, is_dir=False',
+        ])
+        everything = self.listing(recursive=True, respect_gitignore=False)
+        for line in ('- b.log: file_size=3 bytes, is_dir=False', '- build/out.txt: file_size=1 bytes, is_dir=False',
+                     '- pkg/secret.py: file_size=1 bytes, is_dir=False'):
+            self.assertIn(line, everything)
+        # Rules above the listed directory still apply to it.
+        self.assertEqual(self.listing(directory='pkg', include=['*.py']), ['- mod.py: file_size=6 bytes, is_dir=False'])
+
+    def test_depth_include_and_exclude(self):
+        self.assertEqual([line.split(':')[0] for line in self.listing(max_depth=2, include=['*.py'])], ['- pkg/mod.py'])
+        self.assertEqual([line.split(':')[0] for line in self.listing(recursive=True, exclude=['pkg', '.*', '*link*'])],
+                         ['- a.txt', '- dangling', '- keep.log'])
+
+    def test_pages_cover_the_whole_listing(self):
+        full = self.listing(recursive=True)
+        pages, cursor = [], None
+        while True:
+            page = self.listing(recursive=True, limit=3, cursor=cursor)
+            if page[-1].startswith('[...more entries'):
+                cursor = page.pop().rsplit('cursor=', 1)[1].rstrip(']')
+                pages.extend(page)
+            else:
+                pages.extend(page)
+                break
+        self.assertEqual(pages, full)
+        self.assertEqual(self.listing(recursive=True, limit=3, cursor='3')[0], full[3])
+
+    def test_unreadable_directory_is_reported_not_fatal(self):
+        real_open = os.open
+
+        def refuse_sub(path, flags, *args, **kwargs):
+            if path == 'sub':
+                raise PermissionError(13, 'Permission denied')
+            return real_open(path, flags, *args, **kwargs)
+
+        with mock.patch('functions.get_files_info.os.open', side_effect=refuse_sub):
+            lines = self.listing(directory='pkg', recursive=True)
+        self.assertIn('- sub: file_size=0 bytes, is_dir=True', lines)
+        self.assertIn('- sub/: (unreadable: Permission denied)', lines)
+        self.assertIn('- mod.py: file_size=6 bytes, is_dir=False', lines)
+
+
+class TestSearchFiles(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, 'root')
+        os.mkdir(self.root)
+        for name, text in (('match.txt', 'say fooobar here\n'), ('other.txt', 'foo and bar apart\n')):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write(text)
+        patcher = mock.patch('functions.search_files.SEARCH_INDEX_DIR', os.path.join(tmp.name, 'index'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_regex_literals(self):
+        self.assertEqual(_regex_literals('foo{0,3}bar'), ['bar'])
+        self.assertEqual(_regex_literals('foo{2}?barbaz'), ['foo', 'obarbaz'])
+        self.assertEqual(_regex_literals('class \\w+Error'), ['class ', 'Error'])
+        self.assertEqual(_regex_literals('abc+def'), ['abc', 'cdef'])
+        self.assertEqual(_regex_literals('abc|def'), [])
+        self.assertEqual(_regex_literals('foo(bar|baz)quux'), ['foo', 'quux'])
+        self.assertEqual(_regex_literals('(?x) a b c  # comment'), ['abc'])
+
+    def test_escapes_are_read_as_the_characters_they_stand_for(self):
+        cases = [(r'\x66ooobar', 'fooobar'), (r'\146ooobar', 'fooobar'), (r'\u0066ooobar', 'fooobar'),
+                 (r'\U00000066ooobar', 'fooobar'), (r'\N{LATIN SMALL LETTER F}ooobar', 'fooobar'),
+                 (r'(f)ooo\x62ar', 'ooobar')]
+        for pattern, literal in cases:
+            self.assertEqual(_regex_literals(pattern), [literal])
+            self.assertEqual(search_files(self.root, pattern, regex=True), 'match.txt:1: say fooobar here')
+        self.assertEqual(_regex_literals(r'(bar) \1 baz'), ['bar', ' baz'])
+
+    def test_bounded_repetition_is_not_required_text(self):
+        self.assertEqual(search_files(self.root, 'fo{1,3}bar', regex=True), 'match.txt:1: say fooobar here')
+        self.assertEqual(search_files(self.root, 'say fo{3}', regex=True), 'match.txt:1: say fooobar here')
+        self.assertEqual(search_files(self.root, 'fo{4,}bar', regex=True), 'No matches found for "fo{4,}bar"')
+
+    def test_symlinks_never_lead_outside(self):
+        outside = os.path.join(os.path.dirname(self.root), 'outside')
+        os.mkdir(outside)
+        with open(os.path.join(outside, 'secret.txt'), 'w') as f:
+            f.write('say fooobar outside\n')
+        os.symlink(outside, os.path.join(self.root, 'escape'))
+        os.symlink(os.path.join(outside, 'secret.txt'), os.path.join(self.root, 'leak.txt'))
+        self.assertEqual(search_files(self.root, 'outside'), 'No matches found for "outside"')
+        # A path written through the tools is re-read before the next scan.
+        notify_write(self.root, 'escape/secret.txt')
+        self.assertEqual(search_files(self.root, 'outside'), 'No matches found for "outside"')
+        # An indexed file swapped for a symlink before the next scan is not followed either.
+        os.remove(os.path.join(self.root, 'match.txt'))
+        os.symlink(os.path.join(outside, 'secret.txt'), os.path.join(self.root, 'match.txt'))
+        self.assertEqual(search_files(self.root, 'fooobar'), 'No matches found for "fooobar"')
+
+
+class TestApplyPatch(unittest.TestCase):
+    original = 'a\nb\nc\nd\ne\n'
+
+    def patch(self, patch, original=None):
+        return apply_edit(self.original if original is None else original, 'patch', patch=patch)
+
+    def test_zero_length_hunk_inserts_after_its_line(self):
+        self.assertEqual(self.patch('@@ -2,0 +3,1 @@\n+NEW\n'), 'a\nb\nNEW\nc\nd\ne\n')
+
+    def test_insert_at_start_and_end(self):
+        self.assertEqual(self.patch('@@ -0,0 +1,1 @@\n+TOP\n'), 'TOP\na\nb\nc\nd\ne\n')
+        self.assertEqual(self.patch('@@ -5,0 +6,2 @@\n+END\n+END2\n'), 'a\nb\nc\nd\ne\nEND\nEND2\n')
+        self.assertEqual(self.patch('@@ -0,0 +1,2 @@\n+x\n+y\n', original=''), 'x\ny\n')
+
+    def test_later_hunks_follow_earlier_insertions(self):
+        patch = '@@ -1,0 +2,2 @@\n+a1\n+a2\n@@ -4,1 +6,1 @@\n-d\n+D\n@@ -5,0 +8,1 @@\n+f\n'
+        self.assertEqual(self.patch(patch), 'a\na1\na2\nb\nc\nD\ne\nf\n')
+
+    def test_hunk_found_near_its_stated_line(self):
+        self.assertEqual(self.patch('@@ -1,2 +1,2 @@\n c\n-d\n+D\n'), 'a\nb\nc\nD\ne\n')
+
+    def test_context_mismatch_is_rejected(self):
+        for patch in ('@@ -2,2 +2,2 @@\n b\n-x\n+X\n', '@@ -9,0 +10,1 @@\n+late\n'):
+            with self.assertRaises(ValueError, msg=patch):
+                self.patch(patch)
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'f.txt'), 'w') as f:
+                f.write(self.original)
+            result = write_file(tmp, 'f.txt', mode='patch', patch='@@ -1,1 +1,1 @@\n-z\n+Z\n')
+            self.assertTrue(result.startswith('Error:'), result)
+            self.assertEqual(get_file_content(tmp, 'f.txt'), self.original)
+
+
+class TestWriteFiles(unittest.TestCase):
+    original = b'keep\r\nthese bytes\n\xc3\xa9'
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        for name, data in (('first.txt', self.original), ('second.txt', b'two\n')):
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(data)
+        self.operations = [
+            {'file_path': 'first.txt', 'content': 'changed\n'},
+            {'file_path': 'second.txt', 'content': 'also changed\n'},
+            {'file_path': 'new/third.txt', 'content': 'new\n'},
+        ]
+
+    def assert_untouched(self):
+        for name, data in (('first.txt', self.original), ('second.txt', b'two\n')):
+            with open(os.path.join(self.root, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+        # No staged files, backups or created directories are left behind.
+        self.assertEqual(sorted(os.listdir(self.root)), ['first.txt', 'second.txt'])
+
+    def test_failed_rename_of_the_second_file_rolls_back_the_first(self):
+        real_replace = os.replace
+
+        def fail_on_second(src, dst, **kwargs):
+            if dst == 'second.txt':
+                raise OSError(28, 'No space left on device')
+            return real_replace(src, dst, **kwargs)
+
+        with mock.patch('functions.write_files.os.replace', side_effect=fail_on_second):
+            result = write_files(self.root, self.operations)
+        self.assertEqual(result, 'Error: writing files failed, all changes were rolled back: '
+                                 '[Errno 28] No space left on device')
+        self.assert_untouched()
+
+    def test_failed_staging_of_the_second_file_writes_nothing(self):
+        real_stage = stage_file
+
+        def fail_on_second(name, text, dir_fd=None):
+            if name == 'second.txt':
+                raise OSError(28, 'No space left on device')
+            return real_stage(name, text, dir_fd)
+
+        with mock.patch('functions.write_files.stage_file', side_effect=fail_on_second):
+            self.assertTrue(write_files(self.root, self.operations).startswith('Error: writing files failed'))
+        self.assert_untouched()
+
+    def test_failed_edit_of_the_second_file_writes_nothing(self):
+        self.operations[1] = {'file_path': 'second.txt', 'mode': 'replace', 'edits': [{'search': 'x', 'replace': 'y'}]}
+        self.assertEqual(write_files(self.root, self.operations),
+                         'Error: operation 2 (replace "second.txt") failed, nothing was written: '
+                         'edit 1: search text not found')
+        self.assert_untouched()
+
+
+class TestProcessUtils(unittest.TestCase):
+    def test_capture_keeps_head_and_tail(self):
+        capture = BoundedCapture(head=4, tail=3)
+        for chunk in (b'ab', b'cdefg', b'', b'hijk'):
+            capture.write(chunk)
+        self.assertEqual(capture.text(), 'abcd\n[...4 bytes elided...]\nijk')
+        self.assertEqual((capture.total, bytes(capture.head), bytes(capture.tail)), (11, b'abcd', b'ijk'))
+
+        capture = BoundedCapture(head=4, tail=3)
+        capture.write(b'abcdefg')
+        self.assertEqual(capture.text(), 'abcdefg')
+
+    def test_read_bounded_file_matches_the_capture(self):
+        with tempfile.NamedTemporaryFile('wb', delete=False) as f:
+            f.write(b'abcdefghijk')
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(read_bounded_file(f.name, head=4, tail=3), 'abcd\n[...4 bytes elided...]\nijk')
+        self.assertEqual(read_bounded_file(f.name, head=8, tail=3), 'abcdefghijk')
+
+    def test_cpu_limit_is_rounded_up_to_a_whole_second(self):
+        with mock.patch('functions.process_utils.resource') as resource:
+            for seconds, limit in ((0.5, 1), (2, 2), (2.1, 3)):
+                resource.setrlimit.reset_mock()
+                apply_limits(cpu_seconds=seconds)
+                resource.setrlimit.assert_called_once_with(resource.RLIMIT_CPU, (limit, limit + 1))
+
+
+class TestRunPythonFile(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def script(self, name, source):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(source)
+
+    def test_preexec_fn_only_with_limits(self):
+        self.script('hello.py', 'print("hello")\n')
+        with mock.patch('functions.run_python_file.subprocess.Popen', wraps=subprocess.Popen) as popen:
+            self.assertIn('hello', run_python_file(self.root, 'hello.py'))
+            self.assertIsNone(popen.call_args.kwargs['preexec_fn'])
+            self.assertIn('hello', run_python_file(self.root, 'hello.py', cpu_limit=5))
+            self.assertIsNotNone(popen.call_args.kwargs['preexec_fn'])
+
+    @unittest.skipUnless(hasattr(os, 'setsid'), 'needs setsid')
+    def test_grandchild_outside_the_group_does_not_hang_the_call(self):
+        pid_file = os.path.join(self.root, 'grandchild.pid')
+        self.script('daemon.py', f'''import os, time
+print("started", flush=True)
+if os.fork() == 0:
+    os.setsid()
+    with open({pid_file!r}, "w") as f:
+        f.write(str(os.getpid()))
+    time.sleep(60)
+    os._exit(0)
+''')
+        start = time.monotonic()
+        result = run_python_file(self.root, 'daemon.py', timeout=1)
+        elapsed = time.monotonic() - start
+        for _ in range(100):
+            if os.path.exists(pid_file):
+                break
+            time.sleep(0.01)
+        with open(pid_file) as f:
+            os.kill(int(f.read()), signal.SIGKILL)
+        self.assertIn('started', result)
+        self.assertLess(elapsed, 5)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'the interpreter pool needs fork')
+class TestInterpreterPool(unittest.TestCase):
+    script = '''import atexit, sys, threading, time
+log = open('log.txt', 'w')
+log.write('never flushed or closed\\n')
+
+def goodbye():
+    print('atexit handler ran')
+
+def worker():
+    time.sleep(0.1)
+    print('non-daemon thread finished', flush=True)
+
+atexit.register(goodbye)
+threading.Thread(target=worker).start()
+print('main done')
+sys.exit(int(sys.argv[1]))
+'''
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        self.path = os.path.join(self.root, 'shutdown.py')
+        with open(self.path, 'w') as f:
+            f.write(self.script)
+        self.pool = InterpreterPool(size=1)
+        self.addCleanup(self.pool.close)
+
+    def outcome(self, result):
+        with open(os.path.join(self.root, 'log.txt')) as f:
+            log = f.read()
+        os.remove(os.path.join(self.root, 'log.txt'))
+        return result.returncode, result.stdout, result.stderr, log
+
+    def test_shutdown_matches_a_cold_run(self):
+        for code in ('0', '3'):
+            cold = self.outcome(_run_subprocess([self.path, code], self.root, 10, None, None))
+            pooled = self.outcome(self.pool.run([self.path, code], cwd=self.root, timeout=10))
+            self.assertEqual(pooled, cold)
+            self.assertEqual(cold, (int(code), 'main done\nnon-daemon thread finished\natexit handler ran\n', '',
+                                    'never flushed or closed\n'))
+
+
+class TestLineEndings(unittest.TestCase):
+    def lines(self, original, start_line, end_line, content):
+        return apply_edit(original, 'lines', content=content, start_line=start_line, end_line=end_line)
+
+    def test_insert_after_a_last_line_without_newline(self):
+        self.assertEqual(self.lines('a', 2, 1, 'x'), 'a\nx\n')
+        self.assertEqual(self.lines('a\r\nb', 3, 2, 'x\ny'), 'a\r\nb\r\nx\r\ny\r\n')
+
+    def test_replacing_the_last_line_keeps_its_missing_newline(self):
+        self.assertEqual(self.lines('a\nb', 2, 2, 'x'), 'a\nx')
+        self.assertEqual(self.lines('a\nb', 1, 1, 'x'), 'x\nb')
+
+    def test_only_newlines_split_lines(self):
+        text = 's = "one\u2028two"\nx = 1\x0cy\nlast\n'
+        self.assertEqual(self.lines(text, 3, 3, 'LAST'), 's = "one\u2028two"\nx = 1\x0cy\nLAST\n')
+        self.assertEqual(apply_edit(text, 'patch', patch='@@ -3,1 +3,1 @@\n-last\n+LAST\n'),
+                         's = "one\u2028two"\nx = 1\x0cy\nLAST\n')
+        self.assertEqual(apply_edit('x = 1\x0cy\nz\n', 'patch', patch='@@ -1,2 +1,2 @@\n x = 1\x0cy\n-z\n+Z\n'),
+                         'x = 1\x0cy\nZ\n')
+
+    def test_untouched_lines_keep_their_own_endings(self):
+        mixed = 'a\r\nb\nc\nd\n'
+        self.assertEqual(apply_edit(mixed, 'patch', patch='@@ -2,2 +2,2 @@\n b\n-c\n+C\n'), 'a\r\nb\nC\nd\n')
+        self.assertEqual(self.lines(mixed, 4, 4, 'D'), 'a\r\nb\nc\nD\n')
+        crlf = 'a\r\nb\r\nc\n'
+        self.assertEqual(apply_edit(crlf, 'patch', patch='@@ -1,1 +1,2 @@\n a\n+new\n'), 'a\r\nnew\r\nb\r\nc\n')
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.saved = tracer.enabled, tracer.events, tracer.lanes
+        tracer.events, tracer.lanes = [], {}
+        tracer.enable()
+        # A cached result would skip the tool span.
+        tool_cache.clear()
+
+    def tearDown(self):
+        tracer.enabled, tracer.events, tracer.lanes = self.saved
+
+    def test_session_spans_and_chrome_export(self):
+        client = FakeModelClient(TestFakeModelClient.script)
+        AgentSession(client).run('hi')
+        names = [event['name'] for event in tracer.events]
+        for name in ('turn', 'model', 'call_functions', 'call_function', 'get_files_info'):
+            self.assertIn(name, names)
+        model = next(event for event in tracer.events if event['name'] == 'model')
+        self.assertIn('prompt_tokens', model['args'])
+        self.assertIn('get_files_info', tracer.summary())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.json')
+            tracer.write(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        self.assertTrue(all(event['ph'] in ('X', 'M') for event in events))
+
+    def test_disabled_tracer_records_nothing(self):
+        self.assertFalse(Tracer().enabled)
+        tracer.enabled = False
+        AgentSession(FakeModelClient(TestFakeModelClient.script)).run('hi')
+        self.assertEqual(tracer.events, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
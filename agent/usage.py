@@ -0,0 +1,62 @@
+# Model turns allowed per session unless max_turns says otherwise.
+DEFAULT_MAX_TURNS = 20
+
+
+def _count(usage, field) -> int:
+    """Read a token count from usage metadata given as an object or a dict; missing counts are 0."""
+    if usage is None:
+        return 0
+    if isinstance(usage, dict):
+        value = usage.get(field)
+    else:
+        value = getattr(usage, field, None)
+    return value or 0
+
+
+class TokenUsage:
+    """Token counts for one model call, or the sum of several.
+
+    - prompt: tokens sent, including any served from the context cache
+    - cached: the part of prompt that was served from the cache
+    - candidates: tokens generated in the response
+    - total: everything billed for the call(s), as reported by the API
+    """
+
+    __slots__ = ('calls', 'prompt', 'cached', 'candidates', 'total')
+
+    def __init__(self, calls: int = 0, prompt: int = 0, cached: int = 0, candidates: int = 0, total: int = 0):
+        self.calls = calls
+        self.prompt = prompt
+        self.cached = cached
+        self.candidates = candidates
+        self.total = total
+
+    @classmethod
+    def from_metadata(cls, usage) -> 'TokenUsage':
+        """Build the usage of one call from a response's usage_metadata (an object, a dict or None)."""
+        prompt = _count(usage, 'prompt_token_count')
+        candidates = _count(usage, 'candidates_token_count')
+        total = _count(usage, 'total_token_count') or prompt + candidates + _count(usage, 'thoughts_token_count')
+        return cls(1, prompt, _count(usage, 'cached_content_token_count'), candidates, total)
+
+    def __add__(self, other: 'TokenUsage') -> 'TokenUsage':
+        return TokenUsage(*(getattr(self, f) + getattr(other, f) for f in self.__slots__))
+
+    def as_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self.__slots__}
+
+    def __repr__(self):
+        return 'TokenUsage(' + ', '.join(f'{f}={getattr(self, f)}' for f in self.__slots__) + ')'
+
+
+def format_usage_table(turns) -> str:
+    """Return a per-turn table of token usage with a running total and a totals row."""
+    lines = [f"{'turn':>4}{'prompt':>10}{'cached':>10}{'response':>10}{'total':>10}{'cumulative':>12}"]
+    running = TokenUsage()
+    for number, usage in enumerate(turns, 1):
+        running = running + usage
+        lines.append(f"{number:>4}{usage.prompt:>10}{usage.cached:>10}{usage.candidates:>10}{usage.total:>10}"
+                     f"{running.total:>12}")
+    lines.append(f"{'sum':>4}{running.prompt:>10}{running.cached:>10}{running.candidates:>10}{running.total:>10}"
+                 f"{running.total:>12}")
+    return '\n'.join(lines)
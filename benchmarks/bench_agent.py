@@ -0,0 +1,198 @@
+"""End-to-end benchmark of the agent loop against the local fake model.
+
+Each scenario scripts a representative session (exploring a tree, editing
+and running code, a long read-heavy conversation), runs it through
+AgentSession against a synthetic workspace, and reports turns, wall time,
+time per turn spent outside the model, and peak memory. Results are
+compared with benchmarks/baselines.json and the script exits with status 1
+when a scenario regresses past the tolerance.
+
+Usage: python benchmarks/bench_agent.py [--files N] [--latency S] [--scenario NAME] [--update-baselines]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+
+# Allowed slowdown relative to the baseline, plus an absolute floor so
+# sub-millisecond numbers do not fail on scheduling noise.
+TIME_TOLERANCE = 0.5
+TIME_FLOOR_MS = 2.0
+MEMORY_TOLERANCE = 0.2
+
+
+def _module(index):
+    return f'pkg_{index % 10}/sub_{index // 100}/mod_{index}.py'
+
+
+def make_workspace(root, files):
+    """Create `files` small Python modules plus a runnable main.py, an ignored build dir and a large text file."""
+    for index in range(files):
+        path = os.path.join(root, _module(index))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            for j in range(20):
+                f.write(f'def helper_{index}_{j}(x):\n    return x * {j} + {index}\n\n\n')
+    with open(os.path.join(root, 'main.py'), 'w') as f:
+        f.write('import sys\nprint(sum(range(int(sys.argv[1]) if len(sys.argv) > 1 else 10)))\n')
+    os.makedirs(os.path.join(root, 'build'))
+    for index in range(files // 10):
+        with open(os.path.join(root, 'build', f'out_{index}.o'), 'wb') as f:
+            f.write(b'\0' * 1024)
+    with open(os.path.join(root, '.gitignore'), 'w') as f:
+        f.write('build/\n')
+    with open(os.path.join(root, 'big.txt'), 'w') as f:
+        for line in range(50000):
+            f.write(f'line {line}: lorem ipsum dolor sit amet\n')
+
+
+def _calls(*calls):
+    return {'function_calls': [{'name': name, 'args': args} for name, args in calls]}
+
+
+def scenario_explore(files):
+    """List the tree, search it, then read the matches."""
+    picks = [_module(i) for i in (0, files // 2, files - 1)]
+    return [
+        _calls(('get_files_info', {'directory': '.', 'recursive': True, 'include': ['*.py'], 'limit': 200})),
+        _calls(('search_files', {'query': f'def helper_{files // 2}_3', 'include': ['*.py']})),
+        _calls(*[('get_file_content', {'file_path': path}) for path in picks]),
+        {'text': 'Found the helper in ' + picks[1]},
+    ]
+
+
+def scenario_edit(files):
+    """Read a module, patch it, run a script and page through a large file."""
+    path = _module(1)
+    return [
+        _calls(('get_file_content', {'file_path': path})),
+        _calls(('write_file', {'file_path': path, 'mode': 'replace',
+                               'edits': [{'search': 'return x * 3 + 1\n', 'replace': 'return x * 3 - 1\n'}]})),
+        _calls(('run_python_file', {'file_path': 'main.py', 'args': ['1000']})),
+        _calls(('get_file_content', {'file_path': 'big.txt', 'start_line': 25000, 'end_line': 25100})),
+        {'text': 'Patched helper_1_3 and checked the output.'},
+    ]
+
+
+def scenario_long(files):
+    """A long read-heavy conversation that grows the history past the context budget."""
+    turns = [_calls(('get_file_content', {'file_path': _module(i * 7 % files)})) for i in range(15)]
+    return turns + [{'text': 'Read fifteen modules.'}]
+
+
+SCENARIOS = {
+    'explore': scenario_explore,
+    'edit': scenario_edit,
+    'long': scenario_long,
+}
+
+
+def run_child(scenario, files, latency):
+    """Run one scenario in this process and print its measurements as JSON."""
+    sys.path.insert(0, ROOT)
+    import resource
+    from agent.session import AgentSession
+    from agent.fake_model import FakeModelClient
+    from functions.process_utils import peak_rss_bytes
+
+    client = FakeModelClient(SCENARIOS[scenario](files), latency=latency)
+    session = AgentSession(client)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        session.run(f'Run the {scenario} scenario', max_turns=50)
+    wall = time.perf_counter() - start
+    print(json.dumps({
+        'turns': session.turns,
+        'wall_ms': wall * 1000,
+        'overhead_per_turn_ms': (wall - client.model_time) / max(session.turns, 1) * 1000,
+        'peak_rss_mb': peak_rss_bytes(resource.getrusage(resource.RUSAGE_SELF)) / (1024 * 1024),
+        'done': session.done,
+    }))
+
+
+def measure(scenario, files, latency):
+    """Run a scenario in a fresh interpreter against a fresh workspace."""
+    tmp = tempfile.mkdtemp(prefix='bench_agent_')
+    try:
+        workspace = os.path.join(tmp, 'workspace')
+        os.makedirs(workspace)
+        make_workspace(workspace, files)
+        env = dict(os.environ, AGENT_WORKING_DIRECTORY=workspace,
+                   AGENT_SEARCH_INDEX_DIR=os.path.join(tmp, 'index'), AGENT_REPLAY_MODE='passthrough')
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', scenario, '--files', str(files),
+             '--latency', str(latency)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def regressions(result, baseline):
+    """Return the reasons `result` is worse than `baseline`."""
+    problems = []
+    if result['turns'] != baseline['turns']:
+        problems.append(f"turns {result['turns']} != {baseline['turns']}")
+    limit = max(baseline['overhead_per_turn_ms'] * (1 + TIME_TOLERANCE), baseline['overhead_per_turn_ms'] + TIME_FLOOR_MS)
+    if result['overhead_per_turn_ms'] > limit:
+        problems.append(f"overhead {result['overhead_per_turn_ms']:.1f}ms/turn > {limit:.1f}ms")
+    limit = baseline['peak_rss_mb'] * (1 + MEMORY_TOLERANCE)
+    if result['peak_rss_mb'] > limit:
+        problems.append(f"peak RSS {result['peak_rss_mb']:.1f}MB > {limit:.1f}MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the agent loop against the fake model.')
+    parser.add_argument('--files', type=int, default=500, help='Python modules in the synthetic workspace (default: 500)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated model latency per turn in seconds')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Scenario to run (default: all)')
+    parser.add_argument('--update-baselines', action='store_true', help='Store these results as the new baselines')
+    parser.add_argument('--child', choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.files, args.latency)
+        return
+
+    try:
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    failed = False
+    print(f"{'scenario':<16}{'turns':>6}{'wall':>11}{'overhead/turn':>15}{'peak RSS':>11}  status")
+    for scenario in args.scenario or sorted(SCENARIOS):
+        key = f'{scenario}@{args.files}'
+        result = measure(scenario, args.files, args.latency)
+        if args.update_baselines:
+            baselines[key] = {k: round(result[k], 2) for k in ('turns', 'overhead_per_turn_ms', 'peak_rss_mb')}
+            status = 'baseline updated'
+        elif key not in baselines:
+            status = 'no baseline'
+        else:
+            problems = regressions(result, baselines[key])
+            failed = failed or bool(problems)
+            status = 'REGRESSED: ' + '; '.join(problems) if problems else 'ok'
+        print(f"{key:<16}{result['turns']:>6}{result['wall_ms']:>9.1f}ms{result['overhead_per_turn_ms']:>13.1f}ms"
+              f"{result['peak_rss_mb']:>9.1f}MB  {status}")
+
+    if args.update_baselines:
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
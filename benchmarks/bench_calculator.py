@@ -0,0 +1,123 @@
+"""Measure expressions per second of the example calculator.
+
+"split + shunting-yard" is the evaluator the calculator used before
+expressions were compiled: every call splits the text on spaces and runs
+the operator-precedence loop again. It is kept here as the baseline.
+The compiled evaluator is measured with every expression new (compile and
+run), with the expressions repeating (served from the compile cache), and
+through evaluate_many. Each rate is the best of three passes.
+
+Then "price * qty - discount" is evaluated over `rows` rows of columns with
+evaluate_columns, against the same formula written directly in NumPy (which
+allocates a temporary per operator) and the pure-Python row loop used when
+NumPy is missing (timed on a tenth of the rows).
+
+Usage: python benchmarks/bench_calculator.py [expressions] [distinct] [rows]
+"""
+import os
+import sys
+import time
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'calculator'))
+
+from pkg.calculator import Calculator  # noqa: E402
+from pkg import vectorized  # noqa: E402
+
+
+def legacy_evaluate(calculator, expression):
+    """The split-and-evaluate loop the calculator ran on every call."""
+    values = []
+    operators = []
+
+    def apply():
+        operator = operators.pop()
+        b = values.pop()
+        a = values.pop()
+        values.append(calculator.operators[operator](a, b))
+
+    for token in expression.strip().split():
+        if token in calculator.operators:
+            while operators and calculator.precedence[operators[-1]] >= calculator.precedence[token]:
+                apply()
+            operators.append(token)
+        else:
+            values.append(float(token))
+    while operators:
+        apply()
+    return values[0]
+
+
+def make_expressions(count, rng):
+    expressions = []
+    for _ in range(count):
+        terms = [str(rng.randint(1, 999)) for _ in range(rng.randint(2, 8))]
+        text = terms[0]
+        for term in terms[1:]:
+            text += f' {rng.choice("+-*/")} {term}'
+        expressions.append(text)
+    return expressions
+
+
+def per_second(func, expressions, runs=3):
+    """Return the expressions per second of the fastest of `runs` passes over expressions."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(expressions)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(expressions) / best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(0)
+    unique = make_expressions(count, rng)
+    pool = make_expressions(distinct, rng)
+    repeated = [rng.choice(pool) for _ in range(count)]
+
+    baseline = Calculator()
+    uncached = Calculator(cache_size=0)
+    cached = Calculator()
+    cached.evaluate_many(pool)
+
+    results = [
+        ('split + shunting-yard', per_second(lambda exprs: [legacy_evaluate(baseline, e) for e in exprs], repeated)),
+        ('compile and run', per_second(lambda exprs: [uncached.evaluate(e) for e in exprs], unique)),
+        ('cached evaluate', per_second(lambda exprs: [cached.evaluate(e) for e in exprs], repeated)),
+        ('cached evaluate_many', per_second(cached.evaluate_many, repeated)),
+    ]
+    print(f'{count} expressions, {distinct} distinct when repeated')
+    for label, rate in results:
+        print(f'{label:<24}{rate:>12,.0f} expr/s')
+
+    rows = int(sys.argv[3]) if len(sys.argv) > 3 else 1000000
+    formula = 'price * qty - discount'
+    np = vectorized._numpy()
+    print(f'\n{formula} over {rows} rows')
+    if np is None:
+        print('NumPy is not installed; only the row loop is measured')
+        columns = {name: [rng.uniform(1, 100) for _ in range(rows // 10)] for name in ('price', 'qty', 'discount')}
+    else:
+        generator = np.random.default_rng(0)
+        columns = {name: generator.uniform(1, 100, rows) for name in ('price', 'qty', 'discount')}
+        out = np.empty(rows)
+        price, qty, discount = columns['price'], columns['qty'], columns['discount']
+        results = [
+            ('evaluate_columns', per_second(lambda n: cached.evaluate_columns(formula, columns), range(rows))),
+            ('evaluate_columns, out', per_second(lambda n: cached.evaluate_columns(formula, columns, out), range(rows))),
+            ('NumPy expression', per_second(lambda n: price * qty - discount, range(rows))),
+        ]
+        for label, rate in results:
+            print(f'{label:<24}{rate:>12,.0f} rows/s')
+        columns = {name: column[:rows // 10].tolist() for name, column in columns.items()}
+        vectorized._numpy_module = False
+    rate = per_second(lambda n: cached.evaluate_columns(formula, columns), range(rows // 10), runs=1)
+    print(f"{'row loop, no NumPy':<24}{rate:>12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measure expressions per second through the calculator CLI.
+
+Compares starting `main.py "<expression>"` once per expression with piping
+the same kind of input through `main.py --batch`, in one process and with
+--workers. Times are wall-clock, including interpreter startup and writing
+the NDJSON output to a file.
+
+Usage: python benchmarks/bench_calculator_cli.py [expressions] [workers]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import subprocess
+
+from bench_calculator import make_expressions
+
+CALCULATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'calculator')
+
+# Single-expression runs timed to estimate the per-process rate.
+SINGLE_RUNS = 30
+
+
+def run(argv, stdin=None, stdout=subprocess.DEVNULL):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'main.py', *argv], cwd=CALCULATOR, stdin=stdin, stdout=stdout, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else min(4, os.cpu_count() or 1)
+    expressions = make_expressions(count, random.Random(0))
+
+    results = [('one process each', SINGLE_RUNS / sum(run([e]) for e in expressions[:SINGLE_RUNS]))]
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'expressions.txt')
+        with open(source, 'w') as f:
+            f.write('\n'.join(expressions) + '\n')
+        for label, argv in (('--batch', ['--batch']), (f'--batch --workers {workers}',
+                                                       ['--batch', '--workers', str(workers)])):
+            with open(source) as stdin, open(os.path.join(tmp, 'out.ndjson'), 'w') as stdout:
+                results.append((label, count / run(argv, stdin, stdout)))
+            with open(os.path.join(tmp, 'out.ndjson')) as f:
+                lines = sum(1 for _ in f)
+            if lines != count:
+                sys.exit(f'{label} wrote {lines} lines for {count} expressions')
+
+    print(f'{count} expressions')
+    for label, rate in results:
+        print(f'{label:<28}{rate:>12,.0f} expr/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Measure the cost of confining a path to the working directory.
+
+Compares the realpath/commonpath check the tools used to make on every call
+with Workspace.resolve, uncached and cached, for a path `depth` directories
+deep in a temporary tree, then times reading that file and listing its
+directory through the tools (called directly, so the tool cache is not
+involved).
+
+Usage: python benchmarks/bench_paths.py [calls] [depth]
+"""
+import os
+import sys
+import time
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions.get_file_content import get_file_content  # noqa: E402
+from functions.get_files_info import get_files_info  # noqa: E402
+from functions.workspace import Workspace, get_workspace  # noqa: E402
+
+
+def realpath_check(working_directory, path):
+    """The guard every tool ran before the Workspace."""
+    base_real = os.path.realpath(working_directory)
+    target_real = os.path.realpath(os.path.join(working_directory, path))
+    return os.path.commonpath([base_real, target_real]) == base_real
+
+
+def per_call_us(func, calls):
+    func()
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = '/'.join(f'd{level}' for level in range(depth))
+        os.makedirs(os.path.join(tmp, directory))
+        path = f'{directory}/module.py'
+        with open(os.path.join(tmp, path), 'w') as f:
+            f.write('x = 1\n' * 100)
+
+        uncached = Workspace(tmp, cache_size=0)
+        workspace = get_workspace(tmp)
+        results = [
+            ('realpath check', per_call_us(lambda: realpath_check(tmp, path), calls)),
+            ('resolve, uncached', per_call_us(lambda: uncached.resolve(path), calls)),
+            ('resolve, cached', per_call_us(lambda: workspace.resolve(path), calls)),
+            ('open, cached', per_call_us(lambda: os.close(workspace.open(path)), calls)),
+            ('get_file_content', per_call_us(lambda: get_file_content(tmp, path), calls)),
+            ('get_files_info', per_call_us(lambda: get_files_info(tmp, directory), calls)),
+        ]
+        uncached.close()
+    print(f'path depth {depth + 1}')
+    for label, us in results:
+        print(f'{label:<20}{us:>8.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
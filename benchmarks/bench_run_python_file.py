@@ -0,0 +1,47 @@
+"""Compare run_python_file throughput with and without the warm interpreter pool.
+
+Usage: python benchmarks/bench_run_python_file.py [runs] [pool_size]
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each measurement runs in its own interpreter so the pool setting, which is
+# read from the environment at import time, applies cleanly.
+_MEASURE = """
+import sys, time
+sys.path.insert(0, {root!r})
+from functions.run_python_file import run_python_file
+runs = {runs}
+run_python_file('calculator', 'main.py', ['3 + 5'])  # warm-up
+start = time.perf_counter()
+for _ in range(runs):
+    result = run_python_file('calculator', 'main.py', ['3 + 5'])
+    assert '"result": 8' in result, result
+print(runs / (time.perf_counter() - start))
+"""
+
+
+def measure(runs, pool_size):
+    env = dict(os.environ, AGENT_PYTHON_POOL=str(pool_size))
+    out = subprocess.run(
+        [sys.executable, '-c', _MEASURE.format(root=ROOT, runs=runs)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pool_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    cold = measure(runs, 0)
+    warm = measure(runs, pool_size)
+    print(f"subprocess.run:   {cold:8.1f} runs/s")
+    print(f"warm pool ({pool_size}):    {warm:8.1f} runs/s")
+    print(f"speedup:          {warm / cold:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
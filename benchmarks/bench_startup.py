@@ -0,0 +1,100 @@
+"""Measure import time of the agent's entry points with `python -X importtime`.
+
+Each scenario runs in a fresh interpreter several times and the fastest run
+is reported: the time spent importing modules beyond what a bare interpreter
+imports, the wall time, the slowest top-level imports, and whether the genai
+SDK was loaded. Paths that never talk to the model must stay under
+TARGET_MS and must not import the SDK; the script exits with status 1 when
+one of them does. The "session" scenario shows the one-off cost a real run
+pays for the SDK and the tool declarations.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--target MS]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import time allowed for code paths that do not call the model.
+TARGET_MS = 50.0
+
+# name: (interpreter arguments, whether the path needs the model)
+SCENARIOS = {
+    'help': (['main.py', '--help'], False),
+    'bad-args': (['main.py', '--max-turns', 'many'], False),
+    'import-main': (['-c', 'import main'], False),
+    'tools': (['-c', 'import functions.call_function'], False),
+    'session': (['-c', 'import agent.session; from functions.schemas import get_available_functions; '
+                 'get_available_functions()'], True),
+}
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into ({top-level module: cumulative microseconds}, every module imported)."""
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name.startswith('  '):
+            top_level[name.strip()] = int(cumulative)
+    return top_level, modules
+
+
+def run(argv):
+    """Run the interpreter once and return (top-level imports, every module imported, wall seconds)."""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-X', 'importtime', *argv], cwd=ROOT, capture_output=True, text=True)
+    return (*parse_importtime(out.stderr), time.perf_counter() - start)
+
+
+def measure(argv, runs, baseline):
+    """Return the fastest of `runs` runs as (import ms, wall ms, top-level imports, every module imported).
+
+    Imports a bare interpreter makes on its own are left out.
+    """
+    best = None
+    for _ in range(runs):
+        top_level, modules, wall = run(argv)
+        own = {name: us for name, us in top_level.items() if name not in baseline}
+        total = sum(own.values()) / 1000
+        if best is None or total < best[0]:
+            best = (total, wall * 1000, own, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time of the agent entry points.')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per scenario; the fastest is reported (default: 5)')
+    parser.add_argument('--target', type=float, default=TARGET_MS,
+                        help=f'Import-time budget in ms for paths that do not call the model (default: {TARGET_MS:g})')
+    args = parser.parse_args()
+
+    baseline = set(run(['-c', 'pass'])[0])
+    failed = False
+    print(f"{'scenario':<13}{'imports':>10}{'wall':>10}  {'sdk':<5}{'status':<22}slowest imports")
+    for name, (argv, needs_model) in SCENARIOS.items():
+        total, wall, own, modules = measure(argv, args.runs, baseline)
+        sdk = 'google.genai' in modules
+        if needs_model:
+            status = 'model path'
+        elif sdk:
+            status = 'FAILED: imports the SDK'
+        elif total > args.target:
+            status = f'FAILED: > {args.target:g}ms'
+        else:
+            status = 'ok'
+        failed = failed or status.startswith('FAILED')
+        slowest = ', '.join(f'{module} {us / 1000:.1f}ms'
+                            for module, us in sorted(own.items(), key=lambda item: -item[1])[:3])
+        print(f"{name:<13}{total:>8.1f}ms{wall:>8.1f}ms  {'yes' if sdk else 'no':<5}{status:<22}{slowest}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
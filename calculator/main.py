@@ -5,11 +5,44 @@ from pkg.calculator import Calculator
 from pkg.render import format_json_output
 
 
+def batch_main(argv):
+    import time
+    import argparse
+    from pkg.batch import run_batch
+
+    parser = argparse.ArgumentParser(
+        prog="main.py --batch",
+        description="Evaluate one expression per line and write one JSON object per line (NDJSON) to stdout.",
+    )
+    parser.add_argument("file", nargs="?", help="Read expressions from FILE instead of stdin")
+    parser.add_argument("--workers", type=int, default=1, help="Evaluate chunks in N processes (default: 1)")
+    parser.add_argument("--stats", action="store_true", help="Print the throughput in expressions per second to stderr")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    source = open(args.file, encoding="utf-8") if args.file else sys.stdin
+    # A large buffer so output goes out in big writes rather than a line at a time.
+    out = open(sys.stdout.fileno(), "w", encoding="utf-8", buffering=1 << 20, closefd=False)
+    start = time.perf_counter()
+    with source, out:
+        count = run_batch(source, out, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    if args.stats:
+        rate = count / elapsed if elapsed else 0
+        print(f"{count} expressions in {elapsed:.2f}s ({rate:,.0f} expr/s)", file=sys.stderr)
+
+
 def main():
+    if sys.argv[1:2] == ["--batch"]:
+        batch_main(sys.argv[2:])
+        return
+
     calculator = Calculator()
     if len(sys.argv) <= 1:
         print("Calculator App")
         print('Usage: python main.py "<expression>"')
+        print('       python main.py --batch [FILE] [--workers N] [--stats]')
         print('Example: python main.py "3 + 5"')
         return
 
@@ -0,0 +1,78 @@
+# batch.py
+
+from collections import deque
+from itertools import islice
+
+from pkg.calculator import Calculator
+from pkg.render import format_json_line
+
+# Expressions evaluated together, and handed to a worker at once with --workers.
+CHUNK_SIZE = 10000
+
+EMPTY_ERROR = "Expression is empty or contains only whitespace."
+
+_calculator = None
+
+
+def evaluate_chunk(lines):
+    """Evaluate a list of expressions and return their NDJSON lines as one string.
+
+    A line that fails gets an "error" member instead of a "result"; the
+    chunk always produces one output line per input line.
+    """
+    global _calculator
+    if _calculator is None:
+        # One per process, so a worker keeps its compile cache between chunks.
+        _calculator = Calculator()
+    results = _calculator.evaluate_many(lines, return_exceptions=True)
+    output = []
+    append = output.append
+    for expression, result in zip(lines, results):
+        if result is None:
+            append(format_json_line(expression, error=EMPTY_ERROR))
+        elif isinstance(result, Exception):
+            append(format_json_line(expression, error=str(result)))
+        else:
+            append(format_json_line(expression, result))
+    append("")
+    return "\n".join(output)
+
+
+def _chunks(lines, chunk_size):
+    expressions = (line.rstrip("\r\n") for line in lines)
+    while True:
+        chunk = list(islice(expressions, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(lines, out, workers=1, chunk_size=CHUNK_SIZE):
+    """Evaluate one expression per line of lines and write NDJSON to out, in input order.
+
+    With workers > 1 chunks are evaluated in a process pool; at most two
+    chunks per worker are in flight, so memory stays bounded however long
+    the input is. Returns the number of expressions evaluated.
+    """
+    count = 0
+    if workers <= 1:
+        for chunk in _chunks(lines, chunk_size):
+            out.write(evaluate_chunk(chunk))
+            count += len(chunk)
+        return count
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in _chunks(lines, chunk_size):
+            pending.append((executor.submit(evaluate_chunk, chunk), len(chunk)))
+            if len(pending) >= 2 * workers:
+                future, size = pending.popleft()
+                out.write(future.result())
+                count += size
+        while pending:
+            future, size = pending.popleft()
+            out.write(future.result())
+            count += size
+    return count
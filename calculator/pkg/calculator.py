@@ -1,7 +1,19 @@
 # calculator.py
 
+import re
+from functools import lru_cache
+
+from .vectorized import evaluate_columns
+
+# Tokens inside a word that has no spaces, e.g. "3+5": a number or a
+# variable name (with any sign in front of it), or any other single character.
+_TOKEN = re.compile(r"([+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)|([+-]?[A-Za-z_]\w*)|(.)")
+# Last characters of a word float() may parse as a whole; this keeps out "inf" and "nan".
+_NUMBER_END = frozenset("0123456789.")
+
+
 class Calculator:
-    def __init__(self):
+    def __init__(self, cache_size=1024):
         self.operators = {
             "+": lambda a, b: a + b,
             "-": lambda a, b: a - b,
@@ -14,48 +26,143 @@ class Calculator:
             "*": 2,
             "/": 2,
         }
+        # Compiled programs by expression text, so a repeated expression is only evaluated.
+        self.compile = lru_cache(maxsize=cache_size)(self._compile)
 
-    def evaluate(self, expression):
+    def evaluate(self, expression, variables=None):
         if not expression or expression.isspace():
             return None
-        tokens = expression.strip().split()
-        return self._evaluate_infix(tokens)
+        return self._run(self.compile(expression), variables)
 
-    def _evaluate_infix(self, tokens):
-        values = []
-        operators = []
+    def evaluate_many(self, expressions, return_exceptions=False, variables=None):
+        """Evaluate each expression in turn and return the list of results.
 
-        for token in tokens:
-            if token in self.operators:
-                while (
-                    operators
-                    and operators[-1] in self.operators
-                    and self.precedence[operators[-1]] >= self.precedence[token]
-                ):
-                    self._apply_operator(operators, values)
-                operators.append(token)
-            else:
+        With return_exceptions, an expression that fails yields its exception
+        in place of a result instead of stopping the run.
+        """
+        compile, run = self.compile, self._run
+        results = []
+        append = results.append
+        for expression in expressions:
+            try:
+                if not expression or expression.isspace():
+                    append(None)
+                else:
+                    append(run(compile(expression), variables))
+            except (ValueError, ArithmeticError) as e:
+                if not return_exceptions:
+                    raise
+                append(e)
+        return results
+
+    def evaluate_columns(self, expression, columns, out=None):
+        """Evaluate expression once per row over columns, a mapping of variable names to equal-length columns.
+
+        Uses NumPy when it is installed and returns an array (written into out,
+        if given); otherwise evaluates row by row and returns a list. See
+        pkg.vectorized.
+        """
+        return evaluate_columns(self, expression, columns, out)
+
+    def names(self, expression):
+        """Return the variable names expression uses, in order of first use."""
+        return tuple(dict.fromkeys(item for item in self.compile(expression) if item.__class__ is str))
+
+    def tokenize(self, expression):
+        tokens = []
+        append = tokens.append
+        operators = self.operators
+        # Space-separated words are almost always a whole number or operator,
+        # which str.split and float() handle faster than a regex.
+        for word in expression.split():
+            if word in operators:
+                append(word)
+                continue
+            if word[-1] in _NUMBER_END and "_" not in word:
                 try:
-                    values.append(float(token))
+                    number = float(word)
                 except ValueError:
-                    raise ValueError(f"invalid token: {token}")
+                    pass
+                else:
+                    if word[0] in "+-" and tokens and tokens[-1] not in operators:
+                        # After an operand a sign is the operator, as in "3 -5".
+                        append(word[0])
+                        number = float(word[1:])
+                    append(number)
+                    continue
+            if word.isidentifier():
+                append(word)
+                continue
+            self._tokenize_word(word, tokens)
+        return tokens
 
-        while operators:
-            self._apply_operator(operators, values)
+    def _tokenize_word(self, word, tokens):
+        for match in _TOKEN.finditer(word):
+            number, name, other = match.groups()
+            if number:
+                if number[0] in "+-" and tokens and tokens[-1] not in self.operators:
+                    tokens.append(number[0])
+                    number = number[1:]
+                tokens.append(float(number))
+            elif name:
+                if name[0] in "+-":
+                    if tokens and tokens[-1] not in self.operators:
+                        tokens.append(name[0])
+                    elif name[0] == "-":
+                        # A negated name is one operand: the program fragment -1 name *.
+                        tokens.append((-1.0, name[1:], self.operators["*"]))
+                        continue
+                    name = name[1:]
+                tokens.append(name)
+            elif other in self.operators:
+                tokens.append(other)
+            else:
+                raise ValueError(f"invalid token: {word[match.start():]}")
 
-        if len(values) != 1:
-            raise ValueError("invalid expression")
+    def _compile(self, expression):
+        """Parse expression into a postfix program: a tuple of numbers, variable names and operator functions."""
+        functions = self.operators
+        precedence = self.precedence
+        program = []
+        operators = []
+        depth = 0
 
-        return values[0]
+        for token in self.tokenize(expression) + [None]:
+            if token is not None and token not in precedence:
+                if token.__class__ is tuple:
+                    program.extend(token)
+                else:
+                    program.append(token)
+                depth += 1
+                continue
+            # An operator, or None to flush the remaining ones at the end.
+            while operators and (token is None or precedence[operators[-1]] >= precedence[token]):
+                operator = operators.pop()
+                if depth < 2:
+                    raise ValueError(f"not enough operands for operator {operator}")
+                depth -= 1
+                program.append(functions[operator])
+            if token is not None:
+                operators.append(token)
 
-    def _apply_operator(self, operators, values):
-        if not operators:
-            return
+        if depth != 1:
+            raise ValueError("invalid expression")
 
-        operator = operators.pop()
-        if len(values) < 2:
-            raise ValueError(f"not enough operands for operator {operator}")
+        return tuple(program)
 
-        b = values.pop()
-        a = values.pop()
-        values.append(self.operators[operator](a, b))
\ No newline at end of file
+    def _run(self, program, variables=None):
+        values = []
+        push = values.append
+        pop = values.pop
+        for item in program:
+            if item.__class__ is float:
+                push(item)
+            elif item.__class__ is str:
+                try:
+                    push(variables[item])
+                except (KeyError, TypeError):
+                    raise ValueError(f"unknown variable: {item}") from None
+            else:
+                b = pop()
+                push(item(pop(), b))
+        return values[0]
@@ -1,16 +1,33 @@
 # render.py
 
 import json
+import math
+from json.encoder import encode_basestring_ascii
 
 
-def format_json_output(expression: str, result: float, indent: int = 2) -> str:
+def _result_to_dump(result: float):
     if isinstance(result, float) and result.is_integer():
-        result_to_dump = int(result)
-    else:
-        result_to_dump = result
+        return int(result)
+    return result
+
 
+def format_json_output(expression: str, result: float, indent: int = 2) -> str:
     output_data = {
         "expression": expression,
-        "result": result_to_dump,
+        "result": _result_to_dump(result),
     }
-    return json.dumps(output_data, indent=indent)
\ No newline at end of file
+    return json.dumps(output_data, indent=indent)
+
+
+def format_json_line(expression: str, result: float = None, error: str = None) -> str:
+    """Return one compact JSON object for batch output, with either the result or the error.
+
+    The text is what json.dumps(..., separators=(",", ":")) produces, built
+    directly because batch mode writes one per expression. JSON has no
+    infinity or NaN, so a result that is not finite is reported as an error.
+    """
+    if error is None and isinstance(result, float) and not math.isfinite(result):
+        error = f"Result is not a finite number: {result!r}"
+    if error is not None:
+        return '{"expression":' + encode_basestring_ascii(expression) + ',"error":' + encode_basestring_ascii(error) + "}"
+    return '{"expression":' + encode_basestring_ascii(expression) + ',"result":' + repr(_result_to_dump(result)) + "}"
@@ -0,0 +1,146 @@
+# vectorized.py
+
+import csv
+import math
+
+# NumPy ufuncs for the calculator's operators. An operator missing here is
+# applied through its Python function, which works on arrays but allocates.
+UFUNCS = {
+    "+": "add",
+    "-": "subtract",
+    "*": "multiply",
+    "/": "divide",
+}
+
+_numpy_module = None
+
+
+def _numpy():
+    """Return numpy, or None if it is not installed; imported on first use."""
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy_module = numpy
+    return _numpy_module or None
+
+
+def read_columns(f, names=None):
+    """Read CSV text with a header row into {column name: list of values}.
+
+    Only the columns in names are kept when it is given; values stay strings
+    and are converted when the expression is evaluated.
+    """
+    reader = csv.reader(f)
+    header = next(reader, [])
+    wanted = [i for i, name in enumerate(header) if names is None or name in names]
+    missing = set(names or ()) - set(header)
+    if missing:
+        raise ValueError(f"no column named {', '.join(sorted(missing))}")
+    columns = [[] for _ in wanted]
+    appends = [column.append for column in columns]
+    for row in reader:
+        for append, i in zip(appends, wanted):
+            append(row[i])
+    return {header[i]: column for i, column in zip(wanted, columns)}
+
+
+def evaluate_columns(calculator, expression, columns, out=None):
+    """Evaluate expression once per row, taking variables from columns.
+
+    With NumPy the compiled program runs once over whole columns: each
+    operator is a ufunc writing into a buffer that is allocated once per
+    stack slot (slot 0 being out, if given) and then updated in place, so
+    no temporary is created per operation. Constant subexpressions are
+    computed once. Without NumPy the program runs row by row in Python and a
+    list is returned. Either way division by zero gives inf or nan in that
+    row, as NumPy does.
+    """
+    program = calculator.compile(expression)
+    names = calculator.names(expression)
+    missing = [name for name in names if name not in columns]
+    if missing:
+        raise ValueError(f"unknown variable: {missing[0]}")
+    lengths = {len(columns[name]) for name in names} or {len(column) for column in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("columns have different lengths")
+    if not lengths:
+        raise ValueError("no columns to take the number of rows from")
+    (length,) = lengths
+
+    np = _numpy()
+    if np is None:
+        return _evaluate_rows(calculator, program, names, columns, length)
+    return _evaluate_arrays(np, calculator, program, names, columns, length, out)
+
+
+def _divide(a, b):
+    """Divide as NumPy does: x/0 is inf with the sign of x and of the zero, 0/0 is nan."""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def _evaluate_rows(calculator, program, names, columns, length):
+    run = calculator._run
+    divide = calculator.operators["/"]
+    program = tuple(_divide if item is divide else item for item in program)
+    results = []
+    append = results.append
+    for values in zip(*(columns[name] for name in names)) if names else [()] * length:
+        append(run(program, dict(zip(names, map(float, values)))))
+    return results
+
+
+def _evaluate_arrays(np, calculator, program, names, columns, length, out):
+    symbols = {function: symbol for symbol, function in calculator.operators.items()}
+    arrays = {name: np.asarray(columns[name], dtype=np.float64) for name in names}
+    if out is not None and out.shape != (length,):
+        raise ValueError(f"out has shape {out.shape}, expected ({length},)")
+    buffers = [out]
+
+    def buffer(slot):
+        while len(buffers) <= slot:
+            buffers.append(None)
+        if buffers[slot] is None:
+            buffers[slot] = np.empty(length)
+        return buffers[slot]
+
+    # Each entry is (value, owned): owned values are buffers of this run that may be overwritten.
+    stack = []
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for item in program:
+            if item.__class__ is float:
+                stack.append((item, False))
+                continue
+            if item.__class__ is str:
+                stack.append((arrays[item], False))
+                continue
+            b, _ = stack.pop()
+            a, owned = stack.pop()
+            name = UFUNCS.get(symbols.get(item))
+            ufunc = getattr(np, name) if name else None
+            if a.__class__ is float and b.__class__ is float:
+                stack.append((float(ufunc(a, b)) if ufunc else item(a, b), False))
+            elif ufunc is None:
+                stack.append((item(a, b), True))
+            else:
+                target = a if owned else buffer(len(stack))
+                ufunc(a, b, out=target)
+                stack.append((target, True))
+
+    ((result, owned),) = stack
+    if out is not None:
+        if result is not out:
+            out[...] = result
+        return out
+    if owned:
+        return result
+    full = np.empty(length)
+    full[...] = result
+    return full
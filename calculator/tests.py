@@ -1,7 +1,12 @@
 # tests.py
 
+import io
+import json
 import unittest
 from pkg.calculator import Calculator
+from pkg import vectorized
+from pkg.batch import run_batch
+from pkg.render import format_json_line
 
 
 class TestCalculator(unittest.TestCase):
@@ -44,6 +49,150 @@ class TestCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.calculator.evaluate("+ 3")
 
+    def test_tokens_without_spaces(self):
+        self.assertEqual(self.calculator.evaluate("3+5"), 8)
+        self.assertEqual(self.calculator.evaluate("10/4"), 2.5)
+
+    def test_signed_and_decimal_numbers(self):
+        self.assertEqual(self.calculator.evaluate("-3 * 2"), -6)
+        self.assertEqual(self.calculator.evaluate("3 * -2"), -6)
+        self.assertEqual(self.calculator.evaluate("1.5e2 / .5"), 300)
+
+    def test_invalid_token_inside_a_word(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("3x + 1")
+
+    def test_compiled_expression_is_cached(self):
+        self.calculator.evaluate("3 * 4")
+        self.calculator.evaluate("3 * 4")
+        self.assertEqual(self.calculator.compile.cache_info().hits, 1)
+        self.assertIs(self.calculator.compile("3 * 4"), self.calculator.compile("3 * 4"))
+
+    def test_evaluate_many(self):
+        self.assertEqual(self.calculator.evaluate_many(["3 + 5", "10 / 2", " "]), [8, 5, None])
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate_many(["1 / 0", "3 + 5"])
+        results = self.calculator.evaluate_many(["1 / 0", "$", "3 + 5"], return_exceptions=True)
+        self.assertIsInstance(results[0], ZeroDivisionError)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 8)
+
+
+class TestVariables(unittest.TestCase):
+    def setUp(self):
+        self.calculator = Calculator()
+        self.columns = {"price": [2.0, 3.0, 4.0], "qty": [1.0, 2.0, 3.0], "discount": [0.5, 1.0, 0.0]}
+
+    def test_named_variables(self):
+        self.assertEqual(self.calculator.evaluate("price * qty - discount", {"price": 2, "qty": 3, "discount": 1}), 5)
+        self.assertEqual(self.calculator.evaluate("a-2", {"a": 5}), 3)
+        self.assertEqual(self.calculator.names("a * b - a"), ("a", "b"))
+
+    def test_negated_variables(self):
+        variables = {"x": 2, "y": 4}
+        self.assertEqual(self.calculator.evaluate("2 * -x", variables), -4)
+        self.assertEqual(self.calculator.evaluate("3 - -x", variables), 5)
+        self.assertEqual(self.calculator.evaluate("y / -x", variables), -2)
+        self.assertEqual(self.calculator.evaluate("-x * y", variables), -8)
+        self.assertEqual(self.calculator.evaluate("2*-x", variables), -4)
+        self.assertEqual(self.calculator.evaluate("+x * 2", variables), 4)
+        # After an operand the sign is the operator, as it is for numbers.
+        self.assertEqual(self.calculator.evaluate("y -x", variables), 2)
+        self.assertEqual(self.calculator.evaluate("y-x", variables), 2)
+        self.assertEqual(self.calculator.names("-x * y - x"), ("x", "y"))
+        self.assertEqual(list(self.calculator.evaluate_columns("2 * -qty", self.columns)), [-2.0, -4.0, -6.0])
+
+    def test_unknown_variable(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("price * 2")
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate_columns("price * tax", self.columns)
+
+    @unittest.skipIf(vectorized._numpy() is None, "NumPy is not installed")
+    def test_columns_with_numpy(self):
+        import numpy as np
+
+        columns = {name: np.array(values) for name, values in self.columns.items()}
+        result = self.calculator.evaluate_columns("price * qty - discount", columns)
+        self.assertEqual(result.tolist(), [1.5, 5.0, 12.0])
+        out = np.empty(3)
+        self.assertIs(self.calculator.evaluate_columns("qty * 2", columns, out), out)
+        self.assertEqual(out.tolist(), [2.0, 4.0, 6.0])
+        self.assertEqual(self.calculator.evaluate_columns("price", columns).tolist(), [2.0, 3.0, 4.0])
+        self.assertEqual(columns["price"].tolist(), [2.0, 3.0, 4.0])
+
+    def test_columns_without_numpy(self):
+        saved = vectorized._numpy_module
+        vectorized._numpy_module = False
+        try:
+            result = self.calculator.evaluate_columns("price * qty - discount", self.columns)
+        finally:
+            vectorized._numpy_module = saved
+        self.assertEqual(result, [1.5, 5.0, 12.0])
+
+    def test_division_by_zero_matches_numpy(self):
+        columns = {"a": [1.0, -1.0, 0.0, 2.0, 3.0], "b": [0.0, 0.0, 0.0, -0.0, 2.0]}
+        expected = ["inf", "-inf", "nan", "-inf", "1.5"]
+        saved = vectorized._numpy_module
+        vectorized._numpy_module = False
+        try:
+            result = self.calculator.evaluate_columns("a / b", columns)
+        finally:
+            vectorized._numpy_module = saved
+        self.assertEqual([repr(value) for value in result], expected)
+        if vectorized._numpy() is not None:
+            result = self.calculator.evaluate_columns("a / b", columns)
+            self.assertEqual([repr(value) for value in result.tolist()], expected)
+
+    def test_columns_from_csv(self):
+        csv_text = "price,qty,discount,note\n2,1,0.5,a\n3,2,1,b\n"
+        columns = vectorized.read_columns(io.StringIO(csv_text), ["price", "qty", "discount"])
+        self.assertEqual(set(columns), {"price", "qty", "discount"})
+        self.assertEqual(list(self.calculator.evaluate_columns("price * qty - discount", columns)), [1.5, 5.0])
+
+
+class TestBatch(unittest.TestCase):
+    lines = ["3 + 5\n", "\n", "1 / 0\n", "$ 3\n", "10 / 4"]
+
+    def expected(self):
+        return [
+            {"expression": "3 + 5", "result": 8},
+            {"expression": "", "error": "Expression is empty or contains only whitespace."},
+            {"expression": "1 / 0", "error": "float division by zero"},
+            {"expression": "$ 3", "error": "invalid token: $"},
+            {"expression": "10 / 4", "result": 2.5},
+        ]
+
+    def test_errors_are_reported_per_line(self):
+        out = io.StringIO()
+        self.assertEqual(run_batch(self.lines, out), 5)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], self.expected())
+
+    def test_workers_keep_the_input_order(self):
+        out = io.StringIO()
+        run_batch(self.lines * 3, out, workers=2, chunk_size=2)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], self.expected() * 3)
+
+    def test_lines_match_json_dumps(self):
+        for expression, result in [("3 + 5", 8.0), ("\u00e9 \"q\"", 0.1), ("x", -2.5e-300)]:
+            self.assertEqual(format_json_line(expression, result),
+                             json.dumps({"expression": expression, "result": result if result != 8.0 else 8},
+                                        separators=(",", ":")))
+        self.assertEqual(format_json_line("1 / 0", error="float division by zero"),
+                         '{"expression":"1 / 0","error":"float division by zero"}')
+
+    def test_non_finite_results_are_errors(self):
+        def strict(constant):
+            raise ValueError(f"not valid JSON: {constant}")
+
+        out = io.StringIO()
+        run_batch(["1e308 * 10\n", "0 - 1e308 * 10\n"], out)
+        lines = [json.loads(line, parse_constant=strict) for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[0], {"expression": "1e308 * 10", "error": "Result is not a finite number: inf"})
+        self.assertEqual(lines[1]["error"], "Result is not a finite number: -inf")
+        self.assertEqual(json.loads(format_json_line("y", float("nan")), parse_constant=strict),
+                         {"expression": "y", "error": "Result is not a finite number: nan"})
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
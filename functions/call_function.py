@@ -1,16 +1,128 @@
 import os
 import json
-from typing import Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
 
-try:
-    from google.genai import types
-except Exception:
-    types = None
+from functions.registry import registry, ToolArgumentError
+from functions.search_files import notify_write
+from functions.workspace import invalidate_resolutions
+from functions.config import TOOL_CACHE_MAX_BYTES, WORKING_DIRECTORY
+from functions.tracing import span
 
-from functions.get_files_info import get_files_info
-from functions.get_file_content import get_file_content
-from functions.run_python_file import run_python_file
-from functions.write_file import write_file
+# Upper bound on tool calls executed at once for a single model turn.
+MAX_PARALLEL_CALLS = 8
+
+# Name -> Tool for every registered tool; a call is one dict lookup.
+TOOLS = registry.load().tools
+
+# Tools that modify the working tree; calls to these on the same path keep
+# the order the model requested them in.
+MUTATING_FUNCTIONS = registry.names(mutating=True)
+
+# Tools that touch several paths at once; a turn containing one runs every
+# call in order instead of in parallel.
+SEQUENTIAL_FUNCTIONS = registry.names(sequential=True)
+
+# Read-only tools whose results can be served from the cache. Listings are
+# not among them: a file growing or appearing in a subdirectory leaves the
+# listed directory's own stat unchanged, so nothing cheaper than the walk
+# itself could tell that a cached listing is stale.
+CACHEABLE_FUNCTIONS = registry.names(cacheable=True)
+
+
+class ToolResultCache:
+    """LRU cache of read-only tool results, bounded by the total size of the results.
+
+    Entries are keyed on the function name, the normalised arguments and the
+    identity (mtime_ns, size, inode) of the one file they read, so a file
+    changed behind the agent's back misses as long as the change moves its
+    mtime or size. That is only sound for tools whose result depends on that
+    file alone (see Tool.cacheable). Writes made through the tools invalidate
+    affected entries explicitly.
+    """
+
+    def __init__(self, max_bytes: int = TOOL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(function_name: str, kwargs: dict):
+        """Return the cache key for a call, or None when the target cannot be stat'ed."""
+        working_directory = kwargs.get('working_directory', '.')
+        path = os.path.normpath(kwargs.get('file_path') or '.')
+        try:
+            st = os.stat(os.path.join(working_directory, path))
+        except OSError:
+            return None
+        args = {k: v for k, v in kwargs.items() if k != 'working_directory'}
+        return (
+            function_name,
+            os.path.normpath(working_directory),
+            path,
+            json.dumps(args, sort_keys=True, default=str),
+            (st.st_mtime_ns, st.st_size, st.st_ino),
+        )
+
+    def get(self, key):
+        """Return (True, result) on a hit and (False, None) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, result):
+        size = len(result) if isinstance(result, (str, bytes)) else len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def invalidate(self, working_directory: str, path: str = None):
+        """Drop entries for `path` and, when it is a directory, for everything below it.
+
+        With no path, every entry under working_directory is dropped.
+        """
+        working_directory = os.path.normpath(working_directory)
+        target = os.path.normpath(path) if path is not None else None
+        with self._lock:
+            for key in list(self._entries):
+                if key[1] != working_directory:
+                    continue
+                cached_path = key[2]
+                if target is None or cached_path == target or cached_path.startswith(target + os.sep):
+                    _, size = self._entries.pop(key)
+                    self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> str:
+        with self._lock:
+            return f"{self.hits} hits, {self.misses} misses, {len(self._entries)} entries, {self._bytes} bytes"
+
+
+tool_cache = ToolResultCache()
 
 
 def call_function(function_call_part, verbose: bool = False) -> Any:
@@ -22,7 +134,11 @@ def call_function(function_call_part, verbose: bool = False) -> Any:
     Returns a types.Content with from_function_response describing the result or error when types is available.
     If types is not available, returns a simple dict with the result.
     """
+    with span('call_function', 'dispatch', function=getattr(function_call_part, 'name', None)):
+        return _call_function(function_call_part, verbose)
 
+
+def _call_function(function_call_part, verbose: bool = False) -> Any:
     # Extract function name
     function_name = getattr(function_call_part, 'name', None)
     raw_args = getattr(function_call_part, 'args', None)
@@ -33,74 +149,139 @@ def call_function(function_call_part, verbose: bool = False) -> Any:
     else:
         print(f" - Calling function: {function_name}")
 
-    # Parse args: sometimes args are provided as a JSON string
-    kwargs = {}
-    if raw_args:
-        if isinstance(raw_args, str):
-            try:
-                kwargs = json.loads(raw_args)
-            except Exception:
-                # fallback: not JSON, leave as empty or attempt eval? keep safe
-                kwargs = {}
-        elif isinstance(raw_args, dict):
-            kwargs = raw_args.copy()
-
-    # Ensure working_directory is injected and cannot be overridden by the LLM
-    kwargs['working_directory'] = os.path.join('.', 'calculator')
+    tool = TOOLS.get(function_name)
+    if tool is None:
+        err_msg = f"Unknown function: {function_name}"
+        return _function_response(function_name, {"error": err_msg})
 
-    # Map function names to actual callables
-    function_map = {
-        'get_files_info': get_files_info,
-        'get_file_content': get_file_content,
-        'run_python_file': run_python_file,
-        'write_file': write_file,
-    }
+    # Validate and coerce the arguments (a dict, or sometimes a JSON string)
+    # against the tool's signature.
+    try:
+        kwargs = tool.bind(raw_args)
+    except ToolArgumentError as e:
+        return _function_response(function_name, {"error": f"Invalid arguments for {function_name}: {e}"})
 
-    if function_name not in function_map:
-        err_msg = f"Unknown function: {function_name}"
-        if types is not None:
-            return types.Content(
-                role="tool",
-                parts=[
-                    types.Part.from_function_response(
-                        name=function_name,
-                        response={"error": err_msg},
-                    )
-                ],
-            )
-        return {"error": err_msg}
+    # Ensure working_directory is injected and cannot be overridden by the LLM
+    kwargs['working_directory'] = WORKING_DIRECTORY
 
-    func = function_map[function_name]
+    cache_key = ToolResultCache.key(function_name, kwargs) if tool.cacheable else None
+    if cache_key is not None:
+        hit, result = tool_cache.get(cache_key)
+        if hit:
+            if verbose:
+                print(f"Cache hit: {function_name}")
+            return _function_response(function_name, {"result": result})
 
     try:
-        result = func(**kwargs)
+        with span(function_name, 'tool') as tool_span:
+            result = tool.func(**kwargs)
+            tool_span.set(result_chars=len(result) if isinstance(result, str) else None)
     except Exception as e:
         err_msg = f"Error executing function {function_name}: {e}"
-        if types is not None:
+        return _function_response(function_name, {"error": err_msg})
+
+    if cache_key is not None:
+        tool_cache.put(cache_key, result)
+    elif tool.mutating and not (isinstance(result, str) and result.startswith('Error:')):
+        # A write only affects its own paths; a script run may have touched anything.
+        for path in tool.writes(kwargs):
+            tool_cache.invalidate(kwargs['working_directory'], path)
+            notify_write(kwargs['working_directory'], path)
+            invalidate_resolutions(kwargs['working_directory'], path)
+
+    return _function_response(function_name, {"result": result})
+
+
+_genai_types = None
+
+
+def _types():
+    """Return google.genai.types, or None if it is not installed; imported on first use."""
+    global _genai_types
+    if _genai_types is None:
+        try:
+            from google.genai import types
+        except Exception:
+            types = False
+        _genai_types = types
+    return _genai_types or None
+
+
+def _function_response(function_name, response_dict):
+    """Wrap a response dict the way call_function returns it."""
+    types = _types()
+    if types is not None:
+        with span('wrap_result', 'dispatch'):
             return types.Content(
                 role="tool",
                 parts=[
                     types.Part.from_function_response(
                         name=function_name,
-                        response={"error": err_msg},
+                        response=response_dict,
                     )
                 ],
             )
-        return {"error": err_msg}
 
-    # Ensure the response is serializable: wrap into dict
-    response_dict = {"result": result}
+    return response_dict
 
-    if types is not None:
-        return types.Content(
-            role="tool",
-            parts=[
-                types.Part.from_function_response(
-                    name=function_name,
-                    response=response_dict,
-                )
-            ],
-        )
 
-    return response_dict
+def _call_path(function_call_part):
+    """Return the normalised path a function call targets, or None."""
+    raw_args = getattr(function_call_part, 'args', None)
+    if isinstance(raw_args, str):
+        try:
+            raw_args = json.loads(raw_args)
+        except Exception:
+            raw_args = None
+    if not isinstance(raw_args, dict):
+        return None
+    path = raw_args.get('file_path', raw_args.get('directory'))
+    if not isinstance(path, str):
+        return None
+    return os.path.normpath(path)
+
+
+def call_functions(function_calls, verbose: bool = False, max_workers: int = MAX_PARALLEL_CALLS) -> List[Any]:
+    """Invoke every function call of a model turn and return the results in request order.
+
+    Independent calls run concurrently on a bounded thread pool. Calls that
+    touch a path also targeted by a write or execution in the same turn are
+    chained so they run one after another in the order they were requested.
+    """
+    function_calls = list(function_calls or [])
+    with span('call_functions', 'dispatch', calls=len(function_calls)):
+        return _call_functions(function_calls, verbose, max_workers)
+
+
+def _call_functions(function_calls, verbose, max_workers):
+    if (len(function_calls) <= 1 or max_workers <= 1
+            or any(getattr(fc, 'name', None) in SEQUENTIAL_FUNCTIONS for fc in function_calls)):
+        return [call_function(fc, verbose=verbose) for fc in function_calls]
+
+    # Paths that are written to or executed in this turn must be serialised.
+    ordered_paths = set()
+    for fc in function_calls:
+        if getattr(fc, 'name', None) in MUTATING_FUNCTIONS:
+            path = _call_path(fc)
+            if path is not None:
+                ordered_paths.add(path)
+
+    # Group call indexes into chains; each chain runs sequentially.
+    chains = {}
+    for index, fc in enumerate(function_calls):
+        path = _call_path(fc)
+        key = ('path', path) if path in ordered_paths else ('call', index)
+        chains.setdefault(key, []).append(index)
+
+    results = [None] * len(function_calls)
+
+    def run_chain(indexes):
+        for i in indexes:
+            results[i] = call_function(function_calls[i], verbose=verbose)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chains))) as pool:
+        futures = [pool.submit(run_chain, indexes) for indexes in chains.values()]
+        for future in futures:
+            future.result()
 
+    return results
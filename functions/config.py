@@ -1 +1,57 @@
+import os
+
+# Directory every tool call is confined to; the model cannot override it.
+WORKING_DIRECTORY = os.environ.get('AGENT_WORKING_DIRECTORY', os.path.join('.', 'calculator'))
+
 MAX_FILE_CHARS = 10000
+
+# Files at least this large are scanned through mmap when seeking to a line.
+MMAP_THRESHOLD = 1024 * 1024
+
+# Default number of entries returned by one get_files_info call.
+DEFAULT_LIST_LIMIT = 1000
+
+# Upper bound on the total size of cached read-only tool results.
+TOOL_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Path resolutions remembered by each working directory's Workspace.
+WORKSPACE_CACHE_SIZE = 4096
+
+# Persistent search_files indexes live here, one file per working directory.
+SEARCH_INDEX_DIR = os.environ.get(
+    'AGENT_SEARCH_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'python_ai_agent', 'search')
+)
+
+# Files larger than this are not indexed or searched.
+SEARCH_MAX_FILE_BYTES = 1024 * 1024
+
+# Seconds between full rescans of the tree; writes made through the tools
+# are picked up immediately.
+SEARCH_REFRESH_INTERVAL = 2.0
+
+# Default number of matching lines returned by search_files.
+SEARCH_MAX_RESULTS = 50
+
+# Number of warm interpreters used by run_python_file; 0 starts a new
+# interpreter per run instead.
+PYTHON_POOL_SIZE = int(os.environ.get('AGENT_PYTHON_POOL', '0'))
+
+# Warm interpreters are replaced after this many runs.
+PYTHON_POOL_MAX_RUNS = 50
+
+# Modules imported once by each warm interpreter before it starts forking runs.
+PYTHON_POOL_PRELOAD = tuple(filter(None, os.environ.get(
+    'AGENT_PYTHON_POOL_PRELOAD',
+    'argparse,collections,dataclasses,datetime,decimal,fractions,functools,itertools,'
+    'json,math,pathlib,random,re,typing,unittest',
+).split(',')))
+
+# Limits applied to each run_python_file call. CPU and memory limits are
+# enforced with rlimits where available; None leaves them unlimited.
+RUN_TIMEOUT_SECONDS = 30
+RUN_CPU_SECONDS = None
+RUN_MEMORY_BYTES = None
+
+# Bytes of stdout/stderr kept from the start and the end of a run's output.
+RUN_OUTPUT_HEAD_BYTES = 4000
+RUN_OUTPUT_TAIL_BYTES = 4000
@@ -1,68 +1,196 @@
 import os
-from .config import MAX_FILE_CHARS
-try:
-    from google.genai import types
-except Exception:
-    types = None
+import stat
+import codecs
+import mmap
+from typing import Annotated
+from .config import MAX_FILE_CHARS, MMAP_THRESHOLD
+from .registry import tool
+from .workspace import OutsideWorkspaceError, get_workspace
 
 
-def get_file_content(working_directory, file_path):
+def _decode(data, final=False):
+    """Decode UTF-8 bytes, leaving an incomplete trailing character undecoded.
+
+    Returns (text, consumed) where consumed is the number of bytes decoded.
+    With final=True, as at the end of the file, every byte is decoded and an
+    incomplete character becomes U+FFFD.
+    """
+    if final:
+        return data.decode('utf-8', errors='replace'), len(data)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    text = decoder.decode(data, final=False)
+    pending = decoder.getstate()[0]
+    return text, len(data) - len(pending)
+
+
+def _line_start(f, size, line):
+    """Return the byte offset at which 1-based `line` starts, or None past EOF.
+
+    Large files are scanned through mmap so the newline search runs in C
+    without reading the file into Python objects.
+    """
+    if line <= 1:
+        return 0
+    if size == 0:
+        return None
+    if size >= MMAP_THRESHOLD:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            for _ in range(line - 1):
+                pos = mm.find(b'\n', pos)
+                if pos < 0:
+                    return None
+                pos += 1
+            return pos if pos < size else None
+    f.seek(0)
+    pos = 0
+    for _ in range(line - 1):
+        chunk = f.readline()
+        if not chunk.endswith(b'\n'):
+            return None
+        pos += len(chunk)
+    return pos if pos < size else None
+
+
+def _read_lines(f, size, file_path, start_line, end_line):
+    """Read whole lines start_line..end_line (inclusive), bounded by MAX_FILE_CHARS bytes."""
+    start = _line_start(f, size, start_line)
+    if start is None:
+        return f'Error: "{file_path}" has fewer than {start_line} lines'
+
+    f.seek(start)
+    chunks = []
+    used = 0
+    line = start_line
+    while end_line is None or line <= end_line:
+        chunk = f.readline(MAX_FILE_CHARS - used + 1)
+        if not chunk:
+            return _decode(b''.join(chunks), final=True)[0]
+        if used + len(chunk) > MAX_FILE_CHARS:
+            if not chunks:
+                # A single line longer than the limit: return its start and continue by offset.
+                text, consumed = _decode(chunk[:MAX_FILE_CHARS])
+                return text + (
+                    f"[...Line {line} of \"{file_path}\" is longer than {MAX_FILE_CHARS} characters. "
+                    f"Call get_file_content with offset={start + consumed} to read more.]"
+                )
+            break
+        chunks.append(chunk)
+        used += len(chunk)
+        line += 1
+    else:
+        return _decode(b''.join(chunks))[0]
+
+    text = _decode(b''.join(chunks))[0]
+    if end_line is None:
+        rest = f"start_line={line} to read more"
+    else:
+        rest = f"start_line={line}, end_line={end_line} to read the rest of the requested lines"
+    return text + (
+        f"[...Lines {start_line}-{line - 1} of \"{file_path}\" shown; the next line would pass the "
+        f"{MAX_FILE_CHARS} character limit. Call get_file_content with {rest}.]"
+    )
+
+
+@tool(
+    f"Reads a file inside the working directory. At most {MAX_FILE_CHARS} characters are returned per call; "
+    "use offset/length or start_line/end_line to read a specific part of a large file.",
+    cacheable=True,
+)
+def get_file_content(
+    working_directory,
+    file_path: Annotated[str, "Path to the file relative to the working directory."],
+    offset: Annotated[int, "Byte offset to start reading from. Cannot be combined with start_line/end_line."] = None,
+    length: Annotated[int, f"Maximum number of bytes to read from offset (capped at {MAX_FILE_CHARS})."] = None,
+    start_line: Annotated[int, "First line to read, 1-based."] = None,
+    end_line: Annotated[int, "Last line to read, inclusive. Defaults to reading as far as the size limit allows."] = None,
+    head_tail: Annotated[bool, "For files over the size limit, return the beginning and the end of the file "
+                               "with the middle omitted."] = False,
+):
     """Read and return the contents of a file inside working_directory.
 
+    At most MAX_FILE_CHARS bytes are read, whatever the size of the file:
+      - offset/length: read a byte range starting at `offset`
+      - start_line/end_line: read 1-based lines, end_line inclusive
+      - head_tail: return the start and the end of the file with the middle elided
+    Without any of these the file is read from the beginning. A truncated result
+    ends with a notice telling the model which arguments read the next chunk.
+
     Returns error strings prefixed with 'Error:' on failures.
     """
-    # Build the candidate absolute path
-    candidate = os.path.join(working_directory, file_path)
+    try:
+        offset = int(offset) if offset is not None else None
+        length = int(length) if length is not None else None
+        start_line = int(start_line) if start_line is not None else None
+        end_line = int(end_line) if end_line is not None else None
+    except (TypeError, ValueError):
+        return 'Error: offset, length, start_line and end_line must be integers'
 
-    # Resolve real paths to handle symlinks
-    base_real = os.path.realpath(working_directory)
-    target_real = os.path.realpath(candidate)
+    if (offset is not None or length is not None) and (start_line is not None or end_line is not None):
+        return 'Error: Use either offset/length or start_line/end_line, not both'
+    if (offset is not None and offset < 0) or (length is not None and length < 0):
+        return 'Error: offset and length must not be negative'
+    if (start_line is not None and start_line < 1) or (end_line is not None and end_line < 1):
+        return 'Error: start_line and end_line must be 1 or greater'
 
     try:
-        common = os.path.commonpath([base_real, target_real])
-    except Exception:
+        # O_NONBLOCK keeps a FIFO from blocking the open; it is rejected just below.
+        fd = get_workspace(working_directory).open(file_path, os.O_RDONLY | os.O_NONBLOCK)
+    except OutsideWorkspaceError:
         return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
-
-    if common != base_real:
-        return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
-
-    # Ensure the target exists and is a regular file
-    if not os.path.exists(target_real) or not os.path.isfile(target_real):
+    except OSError:
         return f'Error: File not found or is not a regular file: "{file_path}"'
 
     try:
-        with open(target_real, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
+        with os.fdopen(fd, 'rb') as f:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode):
+                return f'Error: File not found or is not a regular file: "{file_path}"'
+            os.set_blocking(fd, True)
+            size = st.st_size
+
+            if start_line is not None or end_line is not None:
+                return _read_lines(f, size, file_path, start_line or 1, end_line)
+
+            if head_tail and offset is None and size > MAX_FILE_CHARS:
+                half = MAX_FILE_CHARS // 2
+                head = _decode(f.read(half))[0]
+                f.seek(size - half)
+                tail = f.read(half).decode('utf-8', errors='replace')
+                return (
+                    head
+                    + f"\n[...{size - 2 * half} bytes of \"{file_path}\" omitted. "
+                    f"Call get_file_content with offset/length or start_line/end_line to read them.]\n"
+                    + tail
+                )
+
+            start = offset or 0
+            limit = MAX_FILE_CHARS if length is None else min(length, MAX_FILE_CHARS)
+            f.seek(start)
+            data = f.read(limit)
     except Exception as e:
         return f'Error: {str(e)}'
 
-    # Truncate if too long
-    if len(content) > MAX_FILE_CHARS:
-        truncated = content[:MAX_FILE_CHARS]
-        truncated += f"[...File \"{file_path}\" truncated at {MAX_FILE_CHARS} characters]"
-        return truncated
-
-    return content
-
-# Function declaration/schema for use by an LLM
-if types is not None:
-    schema_get_file_content = types.FunctionDeclaration(
-        name="get_file_content",
-        description="Reads the contents of a file in the specified directory.",
-        parameters=types.Schema(
-            type=types.Type.OBJECT,
-            properties={
-                "directory": types.Schema(
-                    type=types.Type.STRING,
-                    description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-                ),
-            },
-        ),
-    )
+    content, consumed = _decode(data, final=start + len(data) >= size)
+    if data and not consumed:
+        # The range ends inside its first character; return it replaced
+        # rather than a notice pointing back at the same offset.
+        content, consumed = _decode(data, final=True)
+    end = start + consumed
 
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_file_content,
-        ]
+    # A requested length within the limit was read in full: no notice.
+    if end >= size or (length is not None and length <= MAX_FILE_CHARS):
+        return content
+    if offset is None and length is None:
+        return content + (
+            f"[...File \"{file_path}\" truncated at {MAX_FILE_CHARS} characters. "
+            f"Call get_file_content with offset={end} to read more.]"
+        )
+    if length is None:
+        rest = f"offset={end} to read more"
+    else:
+        rest = f"offset={end}, length={length - consumed} to read the rest of the requested range"
+    return content + (
+        f"[...Read {consumed} bytes of \"{file_path}\" from offset {start}; at most {MAX_FILE_CHARS} are read "
+        f"per call. Call get_file_content with {rest}.]"
     )
-
@@ -1,152 +1,222 @@
 import os
-import sys
-from datetime import datetime
-try:
-    from google.genai import types
-except Exception:
-    types = None
+from fnmatch import fnmatchcase
+from typing import Annotated, List
+from .config import DEFAULT_LIST_LIMIT
+from .registry import tool
+from .workspace import DIRECTORY_FLAGS, OutsideWorkspaceError, get_workspace
 
 
-def get_files_info(working_directory, directory="."):
+class _GitIgnore:
+    """Minimal .gitignore matcher covering the common pattern forms.
+
+    Supports comments, negation (!), directory-only patterns (trailing /),
+    anchored patterns (leading or inner /) and ** wildcards. Rules from
+    nested .gitignore files apply relative to the directory they live in,
+    and the last matching rule wins, as in git.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    def extended(self, dir_fd, base_rel):
+        """Return a matcher that also includes the rules of the .gitignore in directory dir_fd."""
+        try:
+            fd = os.open('.gitignore', os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC, dir_fd=dir_fd)
+            with open(fd, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return self
+        rules = list(self.rules)
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.strip('/') if dir_only else line
+            anchored = '/' in line
+            line = line.lstrip('/')
+            if line:
+                rules.append((base_rel, line, negate, dir_only, anchored))
+        return _GitIgnore(rules)
+
+    def ignored(self, relpath, is_dir):
+        result = False
+        name = relpath.rsplit('/', 1)[-1]
+        for base_rel, pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base_rel:
+                if not relpath.startswith(base_rel + '/'):
+                    continue
+                candidate = relpath[len(base_rel) + 1:]
+            else:
+                candidate = relpath
+            if anchored:
+                matched = fnmatchcase(candidate, pattern) or (
+                    '**/' in pattern and fnmatchcase(candidate, pattern.replace('**/', ''))
+                )
+            else:
+                matched = fnmatchcase(name, pattern)
+            if matched:
+                result = not negate
+        return result
+
+
+def _as_patterns(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value]
+
+
+def _matches(patterns, relpath, name):
+    return any(fnmatchcase(relpath, p) or fnmatchcase(name, p) for p in patterns)
+
+
+def _walk(dir_fd, rel, prefix, depth, depth_limit, include, exclude, gitignore):
+    """Yield (relpath, is_dir, size, link, error) for entries below the listed directory in sorted depth-first order.
+
+    dir_fd is the open directory at rel, which is relative to the listed
+    directory; prefix is the listed directory's path relative to the working
+    directory, which is what .gitignore rules are matched against. Uses
+    os.scandir so the entry type comes from the directory read itself; only
+    files need an extra fstatat for their size. Symlinks are never followed:
+    they are listed as links with their target in `link`, and directories
+    are opened relative to their parent with O_NOFOLLOW. An entry that
+    cannot be read is listed with the OSError in `error` instead of failing
+    the whole listing; for a directory that cannot be opened that is an
+    extra "dir/" entry after its own.
+    """
+    if gitignore is not None:
+        wd_rel = f"{prefix}/{rel}" if prefix and rel else (prefix or rel)
+        gitignore = gitignore.extended(dir_fd, wd_rel)
+
+    with os.scandir(dir_fd) as it:
+        entries = sorted(it, key=lambda e: e.name)
+
+    for entry in entries:
+        relpath = f"{rel}/{entry.name}" if rel else entry.name
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+        if gitignore is not None and (
+            entry.name == '.git' or gitignore.ignored(f"{prefix}/{relpath}" if prefix else relpath, is_dir)
+        ):
+            continue
+        if exclude and _matches(exclude, relpath, entry.name):
+            continue
+
+        if not include or _matches(include, relpath, entry.name):
+            try:
+                link = os.readlink(entry.name, dir_fd=dir_fd) if entry.is_symlink() else None
+                size = 0 if is_dir else entry.stat(follow_symlinks=False).st_size
+            except OSError as e:
+                yield relpath, is_dir, 0, None, e
+            else:
+                yield relpath, is_dir, size, link, None
+
+        if is_dir and (depth_limit is None or depth < depth_limit):
+            try:
+                child = os.open(entry.name, DIRECTORY_FLAGS, dir_fd=dir_fd)
+            except OSError as e:
+                yield relpath + '/', True, 0, None, e
+                continue
+            try:
+                yield from _walk(child, relpath, prefix, depth + 1, depth_limit, include, exclude, gitignore)
+            finally:
+                os.close(child)
+
+
+@tool(
+    "Lists files in the specified directory along with their sizes, constrained to the working directory. "
+    "Can list a whole tree in one call with recursive/max_depth, filtered by glob patterns and paginated.",
+)
+def get_files_info(
+    working_directory,
+    directory: Annotated[str, "The directory to list files from, relative to the working directory. If not provided, "
+                              "lists files in the working directory itself."] = ".",
+    recursive: Annotated[bool, "Also list the contents of subdirectories."] = False,
+    max_depth: Annotated[int, "How many directory levels to list; 1 lists only the directory itself."] = None,
+    include: Annotated[List[str], "Glob patterns (e.g. \"*.py\"); only matching entries are listed."] = None,
+    exclude: Annotated[List[str], "Glob patterns of entries to skip; matching directories are not descended into."] = None,
+    respect_gitignore: Annotated[bool, "Skip entries ignored by .gitignore files. Defaults to true."] = True,
+    limit: Annotated[int, f"Maximum number of entries to return (default {DEFAULT_LIST_LIMIT})."] = None,
+    cursor: Annotated[str, "Cursor from a previous call to continue a listing that was cut off."] = None,
+):
     """Return file information for `directory` which must be inside `working_directory`.
 
     working_directory: base directory (string)
     directory: relative path within working_directory to list (string)
+    recursive: also list the contents of subdirectories
+    max_depth: how many directory levels to descend (1 lists only `directory`)
+    include / exclude: glob pattern(s) matched against entry names and paths
+    respect_gitignore: skip entries ignored by .gitignore files (and .git itself)
+    limit / cursor: page size and the cursor returned by a previous call
 
     If the resolved absolute path for `directory` lies outside `working_directory`,
     return the exact error string:
         f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
 
-    Otherwise return a list of dicts, one per directory entry, with fields:
-      - name: entry name
-      - is_dir: True if entry is a directory
-      - size: size in bytes (files), 0 for directories
-      - mtime: modification time ISO string
-      - relpath: path relative to working_directory
+    Otherwise return one line per entry, with paths relative to `directory`:
+        - {path}: file_size={size} bytes, is_dir={is_dir}
+    with ", symlink to {target}" added for symbolic links (which are not
+    followed), "- {path}: (unreadable: {reason})" for entries that cannot be
+    read, and a note with the next cursor when more entries remain.
     """
+    try:
+        limit = DEFAULT_LIST_LIMIT if limit is None else max(1, int(limit))
+        skip = int(cursor) if cursor else 0
+        depth_limit = int(max_depth) if max_depth is not None else (None if recursive else 1)
+    except (TypeError, ValueError):
+        return 'Error: limit, cursor and max_depth must be integers'
 
-    # Build the candidate path by joining the base working_directory and the requested directory
-    candidate = os.path.join(working_directory, directory)
+    # .gitignore rules above the listed directory still apply to it; they are
+    # read on the way down to it.
+    gitignore = _GitIgnore() if respect_gitignore else None
 
-    # Resolve symlinks and get absolute paths for robust comparison
-    base_real = os.path.realpath(working_directory)
-    target_real = os.path.realpath(candidate)
+    def visit(parent_fd, parent_rel):
+        nonlocal gitignore
+        if gitignore is not None:
+            gitignore = gitignore.extended(parent_fd, parent_rel)
 
     try:
-        # Ensure the target stays within the base directory using commonpath
-        common = os.path.commonpath([base_real, target_real])
-    except Exception:
-        # If paths are on different drives or invalid, treat as outside
-        return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
-
-    if common != base_real:
+        workspace = get_workspace(working_directory)
+        target = workspace.resolve(directory)
+        dir_fd = workspace.open_dir(target, visit)
+    except OutsideWorkspaceError:
         return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
-
-    if not os.path.exists(target_real):
+    except FileNotFoundError:
         return f'Error: "{directory}" does not exist'
-
-    if not os.path.isdir(target_real):
+    except NotADirectoryError:
         return f'Error: "{directory}" is not a directory'
+    except OSError as e:
+        return f"Error: {str(e)}"
 
+    lines = []
+    seen = 0
     try:
-        names = sorted(os.listdir(target_real))
+        for relpath, is_dir, size, link, error in _walk(dir_fd, '', target, 1, depth_limit,
+                                                        _as_patterns(include), _as_patterns(exclude), gitignore):
+            seen += 1
+            if seen <= skip:
+                continue
+            if len(lines) == limit:
+                lines.append(f'[...more entries; call get_files_info again with cursor={skip + limit}]')
+                break
+            if error is not None:
+                lines.append(f"- {relpath}: (unreadable: {error.strerror or error})")
+            elif link is not None:
+                lines.append(f"- {relpath}: file_size={size} bytes, is_dir=False, symlink to {link}")
+            else:
+                lines.append(f"- {relpath}: file_size={size} bytes, is_dir={is_dir}")
     except Exception as e:
         return f"Error: {str(e)}"
-
-    lines = []
-    for name in names:
-        full = os.path.join(target_real, name)
-        try:
-            stat = os.stat(full)
-            is_dir = os.path.isdir(full)
-            size = stat.st_size if not is_dir else 0
-        except Exception as e:
-            return f"Error: {str(e)}"
-
-        lines.append(f"- {name}: file_size={size} bytes, is_dir={is_dir}")
+    finally:
+        os.close(dir_fd)
 
     return "\n".join(lines)
-
-
-# Function declaration/schema for use by an LLM
-if types is not None:
-    schema_get_files_info = types.FunctionDeclaration(
-        name="get_files_info",
-        description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
-        parameters=types.Schema(
-            type=types.Type.OBJECT,
-            properties={
-                "directory": types.Schema(
-                    type=types.Type.STRING,
-                    description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-                ),
-            },
-        ),
-    )
-
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_files_info,
-        ]
-    )
-    # Additional function schemas for the rest of the utilities
-    schema_get_file_content = types.FunctionDeclaration(
-        name="get_file_content",
-        description="Reads the contents of a file inside the working directory and returns it as a string (may be truncated).",
-        parameters=types.Schema(
-            type=types.Type.OBJECT,
-            properties={
-                "file_path": types.Schema(
-                    type=types.Type.STRING,
-                    description="Path to the file relative to the working directory.",
-                ),
-            },
-        ),
-    )
-
-    schema_run_python_file = types.FunctionDeclaration(
-        name="run_python_file",
-        description="Executes a Python file inside the working directory and returns captured stdout/stderr.",
-        parameters=types.Schema(
-            type=types.Type.OBJECT,
-            properties={
-                "file_path": types.Schema(
-                    type=types.Type.STRING,
-                    description="Path to the Python file relative to the working directory.",
-                ),
-                "args": types.Schema(
-                    type=types.Type.ARRAY,
-                    description="Optional list of string arguments to pass to the script.",
-                    items=types.Schema(type=types.Type.STRING),
-                ),
-            },
-        ),
-    )
-
-    schema_write_file = types.FunctionDeclaration(
-        name="write_file",
-        description="Write or overwrite a file inside the working directory with provided content.",
-        parameters=types.Schema(
-            type=types.Type.OBJECT,
-            properties={
-                "file_path": types.Schema(
-                    type=types.Type.STRING,
-                    description="Path to the file relative to the working directory.",
-                ),
-                "content": types.Schema(
-                    type=types.Type.STRING,
-                    description="The content to write to the file.",
-                ),
-            },
-        ),
-    )
-
-    # Extend available functions to include all schemas
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_files_info,
-            schema_get_file_content,
-            schema_run_python_file,
-            schema_write_file,
-        ]
-    )
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import select
+import signal
+import tempfile
+import threading
+import subprocess
+from queue import Queue, Empty
+from .config import PYTHON_POOL_SIZE, PYTHON_POOL_MAX_RUNS, PYTHON_POOL_PRELOAD
+from .process_utils import RunResult, apply_limits, peak_rss_bytes, read_bounded_file
+
+# Directory containing the `functions` package, so the worker can import us.
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bootstrap run by each worker interpreter. It keeps a copy of sys.path as a
+# fresh `python script.py` would see it before making this package importable.
+_BOOTSTRAP = (
+    "import sys; _path = list(sys.path); sys.path.insert(0, {root!r}); "
+    "from functions.interpreter_pool import _serve; _serve(_path)"
+)
+
+
+def _run_child(request, original_path):
+    """Body of a forked child: become `python target args...` and never return."""
+    code = 1
+    try:
+        os.setsid()
+        apply_limits(request.get('cpu_limit'), request.get('memory_limit'))
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        out = os.open(request['stdout'], os.O_WRONLY | os.O_TRUNC)
+        err = os.open(request['stderr'], os.O_WRONLY | os.O_TRUNC)
+        os.dup2(out, 1)
+        os.dup2(err, 2)
+        for fd in (devnull, out, err):
+            os.close(fd)
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', closefd=False)
+        sys.stderr = open(2, 'w', closefd=False)
+
+        # Forget the worker's own modules so the target sees a clean interpreter
+        # apart from the preloaded standard-library modules.
+        for name in list(sys.modules):
+            if name == 'functions' or name.startswith('functions.'):
+                del sys.modules[name]
+
+        target = request['argv'][0]
+        os.chdir(request['cwd'])
+        sys.argv = list(request['argv'])
+        sys.path[:] = [os.path.dirname(target)] + original_path[1:]
+
+        import runpy
+        try:
+            runpy.run_path(target, run_name='__main__')
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException as e:
+            import traceback
+            # Drop the runpy frames so the traceback reads like `python script.py`.
+            tb = e.__traceback__
+            while tb is not None and tb.tb_frame.f_code.co_filename != target:
+                tb = tb.tb_next
+            traceback.print_exception(type(e), e, tb or e.__traceback__)
+            code = 1
+    finally:
+        try:
+            _finalize()
+        except BaseException:
+            pass
+        os._exit(code & 0xFF if code >= 0 else 1)
+
+
+def _finalize():
+    """Do what interpreter shutdown would before the child leaves through os._exit.
+
+    As Py_Finalize does: wait for non-daemon threads, run atexit handlers, and
+    flush every open file, including ones the script never closed and stdio.
+    Files are flushed here rather than left to the garbage collector, which
+    may close a file's buffer before the text written to it has reached it.
+    """
+    import io
+    import gc
+    import atexit
+    main = threading.main_thread()
+    for thread in threading.enumerate():
+        if thread is not main and not thread.daemon:
+            thread.join()
+    atexit._run_exitfuncs()
+    for obj in gc.get_objects():
+        if isinstance(obj, (io.TextIOBase, io.BufferedIOBase)):
+            try:
+                if not obj.closed:
+                    obj.flush()
+            except Exception:
+                pass
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+
+
+def _serve(original_path):
+    """Worker main loop: preload modules, then fork one child per JSON request line."""
+    for name in PYTHON_POOL_PRELOAD:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    protocol_out = sys.stdout
+    for line in sys.stdin:
+        request = json.loads(line)
+        protocol_out.flush()
+        pid = os.fork()
+        if pid == 0:
+            _run_child(request, original_path)
+
+        start = time.monotonic()
+        deadline = start + request['timeout']
+        timed_out = False
+        while True:
+            done, status, rusage = os.wait4(pid, os.WNOHANG)
+            if done:
+                break
+            if time.monotonic() >= deadline:
+                timed_out = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                _, status, rusage = os.wait4(pid, 0)
+                break
+            time.sleep(0.002)
+        wall_time = time.monotonic() - start
+
+        # Clean up any children the script left running in its group.
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+        protocol_out.write(json.dumps({
+            'returncode': os.waitstatus_to_exitcode(status),
+            'timed_out': timed_out,
+            'wall_time': wall_time,
+            'cpu_time': rusage.ru_utime + rusage.ru_stime,
+            'max_rss': peak_rss_bytes(rusage),
+        }) + "\n")
+        protocol_out.flush()
+
+
+class _Worker:
+    """One pre-started interpreter waiting for run requests."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', _BOOTSTRAP.format(root=_PACKAGE_PARENT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            cwd=_PACKAGE_PARENT,
+        )
+        self.runs = 0
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def close(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        for pipe in (self.proc.stdin, self.proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def run(self, argv, cwd, timeout, cpu_limit=None, memory_limit=None):
+        """Run argv in a fresh child of this worker and return a RunResult."""
+        with tempfile.NamedTemporaryFile(delete=False) as out, tempfile.NamedTemporaryFile(delete=False) as err:
+            out_path, err_path = out.name, err.name
+        try:
+            request = {
+                'argv': argv, 'cwd': cwd, 'timeout': timeout, 'stdout': out_path, 'stderr': err_path,
+                'cpu_limit': cpu_limit, 'memory_limit': memory_limit,
+            }
+            self.proc.stdin.write(json.dumps(request) + "\n")
+            self.proc.stdin.flush()
+            self.runs += 1
+
+            # The worker enforces the timeout itself; allow it a little slack.
+            ready, _, _ = select.select([self.proc.stdout], [], [], timeout + 5)
+            line = self.proc.stdout.readline() if ready else ''
+            if not line:
+                raise RuntimeError('interpreter pool worker stopped responding')
+            reply = json.loads(line)
+            return RunResult(
+                reply['returncode'],
+                read_bounded_file(out_path),
+                read_bounded_file(err_path),
+                reply['timed_out'],
+                reply['wall_time'],
+                reply['cpu_time'],
+                reply['max_rss'],
+            )
+        finally:
+            for path in (out_path, err_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class InterpreterPool:
+    """A pool of warm Python interpreters for running scripts quickly.
+
+    Each worker imports PYTHON_POOL_PRELOAD once and then forks a child per
+    run, so every run starts from the same fresh process state without paying
+    interpreter startup. The child gets the argv, cwd and sys.path that
+    `python script.py` would have. Workers are replaced after max_runs runs,
+    after a timeout, or when they die.
+    """
+
+    def __init__(self, size: int = PYTHON_POOL_SIZE, max_runs: int = PYTHON_POOL_MAX_RUNS):
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._started < self.size:
+                self._started += 1
+                return _Worker()
+        return self._idle.get()
+
+    def _release(self, worker, healthy):
+        if healthy and worker.alive() and worker.runs < self.max_runs:
+            self._idle.put(worker)
+            return
+        worker.close()
+        # Replace it right away so the next run finds a warm interpreter.
+        self._idle.put(_Worker())
+
+    def run(self, argv, cwd, timeout, cpu_limit=None, memory_limit=None):
+        """Run `python argv...` in cwd and return a RunResult.
+
+        A run that times out has its process group killed, and its worker is
+        replaced.
+        """
+        worker = self._acquire()
+        healthy = False
+        try:
+            result = worker.run(list(argv), cwd, timeout, cpu_limit, memory_limit)
+            healthy = not result.timed_out
+            return result
+        finally:
+            self._release(worker, healthy)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_interpreter_pool():
+    """Return the shared pool, or None when it is disabled or unsupported here."""
+    global _pool
+    if PYTHON_POOL_SIZE <= 0 or not hasattr(os, 'fork'):
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InterpreterPool()
+        return _pool
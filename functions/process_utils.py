@@ -0,0 +1,92 @@
+import os
+import sys
+import math
+from collections import namedtuple
+from .config import RUN_OUTPUT_HEAD_BYTES, RUN_OUTPUT_TAIL_BYTES
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Outcome of one script run; stdout/stderr are already bounded text.
+RunResult = namedtuple('RunResult', 'returncode stdout stderr timed_out wall_time cpu_time max_rss')
+
+
+class BoundedCapture:
+    """Keep the first `head` and last `tail` bytes of a stream, counting the rest.
+
+    Memory use stays at head + tail bytes however much the process writes.
+    """
+
+    def __init__(self, head: int = RUN_OUTPUT_HEAD_BYTES, tail: int = RUN_OUTPUT_TAIL_BYTES):
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data and self.tail_limit:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    def text(self) -> str:
+        """Return the captured output, with a marker where bytes were dropped."""
+        elided = self.total - len(self.head) - len(self.tail)
+        head = self.head.decode('utf-8', errors='replace')
+        tail = self.tail.decode('utf-8', errors='replace')
+        if elided > 0:
+            return f"{head}\n[...{elided} bytes elided...]\n{tail}"
+        return head + tail
+
+
+def read_bounded_file(path: str, head: int = RUN_OUTPUT_HEAD_BYTES, tail: int = RUN_OUTPUT_TAIL_BYTES) -> str:
+    """Return the head and tail of a file the way BoundedCapture would have kept them."""
+    capture = BoundedCapture(head, tail)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        capture.write(f.read(head))
+        if size > head + tail:
+            capture.total = size - tail
+            f.seek(size - tail)
+        capture.write(f.read(tail))
+    return capture.text()
+
+
+def apply_limits(cpu_seconds=None, memory_bytes=None):
+    """Apply CPU-time and address-space rlimits to the current process.
+
+    Meant to run in a freshly started child before it executes the target.
+    A no-op where the resource module is unavailable.
+    """
+    if resource is None:
+        return
+    if cpu_seconds:
+        # RLIMIT_CPU counts whole seconds and 0 would mean none at all.
+        cpu_seconds = max(1, math.ceil(cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_bytes:
+        memory_bytes = int(memory_bytes)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def peak_rss_bytes(rusage) -> int:
+    """Convert ru_maxrss to bytes (it is reported in KiB on Linux, bytes on macOS)."""
+    return rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+
+
+def format_stats(wall_time, cpu_time=None, max_rss=None) -> str:
+    parts = [f"wall time {wall_time:.2f}s"]
+    if cpu_time is not None:
+        parts.append(f"CPU time {cpu_time:.2f}s")
+    if max_rss is not None:
+        parts.append(f"peak RSS {max_rss / (1024 * 1024):.1f} MB")
+    return 'Resource usage: ' + ', '.join(parts)
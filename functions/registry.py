@@ -0,0 +1,301 @@
+import json
+import importlib
+import threading
+from typing import Annotated, List, Literal, Union, get_args, get_origin, get_type_hints, is_typeddict
+
+# Modules whose @tool functions make up the agent's tool set; a new tool is
+# a decorated function in one of these.
+TOOL_MODULES = (
+    'functions.get_files_info',
+    'functions.get_file_content',
+    'functions.run_python_file',
+    'functions.write_file',
+    'functions.write_files',
+    'functions.search_files',
+)
+
+# Arguments supplied by the agent rather than the model; they are left out of
+# the declarations and anything the model sends for them is ignored.
+INJECTED_ARGUMENTS = frozenset({'working_directory'})
+
+_SCALAR_KINDS = {str: 'string', int: 'integer', float: 'number', bool: 'boolean'}
+
+
+class ToolArgumentError(ValueError):
+    """Raised when the arguments of a tool call do not match its signature."""
+
+
+class Param:
+    """One argument of a tool (or a field of an object argument) derived from its type hint.
+
+    Supported hints are str, int, float, bool, Literal[...] of strings,
+    List[...] of any of these, TypedDicts, and Optional[...] of all of them;
+    wrap a hint in Annotated[hint, "description"] to describe it to the model.
+    """
+
+    __slots__ = ('name', 'kind', 'description', 'enum', 'items', 'fields', 'required')
+
+    def __init__(self, name: str, hint):
+        self.name = name
+        self.description = None
+        self.enum = None
+        self.items = None
+        self.fields = None
+        self.required = ()
+        if get_origin(hint) is Annotated:
+            hint, *extras = get_args(hint)
+            self.description = next((extra for extra in extras if isinstance(extra, str)), None)
+        if get_origin(hint) is Union:
+            options = [arg for arg in get_args(hint) if arg is not type(None)]
+            if len(options) != 1:
+                raise TypeError(f'tool argument "{name}" has an unsupported union type {hint}')
+            hint = options[0]
+        origin = get_origin(hint)
+        if origin is Literal:
+            self.kind = 'string'
+            self.enum = [str(value) for value in get_args(hint)]
+        elif hint in _SCALAR_KINDS:
+            self.kind = _SCALAR_KINDS[hint]
+        elif origin in (list, List):
+            self.kind = 'array'
+            (item,) = get_args(hint) or (str,)
+            self.items = Param(name, item)
+        elif is_typeddict(hint):
+            self.kind = 'object'
+            self.fields = {key: Param(key, value) for key, value in get_type_hints(hint, include_extras=True).items()}
+            self.required = tuple(key for key in self.fields if key in hint.__required_keys__)
+        else:
+            raise TypeError(f'tool argument "{name}" has an unsupported type {hint}')
+
+    def coerce(self, value, path: str):
+        """Return value converted to this argument's type, or raise ToolArgumentError."""
+        kind = self.kind
+        if kind == 'string':
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            elif not isinstance(value, str):
+                raise ToolArgumentError(f'{path} must be a string')
+            if self.enum is not None and value not in self.enum:
+                raise ToolArgumentError(f'{path} must be one of {", ".join(self.enum)}')
+            return value
+        if kind == 'integer':
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+            # JSON numbers often arrive as floats, and some models quote them.
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, str):
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    pass
+            raise ToolArgumentError(f'{path} must be an integer')
+        if kind == 'number':
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            if isinstance(value, str):
+                try:
+                    return float(value.strip())
+                except ValueError:
+                    pass
+            raise ToolArgumentError(f'{path} must be a number')
+        if kind == 'boolean':
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+                return value.strip().lower() == 'true'
+            if value in (0, 1):
+                return bool(value)
+            raise ToolArgumentError(f'{path} must be true or false')
+        if kind == 'array':
+            if isinstance(value, (str, int, float)) and self.items.kind != 'array':
+                # A lone value where a list is expected, e.g. include="*.py".
+                value = [value]
+            elif not isinstance(value, (list, tuple)):
+                raise ToolArgumentError(f'{path} must be a list')
+            return [self.items.coerce(item, f'{path}[{index}]') for index, item in enumerate(value)]
+        if not isinstance(value, dict):
+            raise ToolArgumentError(f'{path} must be an object')
+        result = {}
+        for key, item in value.items():
+            field = self.fields.get(key)
+            if field is None:
+                raise ToolArgumentError(f'{path} has unknown field "{key}"')
+            if item is not None:
+                result[key] = field.coerce(item, f'{path}.{key}')
+        for key in self.required:
+            if key not in result:
+                raise ToolArgumentError(f'{path} is missing "{key}"')
+        return result
+
+    def schema(self, types):
+        """Return this argument as a types.Schema."""
+        kwargs = {'type': getattr(types.Type, self.kind.upper())}
+        if self.description:
+            kwargs['description'] = self.description
+        if self.enum is not None:
+            kwargs['enum'] = self.enum
+        if self.items is not None:
+            kwargs['items'] = self.items.schema(types)
+        if self.fields is not None:
+            kwargs['properties'] = {key: field.schema(types) for key, field in self.fields.items()}
+            if self.required:
+                kwargs['required'] = list(self.required)
+        return types.Schema(**kwargs)
+
+
+class Tool:
+    """A function the model can call, with its arguments precomputed from the signature.
+
+    - cacheable: the result depends only on the arguments and the one file
+      named by file_path, whose stat is part of the cache key
+    - writes: for tools that change the working tree, a function returning the
+      paths a call touches (None meaning anything)
+    - sequential: a turn containing this tool runs all of its calls in order
+    """
+
+    def __init__(self, func, description: str, cacheable: bool = False, writes=None, sequential: bool = False):
+        self.func = func
+        self.name = func.__name__
+        self.description = description
+        self.cacheable = cacheable
+        self.writes = writes
+        self.sequential = sequential
+        hints = get_type_hints(func, include_extras=True)
+        # The signature is read from the code object because importing inspect
+        # would add several milliseconds to startup. Only positional-or-keyword
+        # arguments are offered to the model; keyword-only ones are settings
+        # for the agent's own callers.
+        code = func.__code__
+        names = code.co_varnames[:code.co_argcount]
+        first_default = len(names) - len(func.__defaults__ or ())
+        self.params = {}
+        required = []
+        for index, name in enumerate(names):
+            if name in INJECTED_ARGUMENTS:
+                continue
+            if name not in hints:
+                raise TypeError(f'tool {self.name} argument "{name}" needs a type hint')
+            self.params[name] = Param(name, hints[name])
+            if index < first_default:
+                required.append(name)
+        self.required = tuple(required)
+        self._declaration = None
+
+    @property
+    def mutating(self) -> bool:
+        return self.writes is not None
+
+    def bind(self, args) -> dict:
+        """Validate and coerce the model's arguments (a dict or a JSON string) into keyword arguments.
+
+        Arguments given as null are left to their defaults. Raises ToolArgumentError.
+        """
+        if not args:
+            args = {}
+        elif isinstance(args, str):
+            try:
+                args = json.loads(args)
+            except ValueError as e:
+                raise ToolArgumentError(f'arguments are not valid JSON: {e}') from None
+        if not isinstance(args, dict):
+            raise ToolArgumentError('arguments must be an object')
+        kwargs = {}
+        params = self.params
+        for name, value in args.items():
+            param = params.get(name)
+            if param is None:
+                if name in INJECTED_ARGUMENTS:
+                    continue
+                raise ToolArgumentError(f'unknown argument "{name}"; expected {", ".join(params) or "none"}')
+            if value is not None:
+                kwargs[name] = param.coerce(value, name)
+        for name in self.required:
+            if name not in kwargs:
+                raise ToolArgumentError(f'missing required argument "{name}"')
+        return kwargs
+
+    def declaration(self):
+        """Return the types.FunctionDeclaration for this tool, built on first use."""
+        if self._declaration is None:
+            from google.genai import types
+
+            properties = {name: param.schema(types) for name, param in self.params.items()}
+            self._declaration = types.FunctionDeclaration(
+                name=self.name,
+                description=self.description,
+                parameters=types.Schema(type=types.Type.OBJECT, properties=properties,
+                                        required=list(self.required) or None),
+            )
+        return self._declaration
+
+
+class ToolRegistry:
+    """The tools the model may call, keyed by name for dispatch."""
+
+    def __init__(self, modules=TOOL_MODULES):
+        self.modules = modules
+        self.tools = {}
+        self._loaded = False
+        self._tool = None
+        self._lock = threading.Lock()
+
+    def register(self, tool: Tool):
+        if tool.name in self.tools:
+            raise ValueError(f'a tool named "{tool.name}" is already registered')
+        self.tools[tool.name] = tool
+        self._tool = None
+
+    def load(self):
+        """Import the tool modules so their @tool functions are registered."""
+        if not self._loaded:
+            for module in self.modules:
+                importlib.import_module(module)
+            self._loaded = True
+        return self
+
+    def get(self, name: str):
+        return self.tools.get(name)
+
+    def __iter__(self):
+        return iter(self.load().tools.values())
+
+    def names(self, **flags) -> frozenset:
+        """Return the names of the tools whose attributes match flags, e.g. names(mutating=True)."""
+        return frozenset(tool.name for tool in self if all(getattr(tool, k) == v for k, v in flags.items()))
+
+    def declarations(self):
+        """Return a types.Tool declaring every registered tool, built once on first use.
+
+        Returns None when the google-genai package is not installed.
+        """
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    try:
+                        from google.genai import types
+                    except Exception:
+                        return None
+                    # Declared in TOOL_MODULES order whatever order the modules were imported in.
+                    order = {module: index for index, module in enumerate(self.modules)}
+                    tools = sorted(self, key=lambda tool: order.get(tool.func.__module__, len(order)))
+                    self._tool = types.Tool(function_declarations=[tool.declaration() for tool in tools])
+        return self._tool
+
+
+# The process-wide tool set used by call_function and the agent sessions.
+registry = ToolRegistry()
+
+
+def tool(description: str, *, cacheable: bool = False, writes=None, sequential: bool = False):
+    """Register the decorated function as a tool; the function itself is returned unchanged.
+
+    Each argument other than working_directory needs a type hint, ideally
+    Annotated with a description; see Param for the supported types.
+    Arguments without a default are required, and keyword-only arguments are
+    not exposed to the model.
+    """
+    def decorator(func):
+        registry.register(Tool(func, description, cacheable=cacheable, writes=writes, sequential=sequential))
+        return func
+    return decorator
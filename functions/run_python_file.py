@@ -1,69 +1,187 @@
 import os
+import sys
+import time
+import signal
+import select
+import threading
 import subprocess
-from typing import List
+from typing import Annotated, List
+from .config import RUN_TIMEOUT_SECONDS, RUN_CPU_SECONDS, RUN_MEMORY_BYTES
+from .interpreter_pool import get_interpreter_pool
+from .process_utils import BoundedCapture, RunResult, apply_limits, format_stats, peak_rss_bytes
+from .tracing import span
+from .registry import tool
+from .workspace import OutsideWorkspaceError, get_workspace
 
 
-def run_python_file(working_directory: str, file_path: str, args: List[str] = None) -> str:
+def _kill_group(proc):
+    """Kill the process group started for proc, including any leftover children."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+# How often a pipe reader checks whether it has been told to stop.
+_PUMP_POLL_SECONDS = 0.05
+
+
+def _pump(stream, capture, stop=None):
+    """Copy a pipe into a BoundedCapture until EOF, or until stop is set."""
+    fd = stream.fileno()
+    try:
+        while stop is None or not stop.is_set():
+            if stop is not None and not select.select([fd], [], [], _PUMP_POLL_SECONDS)[0]:
+                continue
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            capture.write(data)
+    finally:
+        stream.close()
+
+
+def _run_subprocess(argv, cwd, timeout, cpu_limit, memory_limit):
+    """Run `python argv...` in its own process group with bounded output capture."""
+    posix = os.name == 'posix'
+    start = time.monotonic()
+    # preexec_fn is not safe to use while other threads run (tool calls run on
+    # a thread pool), so it is only used when there are limits to apply.
+    limited = posix and (cpu_limit or memory_limit)
+    proc = subprocess.Popen(
+        [sys.executable] + argv,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=posix,
+        preexec_fn=(lambda: apply_limits(cpu_limit, memory_limit)) if limited else None,
+    )
+
+    out, err = BoundedCapture(), BoundedCapture()
+    stop = threading.Event() if posix else None
+    readers = [
+        threading.Thread(target=_pump, args=(proc.stdout, out, stop), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, err, stop), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = False
+    cpu_time = max_rss = None
+    deadline = start + timeout
+    if hasattr(os, 'wait4'):
+        # Reap the child ourselves so its resource usage comes back with it.
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.monotonic() >= deadline:
+                timed_out = True
+                _kill_group(proc)
+                _, status, rusage = os.wait4(proc.pid, 0)
+                break
+            time.sleep(0.005)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        cpu_time = rusage.ru_utime + rusage.ru_stime
+        max_rss = peak_rss_bytes(rusage)
+    else:
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _kill_group(proc)
+            proc.wait()
+    wall_time = time.monotonic() - start
+
+    # Children the script left behind would otherwise keep the pipes open.
+    if posix:
+        _kill_group(proc)
+    # One that left the group with setsid() keeps them open anyway: read what
+    # it writes until the deadline, then stop reading and close the pipes.
+    for reader in readers:
+        reader.join(max(deadline - time.monotonic(), 0))
+    if stop is not None:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    return RunResult(proc.returncode, out.text(), err.text(), timed_out, wall_time, cpu_time, max_rss)
+
+
+@tool(
+    "Executes a Python file inside the working directory and returns captured stdout/stderr.",
+    # A script may have touched anything.
+    writes=lambda kwargs: [None],
+)
+def run_python_file(working_directory: str,
+                    file_path: Annotated[str, "Path to the Python file relative to the working directory."],
+                    args: Annotated[List[str], "Optional list of string arguments to pass to the script."] = None,
+                    *, timeout: float = RUN_TIMEOUT_SECONDS, cpu_limit: float = RUN_CPU_SECONDS,
+                    memory_limit: int = RUN_MEMORY_BYTES) -> str:
     """Run a Python file inside working_directory and return formatted output or error strings.
 
     - Ensures the target is inside working_directory
     - Ensures the file exists and ends with .py
-    - Executes with subprocess.run, timeout=30, captures stdout/stderr
-    - Returns formatted string with STDOUT:, STDERR:, and exit code if non-zero
+    - Executes in a new process group, or in a warm interpreter when the pool
+      is enabled (AGENT_PYTHON_POOL), with wall-clock (timeout), CPU-time and
+      memory limits; the whole group is killed when the run ends
+    - Keeps only the head and tail of stdout/stderr, noting how many bytes were elided
+    - Returns formatted string with STDOUT:, STDERR:, exit code if non-zero,
+      and the run's wall time, CPU time and peak RSS
     - On exceptions, returns: Error: executing Python file: {e}
     """
     if args is None:
         args = []
 
     try:
-        candidate = os.path.join(working_directory, file_path)
-        base_real = os.path.realpath(working_directory)
-        target_real = os.path.realpath(candidate)
-
+        workspace = get_workspace(working_directory)
         try:
-            common = os.path.commonpath([base_real, target_real])
-        except Exception:
+            target = workspace.resolve(file_path)
+        except OutsideWorkspaceError:
             return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
 
-        if common != base_real:
-            return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
-
-        if not os.path.exists(target_real):
+        try:
+            os.close(workspace.open(target, os.O_RDONLY | os.O_NONBLOCK))
+        except OSError:
             return f'Error: File "{file_path}" not found.'
 
         if not file_path.endswith('.py'):
             return f'Error: "{file_path}" is not a Python file.'
 
-        # Build command: use the same python interpreter that's running this script
-        cmd = [os.sys.executable, target_real] + args
-
-        completed = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=base_real,
-            timeout=30,
-            text=True,
-        )
-
-        out = completed.stdout or ''
-        err = completed.stderr or ''
-
-        if not out and not err:
-            return 'No output produced.'
+        # The interpreter is handed a path, not a descriptor, so that the
+        # script's directory ends up on sys.path as usual; it is the canonical
+        # path the workspace just opened without following any symlink.
+        base_real = workspace.root
+        argv = [workspace.abspath(target)] + [str(a) for a in args]
+        pool = get_interpreter_pool()
+        with span('python_process', 'tool', pool=pool is not None) as process_span:
+            if pool is not None:
+                # Run in a pre-started interpreter with the same argv and cwd.
+                result = pool.run(argv, cwd=base_real, timeout=timeout, cpu_limit=cpu_limit, memory_limit=memory_limit)
+            else:
+                result = _run_subprocess(argv, base_real, timeout, cpu_limit, memory_limit)
+            process_span.set(returncode=result.returncode, timed_out=result.timed_out, cpu_time=result.cpu_time,
+                             max_rss=result.max_rss, stdout_chars=len(result.stdout), stderr_chars=len(result.stderr))
 
         parts = []
-        if out:
-            parts.append('STDOUT:\n' + out)
-        if err:
-            parts.append('STDERR:\n' + err)
-
-        if completed.returncode != 0:
-            parts.append(f'Process exited with code {completed.returncode}')
-
+        if result.stdout:
+            parts.append('STDOUT:\n' + result.stdout)
+        if result.stderr:
+            parts.append('STDERR:\n' + result.stderr)
+        if not parts:
+            parts.append('No output produced.')
+
+        if result.timed_out:
+            parts.append(f'Process timed out after {timeout} seconds and was killed')
+        elif result.returncode != 0:
+            parts.append(f'Process exited with code {result.returncode}')
+
+        parts.append(format_stats(result.wall_time, result.cpu_time, result.max_rss))
         return '\n'.join(parts)
 
     except Exception as e:
         return f'Error: executing Python file: {e}'
-
-
@@ -1,47 +1,18 @@
-try:
-    from google.genai import types
-except Exception:
-    types = None
+from functions.registry import registry
 
-# Import individual schema_* declarations from their modules if present
-schema_get_files_info = None
-schema_get_file_content = None
-schema_run_python_file = None
-schema_write_file = None
 
-try:
-    from functions.get_files_info import schema_get_files_info as _s1
-    schema_get_files_info = _s1
-except Exception:
-    pass
+def get_available_functions():
+    """Return the types.Tool declaring every registered tool to the model.
 
-try:
-    from functions.get_file_content import schema_get_file_content as _s2
-    schema_get_file_content = _s2
-except Exception:
-    pass
+    The declarations are generated from the tool signatures the first time
+    a session asks for them, which is also when the genai SDK is imported.
+    Returns None when the google-genai package is not installed.
+    """
+    return registry.load().declarations()
 
-try:
-    from functions.run_python_file import schema_run_python_file as _s3
-    schema_run_python_file = _s3
-except Exception:
-    pass
 
-try:
-    from functions.write_file import schema_write_file as _s4
-    schema_write_file = _s4
-except Exception:
-    pass
-
-if types is not None:
-    decls = []
-    for s in (schema_get_files_info, schema_get_file_content, schema_run_python_file, schema_write_file):
-        if s is not None:
-            decls.append(s)
-
-    if decls:
-        available_functions = types.Tool(function_declarations=decls)
-    else:
-        available_functions = None
-else:
-    available_functions = None
+def __getattr__(name):
+    # Keeps `from functions.schemas import available_functions` working without building at import time.
+    if name == 'available_functions':
+        return get_available_functions()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
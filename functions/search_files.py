@@ -0,0 +1,421 @@
+import os
+import re
+import stat
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from array import array
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+from fnmatch import fnmatchcase
+from typing import Annotated, List
+from .registry import tool
+from .workspace import DIRECTORY_FLAGS, OutsideWorkspaceError, get_workspace
+from .config import (
+    SEARCH_INDEX_DIR,
+    SEARCH_MAX_FILE_BYTES,
+    SEARCH_MAX_RESULTS,
+    SEARCH_REFRESH_INTERVAL,
+)
+
+# Directories never worth indexing.
+SKIP_DIRS = {'.git', '__pycache__', '.venv', 'venv', 'node_modules', '.mypy_cache', '.pytest_cache'}
+
+# Longest snippet returned per matching line.
+SNIPPET_CHARS = 200
+
+_INDEX_VERSION = 1
+
+# Opcodes of parsed patterns walked by _regex_literals; atomic groups and
+# possessive repeats are new in Python 3.11.
+_ATOMIC_GROUP = getattr(_sre_parse, 'ATOMIC_GROUP', None)
+_REPEATS = {op for op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT, getattr(_sre_parse, 'POSSESSIVE_REPEAT', None))
+            if op is not None}
+
+
+def _trigrams(text):
+    """Return the set of lowercase trigrams in text."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _regex_literals(pattern):
+    """Return literal substrings every match of `pattern` must contain.
+
+    The pattern is read with the re module's own parser, so escapes such as
+    \\x41, \\101 or \\N{...} come out as the characters they stand for. This
+    is a conservative walk: literal runs are broken by anything that is not
+    a literal, a group contributes the literals it requires on its own, a
+    repeat contributes its body only when it must match at least once, and
+    an alternation contributes nothing.
+    """
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except re.error:
+        return []
+    literals = []
+    _required_literals(parsed, literals)
+    return [lit for lit in literals if len(lit) >= 3]
+
+
+def _required_literals(items, literals):
+    """Append the literal runs every match of parsed `items` contains to literals."""
+    current = []
+
+    def flush():
+        if current:
+            literals.append(''.join(current))
+            current.clear()
+
+    for op, av in items:
+        if op is _sre_parse.LITERAL:
+            current.append(chr(av))
+        elif op is _sre_parse.SUBPATTERN:
+            flush()
+            _required_literals(av[-1], literals)
+        elif op is _ATOMIC_GROUP:
+            flush()
+            _required_literals(av, literals)
+        elif op in _REPEATS:
+            low, _, body = av
+            text = _literal_text(body)
+            if low >= 1 and text is not None:
+                # The first repetition ends one run and the last starts the next.
+                current.extend(text)
+                flush()
+                current.extend(text)
+                continue
+            flush()
+            if low >= 1:
+                _required_literals(body, literals)
+        else:
+            flush()
+    flush()
+
+
+def _literal_text(items):
+    """Return the text matched by parsed `items` if they are all literals, else None."""
+    if not all(op is _sre_parse.LITERAL for op, _ in items):
+        return None
+    return ''.join(chr(av) for _, av in items)
+
+
+class SearchIndex:
+    """Trigram index of the text files below one directory.
+
+    Each file gets an id; postings map a lowercase trigram to the ids of the
+    files containing it. Postings are append-only: when a file changes it is
+    re-read under a new id and the old id is simply dropped from `files`, so
+    queries filter stale ids out. Once stale ids outnumber live ones the
+    postings are rebuilt. The index is pickled under SEARCH_INDEX_DIR and
+    refreshed incrementally from file mtimes and sizes. Files are found and
+    read through the root's Workspace, so a symlink never leads the index
+    outside it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.workspace = get_workspace(root)
+        self.path = os.path.join(
+            SEARCH_INDEX_DIR, hashlib.sha1(root.encode('utf-8')).hexdigest() + '.pickle'
+        )
+        self.files = {}          # relpath -> (file_id, mtime_ns, size)
+        self.paths = {}          # file_id -> relpath
+        self.postings = {}       # trigram -> array of file ids
+        self.next_id = 0
+        self.refreshed_at = 0.0
+        self.dirty = set()
+        self.stale = False
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception:
+            return
+        if data.get('version') != _INDEX_VERSION or data.get('root') != self.root:
+            return
+        self.files = data['files']
+        self.postings = data['postings']
+        self.next_id = data['next_id']
+        self.paths = {entry[0]: relpath for relpath, entry in self.files.items() if entry[0] is not None}
+
+    def _save(self):
+        os.makedirs(SEARCH_INDEX_DIR, exist_ok=True)
+        data = {
+            'version': _INDEX_VERSION,
+            'root': self.root,
+            'files': self.files,
+            'postings': self.postings,
+            'next_id': self.next_id,
+        }
+        fd, tmp = tempfile.mkstemp(dir=SEARCH_INDEX_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _scan(self):
+        """Yield (relpath, mtime_ns, size) for every indexable file below root."""
+        try:
+            fd = self.workspace.open_dir('')
+        except OSError:
+            return
+        yield from self._scan_dir(fd, '')
+
+    def _scan_dir(self, dir_fd, rel):
+        """Scan the open directory dir_fd at rel, descending with O_NOFOLLOW; closes dir_fd."""
+        try:
+            with os.scandir(dir_fd) as it:
+                entries = list(it)
+            for entry in entries:
+                relpath = f"{rel}/{entry.name}" if rel else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            child = os.open(entry.name, DIRECTORY_FLAGS, dir_fd=dir_fd)
+                            yield from self._scan_dir(child, relpath)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        if st.st_size <= SEARCH_MAX_FILE_BYTES:
+                            yield relpath, st.st_mtime_ns, st.st_size
+                except OSError:
+                    continue
+        except OSError:
+            return
+        finally:
+            os.close(dir_fd)
+
+    def _lstat(self, relpath):
+        """Return the lstat of relpath, reached through the workspace."""
+        parent, _, name = relpath.rpartition('/')
+        dir_fd = self.workspace.open_dir(parent)
+        try:
+            return os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+        finally:
+            os.close(dir_fd)
+
+    def read_text(self, relpath):
+        """Return the text of a file, or None when it is unreadable or binary."""
+        try:
+            # O_NONBLOCK keeps a FIFO swapped in since the scan from blocking the open.
+            fd = self.workspace.open(relpath, os.O_RDONLY | os.O_NONBLOCK)
+        except (OSError, OutsideWorkspaceError):
+            return None
+        try:
+            with os.fdopen(fd, 'rb') as f:
+                if not stat.S_ISREG(os.fstat(fd).st_mode):
+                    return None
+                os.set_blocking(fd, True)
+                data = f.read(SEARCH_MAX_FILE_BYTES + 1)
+        except OSError:
+            return None
+        if len(data) > SEARCH_MAX_FILE_BYTES or b'\0' in data[:8192]:
+            return None
+        return data.decode('utf-8', errors='replace')
+
+    def _add(self, relpath, mtime_ns, size):
+        text = self.read_text(relpath)
+        if text is None:
+            # Remember binary and oversized files so they are not re-read on every scan.
+            self.files[relpath] = (None, mtime_ns, size)
+            return
+        file_id = self.next_id
+        self.next_id += 1
+        self.files[relpath] = (file_id, mtime_ns, size)
+        self.paths[file_id] = relpath
+        postings = self.postings
+        for trigram in _trigrams(text):
+            ids = postings.get(trigram)
+            if ids is None:
+                postings[trigram] = array('I', (file_id,))
+            else:
+                ids.append(file_id)
+
+    def _remove(self, relpath):
+        entry = self.files.pop(relpath, None)
+        if entry is not None:
+            self.paths.pop(entry[0], None)
+
+    def _rebuild(self):
+        """Re-read every file to drop stale ids from the postings."""
+        entries = list(self.files.items())
+        self.files, self.paths, self.postings, self.next_id = {}, {}, {}, 0
+        for relpath, (_, mtime_ns, size) in entries:
+            self._add(relpath, mtime_ns, size)
+
+    def mark_dirty(self, relpath=None):
+        """Note that relpath changed, or with no path that anything may have."""
+        with self.lock:
+            if relpath is None:
+                self.stale = True
+            else:
+                self.dirty.add(os.path.normpath(relpath).replace(os.sep, '/'))
+
+    def refresh(self, force=False):
+        """Bring the index up to date with the files on disk."""
+        changed = False
+        now = time.monotonic()
+        if force or self.stale or not self.refreshed_at or now - self.refreshed_at >= SEARCH_REFRESH_INTERVAL:
+            seen = set()
+            for relpath, mtime_ns, size in self._scan():
+                seen.add(relpath)
+                entry = self.files.get(relpath)
+                if entry is None or entry[1] != mtime_ns or entry[2] != size:
+                    self._remove(relpath)
+                    self._add(relpath, mtime_ns, size)
+                    changed = True
+            for relpath in [p for p in self.files if p not in seen]:
+                self._remove(relpath)
+                changed = True
+            self.refreshed_at = now
+            self.stale = False
+            self.dirty.clear()
+        elif self.dirty:
+            # Only files written through the tools since the last scan.
+            for relpath in self.dirty:
+                self._remove(relpath)
+                try:
+                    st = self._lstat(relpath)
+                except (OSError, OutsideWorkspaceError):
+                    continue
+                if stat.S_ISREG(st.st_mode) and st.st_size <= SEARCH_MAX_FILE_BYTES:
+                    self._add(relpath, st.st_mtime_ns, st.st_size)
+            self.dirty.clear()
+            changed = True
+
+        if changed:
+            if self.next_id > 2 * max(len(self.files), 1000):
+                self._rebuild()
+            self._save()
+
+    def candidates(self, literals):
+        """Return relpaths of files that contain every trigram of every literal."""
+        trigrams = set()
+        for literal in literals:
+            trigrams |= _trigrams(literal)
+        if not trigrams:
+            return sorted(self.paths.values())
+        lists = []
+        for trigram in trigrams:
+            ids = self.postings.get(trigram)
+            if ids is None:
+                return []
+            lists.append(ids)
+        lists.sort(key=len)
+        live = set(lists[0]).intersection(self.paths)
+        for ids in lists[1:]:
+            if not live:
+                break
+            live.intersection_update(ids)
+        return sorted(self.paths[i] for i in live)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(working_directory):
+    """Return the shared SearchIndex for working_directory."""
+    root = get_workspace(working_directory).root
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = SearchIndex(root)
+        return index
+
+
+def notify_write(working_directory, file_path=None):
+    """Tell an already-loaded index that file_path (or anything, if None) changed."""
+    try:
+        root = get_workspace(working_directory).root
+    except OSError:
+        return
+    index = _indexes.get(root)
+    if index is not None:
+        index.mark_dirty(file_path)
+
+
+@tool(
+    "Searches the text files inside the working directory for a literal string or regular expression "
+    "and returns matching lines as path:line: snippet. Much faster than reading files one by one.",
+)
+def search_files(
+    working_directory,
+    query: Annotated[str, "The text to search for, or a Python regular expression when regex is true."],
+    regex: Annotated[bool, "Treat query as a regular expression."] = False,
+    case_sensitive: Annotated[bool, "Match case exactly. Defaults to true."] = True,
+    include: Annotated[List[str], "Glob patterns (e.g. \"*.py\") limiting which files are searched."] = None,
+    max_results: Annotated[int, f"Maximum number of matching lines to return (default {SEARCH_MAX_RESULTS})."] = None,
+):
+    """Search the text files inside working_directory for `query`.
+
+    query is a literal string unless regex is true. include optionally limits
+    the search to paths matching one or more glob patterns. Returns one
+    "path:line: snippet" line per match, at most max_results of them,
+    followed by a note when more matches were cut off.
+
+    Returns error strings prefixed with 'Error:' on failures.
+    """
+    if not isinstance(query, str) or not query:
+        return 'Error: query must be a non-empty string'
+
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        if regex:
+            matcher = re.compile(query, flags)
+            literals = _regex_literals(query)
+        else:
+            matcher = re.compile(re.escape(query), flags)
+            literals = [query]
+    except re.error as e:
+        return f'Error: Invalid regular expression: {e}'
+
+    try:
+        max_results = SEARCH_MAX_RESULTS if max_results is None else max(1, int(max_results))
+    except (TypeError, ValueError):
+        return 'Error: max_results must be an integer'
+
+    patterns = [include] if isinstance(include, str) else list(include or [])
+
+    try:
+        index = get_search_index(working_directory)
+    except OSError:
+        return f'Error: "{working_directory}" is not a directory'
+    with index.lock:
+        index.refresh()
+        candidates = index.candidates(literals)
+
+    results = []
+    truncated = False
+    for relpath in candidates:
+        if patterns and not any(fnmatchcase(relpath, p) or fnmatchcase(relpath.rsplit('/', 1)[-1], p) for p in patterns):
+            continue
+        text = index.read_text(relpath)
+        if text is None:
+            continue
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if matcher.search(line):
+                if len(results) == max_results:
+                    truncated = True
+                    break
+                results.append(f"{relpath}:{lineno}: {line.strip()[:SNIPPET_CHARS]}")
+        if truncated:
+            break
+
+    if not results:
+        return f'No matches found for "{query}"'
+    if truncated:
+        results.append(f'[...more matches; showing the first {max_results}. Narrow the query or use include to see others]')
+    return "\n".join(results)
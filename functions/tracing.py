@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import threading
+
+
+class _NullSpan:
+    """Stand-in returned by span() while tracing is off; every method is a no-op."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _lane():
+    """Return (id, name) of the asyncio task or thread the caller runs in."""
+    # No task can be running unless something already imported asyncio.
+    asyncio = sys.modules.get('asyncio')
+    try:
+        task = asyncio.current_task() if asyncio is not None else None
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return id(task), task.get_name()
+    thread = threading.current_thread()
+    return thread.ident, thread.name
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = f'{exc_type.__name__}: {exc}'
+        self.tracer._record(self, end)
+        return False
+
+    def set(self, **args):
+        """Attach extra arguments (sizes, token counts) to the span."""
+        self.args.update(args)
+
+
+class Tracer:
+    """Collects timed spans and exports them as Chrome trace events.
+
+    Spans are complete ("X") events keyed by the thread or asyncio task that
+    ran them, so concurrent sessions and tool calls appear on separate lanes
+    in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lanes = {}
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.origin = time.perf_counter_ns()
+
+    def _record(self, span, end):
+        lane, lane_name = _lane()
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': (span.start - self.origin) / 1000,
+            'dur': (end - span.start) / 1000,
+            'pid': os.getpid(),
+            'tid': lane,
+            'args': span.args,
+        }
+        with self._lock:
+            self.events.append(event)
+            self.lanes.setdefault(lane, lane_name)
+
+    def write(self, path: str):
+        """Write the collected spans as a Chrome/Perfetto trace-event JSON file."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            lanes = dict(self.lanes)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': lane, 'args': {'name': name}}
+                    for lane, name in lanes.items()]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+    def summary(self) -> str:
+        """Return a table of span count, total, mean and max time per span name."""
+        with self._lock:
+            events = list(self.events)
+        totals = {}
+        for event in events:
+            entry = totals.setdefault(event['name'], [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += event['dur']
+            entry[2] = max(entry[2], event['dur'])
+        wall = max((e['ts'] + e['dur'] for e in events), default=0.0)
+        lines = [f"{'span':<24}{'count':>7}{'total ms':>11}{'mean ms':>10}{'max ms':>10}{'% wall':>8}"]
+        for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            share = 100 * total / wall if wall else 0.0
+            lines.append(f"{name:<24}{count:>7}{total / 1000:>11.1f}{total / 1000 / count:>10.2f}"
+                         f"{longest / 1000:>10.1f}{share:>7.1f}%")
+        return '\n'.join(lines)
+
+
+# Process-wide tracer; off unless main.py is run with --trace or --profile.
+tracer = Tracer()
+
+
+def span(name: str, category: str = '', **args):
+    """Return a context manager that times a block as one trace span.
+
+    While tracing is off this returns a shared no-op object, so instrumented
+    code pays only for the call and the enabled check.
+    """
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, category, args)
@@ -0,0 +1,228 @@
+import os
+import stat
+import errno
+import threading
+from collections import OrderedDict
+from .config import WORKSPACE_CACHE_SIZE
+
+# Symlinks followed while resolving one path before giving up, as the kernel does.
+MAX_SYMLINKS = 40
+
+# Flags for opening one directory component: never through a symlink.
+DIRECTORY_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
+
+class OutsideWorkspaceError(ValueError):
+    """Raised when a path resolves to somewhere outside the working directory."""
+
+
+class Workspace:
+    """The working directory, opened once, through which the tools reach every path.
+
+    resolve() turns a path from the model into its canonical form relative to
+    the root, following symlinks only while they stay inside, with one
+    fstatat per component relative to the root descriptor; results are kept
+    in an LRU cache until a write invalidates them. open() and open_dir()
+    then walk the canonical path one directory at a time with O_NOFOLLOW
+    from the root descriptor, so a symlink swapped in after the check makes
+    the open fail rather than escape, and renaming the working directory
+    itself does not move the tools out of it.
+    """
+
+    def __init__(self, root, cache_size=WORKSPACE_CACHE_SIZE):
+        self.root = os.path.realpath(root)
+        self.fd = os.open(self.root, DIRECTORY_FLAGS)
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._resolved = OrderedDict()
+        self._lock = threading.Lock()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def resolve(self, path) -> str:
+        """Return path's canonical form relative to the root, '' for the root itself.
+
+        Components that do not exist yet are taken literally. Raises
+        OutsideWorkspaceError when the path, or a symlink on it, leads outside.
+        """
+        with self._lock:
+            rel = self._resolved.get(path)
+            if rel is not None:
+                self._resolved.move_to_end(path)
+                self.hits += 1
+                return rel
+            self.misses += 1
+        rel = self._resolve(path)
+        with self._lock:
+            self._resolved[path] = rel
+            if len(self._resolved) > self.cache_size:
+                self._resolved.popitem(last=False)
+        return rel
+
+    def _inside(self, path) -> str:
+        """Return an absolute path relative to the root, or raise if it does not start there."""
+        if path == self.root:
+            return ''
+        if not path.startswith(self.root.rstrip(os.sep) + os.sep):
+            raise OutsideWorkspaceError(path)
+        return path[len(self.root.rstrip(os.sep)) + 1:]
+
+    def _resolve(self, path) -> str:
+        if os.path.isabs(path):
+            path = self._inside(path)
+        pending = path.split(os.sep)[::-1]
+        parts = []
+        links = 0
+        missing_at = None  # length of parts when a component was first found missing
+        while pending:
+            name = pending.pop()
+            if name in ('', os.curdir):
+                continue
+            if name == os.pardir:
+                if not parts:
+                    raise OutsideWorkspaceError(path)
+                parts.pop()
+                if missing_at is not None and len(parts) <= missing_at:
+                    missing_at = None
+                continue
+            if missing_at is None:
+                candidate = '/'.join(parts + [name])
+                try:
+                    st = os.lstat(candidate, dir_fd=self.fd)
+                except (FileNotFoundError, NotADirectoryError):
+                    # Nothing below a missing component can be a symlink.
+                    missing_at = len(parts)
+                else:
+                    if stat.S_ISLNK(st.st_mode):
+                        links += 1
+                        if links > MAX_SYMLINKS:
+                            raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), path)
+                        target = os.readlink(candidate, dir_fd=self.fd)
+                        if os.path.isabs(target):
+                            parts = []
+                            target = self._inside(target)
+                        pending.extend(target.split(os.sep)[::-1])
+                        continue
+            parts.append(name)
+        return '/'.join(parts)
+
+    def invalidate(self, path=None):
+        """Forget cached resolutions of path and anything below it, or of everything."""
+        with self._lock:
+            if path is None:
+                self._resolved.clear()
+                return
+            target = os.path.normpath(path)
+            for key, rel in list(self._resolved.items()):
+                if any(p == target or p.startswith(target + os.sep) for p in (os.path.normpath(key), rel)):
+                    del self._resolved[key]
+
+    def abspath(self, rel) -> str:
+        """Return the absolute path of a canonical relative path."""
+        return os.path.join(self.root, rel) if rel else self.root
+
+    def _walk(self, parts, visit=None):
+        """Open the directory reached by parts from the root, one O_NOFOLLOW step at a time.
+
+        visit(descriptor, canonical path) is called for each directory passed through.
+        """
+        fd = self.fd
+        try:
+            for index, name in enumerate(parts):
+                if visit is not None:
+                    visit(fd, '/'.join(parts[:index]))
+                child = os.open(name, DIRECTORY_FLAGS, dir_fd=fd)
+                if fd != self.fd:
+                    os.close(fd)
+                fd = child
+        except BaseException:
+            if fd != self.fd:
+                os.close(fd)
+            raise
+        return fd
+
+    def open_dir(self, path, visit=None) -> int:
+        """Open a directory inside the workspace and return a new descriptor the caller closes.
+
+        visit(descriptor, canonical path), if given, is called for every
+        directory above it, starting at the root. Raises OutsideWorkspaceError,
+        FileNotFoundError or NotADirectoryError.
+        """
+        rel = self.resolve(path)
+        fd = self._walk(rel.split('/') if rel else [], visit)
+        if fd == self.fd:
+            # A descriptor of its own: scandir shares the read offset of the one it is given.
+            fd = os.open(os.curdir, DIRECTORY_FLAGS, dir_fd=self.fd)
+        return fd
+
+    def open(self, path, flags=os.O_RDONLY, mode=0o666) -> int:
+        """Open a file inside the workspace and return its descriptor; flags are as for os.open."""
+        rel = self.resolve(path)
+        if not rel:
+            return os.open(os.curdir, flags | os.O_CLOEXEC, mode, dir_fd=self.fd)
+        parent, _, name = rel.rpartition('/')
+        dir_fd = self._walk(parent.split('/') if parent else [])
+        try:
+            return os.open(name, flags | os.O_NOFOLLOW | os.O_CLOEXEC, mode, dir_fd=dir_fd)
+        finally:
+            if dir_fd != self.fd:
+                os.close(dir_fd)
+
+    def makedirs(self, rel):
+        """Open the directory at canonical rel, creating any missing components.
+
+        Returns (descriptor, [canonical paths of the directories created]);
+        the caller closes the descriptor.
+        """
+        fd = self.fd
+        created = []
+        done = []
+        try:
+            for name in rel.split('/') if rel else []:
+                done.append(name)
+                try:
+                    child = os.open(name, DIRECTORY_FLAGS, dir_fd=fd)
+                except FileNotFoundError:
+                    os.mkdir(name, dir_fd=fd)
+                    created.append('/'.join(done))
+                    child = os.open(name, DIRECTORY_FLAGS, dir_fd=fd)
+                if fd != self.fd:
+                    os.close(fd)
+                fd = child
+            if fd == self.fd:
+                fd = os.open(os.curdir, DIRECTORY_FLAGS, dir_fd=self.fd)
+        except BaseException:
+            if fd != self.fd:
+                os.close(fd)
+            raise
+        return fd, created
+
+
+_workspaces = {}
+_workspaces_lock = threading.Lock()
+
+
+def get_workspace(working_directory) -> Workspace:
+    """Return the shared Workspace for working_directory, opening it on first use.
+
+    Workspaces are keyed on the string given, so repeated calls make no
+    system calls at all.
+    """
+    workspace = _workspaces.get(working_directory)
+    if workspace is None:
+        with _workspaces_lock:
+            workspace = _workspaces.get(working_directory)
+            if workspace is None:
+                workspace = _workspaces[working_directory] = Workspace(working_directory)
+    return workspace
+
+
+def invalidate_resolutions(working_directory, path=None):
+    """Drop cached resolutions after a write to path (or to anything, if None)."""
+    workspace = _workspaces.get(working_directory)
+    if workspace is not None:
+        workspace.invalidate(path)
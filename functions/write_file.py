@@ -1,35 +1,318 @@
 import os
+import re
+from typing import Annotated, List, Literal, TypedDict
+from .registry import tool
+from .workspace import OutsideWorkspaceError, get_workspace
 
+WRITE_MODES = ('overwrite', 'patch', 'replace', 'lines')
 
-def write_file(working_directory, file_path, content):
-    """Write content to file_path inside working_directory.
 
-    Returns an error string starting with 'Error:' on failure, otherwise a success string.
+class Edit(TypedDict):
+    """One search/replace block of a replace-mode edit."""
+    search: Annotated[str, "Exact text to find."]
+    replace: Annotated[str, "Text to put in its place."]
+
+
+# Argument types of write_file, shared with the operations of write_files.
+FilePath = Annotated[str, "Path to the file relative to the working directory."]
+WriteMode = Annotated[
+    Literal[WRITE_MODES],
+    "overwrite (default): replace the file with content; patch: apply a unified diff; "
+    "replace: apply search/replace edits; lines: replace a line range with content.",
+]
+Content = Annotated[str, "The new file content (overwrite mode) or the replacement lines (lines mode)."]
+Patch = Annotated[str, "A unified diff with @@ hunk headers, used in patch mode."]
+Edits = Annotated[
+    List[Edit], "Search/replace blocks applied in order in replace mode; each search must match exactly once."
+]
+StartLine = Annotated[int, "First line to replace, 1-based (lines mode)."]
+EndLine = Annotated[int, "Last line to replace, inclusive (lines mode). Use start_line - 1 to insert before start_line."]
+
+# Permissions for new files follow the process umask, read once at import
+# because os.umask can only be queried by setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+def _newline_of(text):
+    """Return the newline most lines of text end with, used for the lines an edit inserts."""
+    crlf = text.count('\r\n')
+    return '\r\n' if crlf and crlf >= text.count('\n') - crlf else '\n'
+
+
+def _split_lines(text):
+    """Split text after each '\\n', keeping every line's own ending.
+
+    Unlike str.splitlines() this never splits on form feeds, '\\u2028' and
+    the other characters that may sit inside a line of source.
+    """
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def _strip_newline(line):
+    if line.endswith('\r\n'):
+        return line[:-2]
+    return line[:-1] if line.endswith('\n') else line
+
+
+def _parse_hunks(patch):
+    """Parse a unified diff into a list of (old_start, [(tag, line), ...]) with tags ' ', '-' and '+'."""
+    hunks = []
+    current = None
+    for line in _split_lines(patch):
+        line = _strip_newline(line)
+        match = _HUNK_HEADER.match(line)
+        if match:
+            current = (int(match.group(1)), [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith('\\'):
+            # File headers before the first hunk, and "\ No newline at end of file".
+            continue
+        tag, body = (line[0], line[1:]) if line else (' ', '')
+        if tag not in ' -+':
+            raise ValueError(f'unexpected line in patch: {line!r}')
+        current[1].append((tag, body))
+    if not hunks:
+        raise ValueError('patch contains no hunks')
+    return hunks
+
+
+def _apply_patch(original, patch):
+    """Apply a unified diff to `original`; raise ValueError unless every hunk applies cleanly."""
+    newline = _newline_of(original)
+    lines = _split_lines(original)
+    offset = 0
+    for number, (old_start, ops) in enumerate(_parse_hunks(patch), 1):
+        old_lines = [body for tag, body in ops if tag != '+']
+        if not old_lines:
+            # A hunk with no old lines, "-N,0", inserts after line N.
+            expected = old_start + offset
+            if expected > len(lines):
+                raise ValueError(f'hunk {number} inserts after line {old_start}, past the end of the file')
+            position = expected
+        else:
+            expected = max(old_start - 1, 0) + offset
+            position = None
+            bodies = [_strip_newline(line) for line in lines]
+            # Look for the hunk's context at its stated line first, then nearby.
+            for distance in range(len(lines) + 1):
+                for candidate in (expected - distance, expected + distance):
+                    if 0 <= candidate <= len(lines) - len(old_lines) and bodies[candidate:candidate + len(old_lines)] == old_lines:
+                        position = candidate
+                        break
+                if position is not None:
+                    break
+            if position is None:
+                raise ValueError(f'hunk {number} (at line {old_start}) does not apply: context not found')
+        # Context lines are kept exactly as they were, endings included.
+        old = iter(lines[position:position + len(old_lines)])
+        new_lines = []
+        for tag, body in ops:
+            if tag == ' ':
+                new_lines.append(next(old))
+            elif tag == '-':
+                next(old)
+            else:
+                new_lines.append(body + newline)
+        lines[position:position + len(old_lines)] = new_lines
+        offset += position - expected + len(new_lines) - len(old_lines)
+    # A line that lacked an ending, the old last one, needs one if anything now follows it.
+    for i in range(len(lines) - 1):
+        if not lines[i].endswith('\n'):
+            lines[i] += newline
+    if lines and original and not original.endswith('\n'):
+        lines[-1] = _strip_newline(lines[-1])
+    return ''.join(lines)
+
+
+def _apply_replacements(original, edits):
+    """Apply search/replace edits in order; each search text must occur exactly once."""
+    if not edits:
+        raise ValueError('edits must contain at least one {"search", "replace"} block')
+    text = original
+    for number, edit in enumerate(edits, 1):
+        search = edit.get('search') if isinstance(edit, dict) else None
+        replace = edit.get('replace', '') if isinstance(edit, dict) else None
+        if not isinstance(search, str) or not search or not isinstance(replace, str):
+            raise ValueError(f'edit {number} needs a non-empty "search" string and a "replace" string')
+        count = text.count(search)
+        if count == 0:
+            raise ValueError(f'edit {number}: search text not found')
+        if count > 1:
+            raise ValueError(f'edit {number}: search text occurs {count} times; include more context')
+        text = text.replace(search, replace, 1)
+    return text
+
+
+def _replace_lines(original, start_line, end_line, content):
+    """Replace 1-based lines start_line..end_line (inclusive) with content."""
+    if start_line is None:
+        raise ValueError('start_line is required in "lines" mode')
+    start_line = int(start_line)
+    end_line = int(end_line) if end_line is not None else start_line
+    lines = _split_lines(original)
+    if start_line < 1 or end_line < start_line - 1 or start_line > len(lines) + 1:
+        raise ValueError(f'invalid line range {start_line}-{end_line} for a file with {len(lines)} lines')
+    newline = _newline_of(original)
+    new = [_strip_newline(line) + newline for line in _split_lines(content)]
+    if lines and not lines[-1].endswith('\n'):
+        if start_line > len(lines):
+            # Inserting after the last line, which then needs an ending of its own.
+            lines[-1] += newline
+        elif new and end_line >= len(lines):
+            # Keep the file's missing final newline when replacing its last line.
+            new[-1] = _strip_newline(new[-1])
+    lines[start_line - 1:end_line] = new
+    return ''.join(lines)
+
+
+def apply_edit(original, mode='overwrite', content=None, patch=None, edits=None, start_line=None, end_line=None):
+    """Return the new file text produced by one write_file edit of `original`.
+
+    Raises ValueError when the edit is malformed or does not apply cleanly.
     """
+    if mode == 'overwrite':
+        if content is None:
+            raise ValueError('content is required in "overwrite" mode')
+        return content
+    if mode == 'patch':
+        patch = patch if patch is not None else content
+        if not patch:
+            raise ValueError('patch is required in "patch" mode')
+        return _apply_patch(original, patch)
+    if mode == 'replace':
+        return _apply_replacements(original, edits)
+    if mode == 'lines':
+        return _replace_lines(original, start_line, end_line, content or '')
+    raise ValueError(f'unknown mode "{mode}"; expected one of {", ".join(WRITE_MODES)}')
+
+
+# The helpers below take an optional dir_fd, as os functions do: path is
+# then a name inside that open directory, never followed if it is a symlink.
+
+
+def read_text(path, dir_fd=None):
+    """Read a file for editing, keeping its line endings; a missing file reads as ''."""
     try:
-        candidate = os.path.join(working_directory, file_path)
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC, dir_fd=dir_fd)
+    except FileNotFoundError:
+        return ''
+    with open(fd, 'r', encoding='utf-8', newline='') as f:
+        return f.read()
 
-        base_real = os.path.realpath(working_directory)
-        target_real = os.path.realpath(candidate)
 
+def stage_file(path, text, dir_fd=None):
+    """Write text to a synced temporary file next to path and return its name."""
+    directory, name = os.path.split(path)
+    for _ in range(100):
+        tmp = os.path.join(directory, f'.{name}.{os.urandom(4).hex()}.tmp')
         try:
-            common = os.path.commonpath([base_real, target_real])
-        except Exception:
-            return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW | os.O_CLOEXEC, 0o600,
+                         dir_fd=dir_fd)
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise FileExistsError(f'no free temporary name for "{path}"')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+            f.flush()
+            try:
+                os.fchmod(fd, os.stat(path, dir_fd=dir_fd, follow_symlinks=False).st_mode & 0o7777)
+            except FileNotFoundError:
+                os.fchmod(fd, 0o666 & ~_UMASK)
+            os.fsync(fd)
+    except BaseException:
+        os.remove(tmp, dir_fd=dir_fd)
+        raise
+    return tmp
+
+
+def sync_directory(directory, dir_fd=None):
+    """fsync a directory, or the open directory dir_fd, so a rename inside it is durable."""
+    if os.name != 'posix':
+        return
+    if dir_fd is not None:
+        os.fsync(dir_fd)
+        return
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, text, dir_fd=None):
+    """Replace path with text so readers see either the old or the new file, never a partial one."""
+    tmp = stage_file(path, text, dir_fd)
+    try:
+        os.replace(tmp, path, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+    except BaseException:
+        os.remove(tmp, dir_fd=dir_fd)
+        raise
+    sync_directory(os.path.dirname(path), dir_fd)
 
-        if common != base_real:
+
+@tool(
+    "Write or edit a file inside the working directory. Prefer the patch, replace or lines modes for "
+    "small changes to large files instead of re-sending the whole file.",
+    writes=lambda kwargs: [kwargs['file_path']],
+)
+def write_file(working_directory, file_path: FilePath, content: Content = None, mode: WriteMode = 'overwrite',
+               patch: Patch = None, edits: Edits = None, start_line: StartLine = None, end_line: EndLine = None):
+    """Write or edit file_path inside working_directory.
+
+    mode selects how the new text is produced:
+      - overwrite: replace the whole file with `content`
+      - patch: apply the unified diff in `patch` (every hunk must apply cleanly)
+      - replace: apply `edits`, a list of {"search", "replace"} blocks, each matching exactly once
+      - lines: replace lines start_line..end_line (inclusive, 1-based) with `content`
+    The result is written atomically through a synced temporary file and a rename.
+
+    Returns an error string starting with 'Error:' on failure, otherwise a success string.
+    """
+    try:
+        workspace = get_workspace(working_directory)
+        try:
+            target = workspace.resolve(file_path)
+        except OutsideWorkspaceError:
             return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
+        if not target:
+            return f'Error: "{file_path}" is a directory'
+        parent, _, name = target.rpartition('/')
 
-        # Ensure parent directory exists
-        parent_dir = os.path.dirname(target_real)
-        if parent_dir and not os.path.exists(parent_dir):
-            os.makedirs(parent_dir, exist_ok=True)
+        mode = mode or 'overwrite'
+        try:
+            dir_fd = workspace.open_dir(parent)
+        except FileNotFoundError:
+            dir_fd = None
+        try:
+            original = '' if mode == 'overwrite' or dir_fd is None else read_text(name, dir_fd)
+            try:
+                new_content = apply_edit(original, mode, content, patch, edits, start_line, end_line)
+            except ValueError as e:
+                return f'Error: Cannot {mode} "{file_path}": {e}'
 
-        # Overwrite the file with the provided content
-        with open(target_real, 'w', encoding='utf-8') as f:
-            f.write(content)
+            # Ensure parent directory exists
+            if dir_fd is None:
+                dir_fd, _ = workspace.makedirs(parent)
 
-        return f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
+            atomic_write(name, new_content, dir_fd)
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+
+        if mode == 'overwrite':
+            return f'Successfully wrote to "{file_path}" ({len(new_content)} characters written)'
+        return f'Successfully applied {mode} edit to "{file_path}" (file is now {len(new_content)} characters)'
     except Exception as e:
         return f'Error: {str(e)}'
-
@@ -0,0 +1,200 @@
+import os
+import shutil
+from typing import Annotated, List, TypedDict
+from functions.registry import tool
+from functions.write_file import (
+    Content, EndLine, Edits, FilePath, Patch, StartLine, WriteMode,
+    apply_edit, read_text, stage_file, sync_directory, WRITE_MODES,
+)
+from functions.workspace import OutsideWorkspaceError, get_workspace
+
+
+class _WriteTarget(TypedDict):
+    file_path: FilePath
+
+
+class WriteOperation(_WriteTarget, total=False):
+    """One write_files operation: the arguments of a write_file call."""
+    mode: WriteMode
+    content: Content
+    patch: Patch
+    edits: Edits
+    start_line: StartLine
+    end_line: EndLine
+
+
+def _backup(name, dir_fd):
+    """Keep the current version of name in directory dir_fd under a temporary name; return that name or None."""
+    try:
+        st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+    except FileNotFoundError:
+        return None
+    backup = '.' + name + '.bak.tmp'
+    try:
+        os.remove(backup, dir_fd=dir_fd)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(name, backup, src_dir_fd=dir_fd, dst_dir_fd=dir_fd, follow_symlinks=False)
+    except OSError:
+        src = os.open(name, os.O_RDONLY | os.O_NOFOLLOW | os.O_CLOEXEC, dir_fd=dir_fd)
+        with open(src, 'rb') as fsrc:
+            dst = os.open(backup, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW | os.O_CLOEXEC,
+                          st.st_mode & 0o7777, dir_fd=dir_fd)
+            with open(dst, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst)
+    return backup
+
+
+def _write_all(workspace, operations, targets, order, dir_fds):
+    """Compute, stage and commit the writes of write_files, with parent directory descriptors in dir_fds."""
+    def location(target):
+        parent, _, name = target.rpartition('/')
+        return parent, name
+
+    # Compute the new content of every file in memory.
+    for target in order:
+        file_path, _, ops = targets[target]
+        parent, name = location(target)
+        try:
+            if parent not in dir_fds:
+                try:
+                    dir_fds[parent] = workspace.open_dir(parent)
+                except FileNotFoundError:
+                    dir_fds[parent] = None
+            text = read_text(name, dir_fds[parent]) if dir_fds[parent] is not None else ''
+        except OSError as e:
+            return f'Error: Cannot read "{file_path}", nothing was written: {e}'
+        for number, op in ops:
+            mode = op.get('mode') or 'overwrite'
+            try:
+                text = apply_edit(
+                    text, mode, op.get('content'), op.get('patch'), op.get('edits'),
+                    op.get('start_line'), op.get('end_line'),
+                )
+            except ValueError as e:
+                return f'Error: operation {number} ({mode} "{file_path}") failed, nothing was written: {e}'
+        targets[target][1] = text
+
+    created_dirs = []
+    staged = {}
+    backups = {}
+    committed = []
+    try:
+        # Stage every file next to its target.
+        for target in order:
+            parent, name = location(target)
+            if dir_fds[parent] is None:
+                dir_fds[parent], created = workspace.makedirs(parent)
+                created_dirs.extend(created)
+            staged[target] = stage_file(name, targets[target][1], dir_fds[parent])
+
+        # Commit with renames, keeping the previous versions until all succeed.
+        for target in order:
+            parent, name = location(target)
+            dir_fd = dir_fds[parent]
+            backups[target] = _backup(name, dir_fd)
+            os.replace(staged[target], name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+            del staged[target]
+            committed.append(target)
+    except Exception as e:
+        for target in reversed(committed):
+            parent, name = location(target)
+            try:
+                if backups.get(target):
+                    os.replace(backups.pop(target), name, src_dir_fd=dir_fds[parent], dst_dir_fd=dir_fds[parent])
+                else:
+                    os.remove(name, dir_fd=dir_fds[parent])
+            except OSError:
+                pass
+        leftovers = [(t, staged[t]) for t in staged] + [(t, b) for t, b in backups.items() if b]
+        for target, tmp in leftovers:
+            try:
+                os.remove(tmp, dir_fd=dir_fds[location(target)[0]])
+            except OSError:
+                pass
+        for directory in reversed(created_dirs):
+            try:
+                os.rmdir(directory, dir_fd=workspace.fd)
+            except OSError:
+                pass
+        return f'Error: writing files failed, all changes were rolled back: {e}'
+
+    for target, backup in backups.items():
+        if backup:
+            try:
+                os.remove(backup, dir_fd=dir_fds[location(target)[0]])
+            except OSError:
+                pass
+    for parent in {location(t)[0] for t in order}:
+        sync_directory(parent, dir_fds[parent])
+
+    lines = [f'Successfully applied {len(operations)} operations to {len(order)} files:']
+    for target in order:
+        file_path, text, ops = targets[target]
+        modes = ', '.join(op.get('mode') or 'overwrite' for _, op in ops)
+        lines.append(f'- {file_path}: {modes} ({len(text)} characters)')
+    return '\n'.join(lines)
+
+
+@tool(
+    "Apply several file writes or edits inside the working directory in one call, all or nothing. "
+    "Use this for changes that span multiple files; if any operation fails, no file is changed.",
+    writes=lambda kwargs: [op['file_path'] for op in kwargs['operations']],
+    sequential=True,
+)
+def write_files(
+    working_directory,
+    operations: Annotated[
+        List[WriteOperation],
+        "The operations to apply in order. Each takes the same fields as write_file "
+        f"(mode is one of {', '.join(WRITE_MODES)}).",
+    ],
+):
+    """Apply a batch of write_file operations inside working_directory, all or nothing.
+
+    operations is a list of dicts taking the same arguments as write_file
+    (file_path, mode, content, patch, edits, start_line, end_line). Several
+    operations on one file are applied in order. Every path is checked
+    against the working directory and every edit is computed before anything
+    is written; changes are then staged to synced temporary files and renamed
+    into place, and if any step fails the files already replaced are restored.
+
+    Returns an error string starting with 'Error:' on failure, otherwise a one-line-per-file summary.
+    """
+    if not isinstance(operations, list) or not operations:
+        return 'Error: operations must be a non-empty list'
+
+    try:
+        workspace = get_workspace(working_directory)
+    except OSError as e:
+        return f'Error: {e}'
+
+    # Validate every path before touching anything; targets are canonical
+    # paths relative to the working directory.
+    targets = {}
+    order = []
+    for number, op in enumerate(operations, 1):
+        file_path = op.get('file_path') if isinstance(op, dict) else None
+        if not isinstance(file_path, str) or not file_path:
+            return f'Error: operation {number} needs a file_path'
+        try:
+            target = workspace.resolve(file_path)
+        except OutsideWorkspaceError:
+            return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
+        if not target:
+            return f'Error: "{file_path}" is a directory'
+        if target not in targets:
+            targets[target] = [file_path, None, []]
+            order.append(target)
+        targets[target][2].append((number, op))
+
+    # Every parent directory is opened once, or created when staging.
+    dir_fds = {}
+    try:
+        return _write_all(workspace, operations, targets, order, dir_fds)
+    finally:
+        for fd in dir_fds.values():
+            if fd is not None:
+                os.close(fd)
+
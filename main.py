@@ -1,11 +1,8 @@
 import os
 import sys
 import argparse
-import json
-import time
-from google.genai import types
-from functions.schemas import available_functions
-from functions.call_function import call_function
+import atexit
+import contextlib
 
 
 # Optional: load environment variables from a .env file if python-dotenv is installed.
@@ -16,209 +13,187 @@ except Exception:
     # It's fine if dotenv isn't available; environment vars may be set externally.
     pass
 
-try:
-    from google import genai
-except Exception:
-    print("The 'google.genai' client library is required. Install it with 'pip install google-genai' and try again.", file=sys.stderr)
-    sys.exit(1)
+# Only modules that do not import the genai SDK are loaded here; the SDK,
+# the session and the tools are imported when they are first needed, so
+# --help, argument errors and replay-free setup stay fast.
+from agent.context import DEFAULT_TOKEN_BUDGET
+from agent.usage import DEFAULT_MAX_TURNS, format_usage_table
+from agent.replay import DEFAULT_REPLAY_DIR, REPLAY_MODES, ReplayClient, ResponseStore
+from functions.tracing import tracer
 
-api_key = os.environ.get("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-# messages will be constructed per-request inside generate_content using the prompt
+# Model backends selectable with --backend / AGENT_BACKEND.
+BACKENDS = ('gemini', 'fake')
 
+_client = None
 
-def generate_content(prompt: str, verbose: bool = False):
-    """Generate content from the model for the given prompt.
 
-    Returns: (text, prompt_tokens, response_tokens)
+def get_client():
+    """Return the genai client, creating it on first use."""
+    global _client
+    if _client is None:
+        try:
+            from google import genai
+        except Exception:
+            print("The 'google.genai' client library is required. Install it with 'pip install google-genai' and try again.", file=sys.stderr)
+            sys.exit(1)
+        _client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+    return _client
+
+
+def make_client(backend: str = 'gemini', fake_script: str = None, replay_mode: str = 'passthrough',
+                replay_dir: str = DEFAULT_REPLAY_DIR, verbose: bool = False):
+    """Return the client sessions should use for the given backend and record/replay mode.
+
+    The fake backend plays back the turns in `fake_script` locally. Replay
+    mode answers from recorded responses only and never creates a backend
+    client, so it works offline and without an API key.
     """
-    # System prompt to instruct the model about using tools
-    system_prompt = """
-    You are a helpful AI coding agent.
+    if replay_mode == 'replay':
+        return ReplayClient(None, ResponseStore(replay_dir), mode='replay', verbose=verbose)
+    if backend == 'fake':
+        if not fake_script:
+            raise ValueError('the fake backend needs a script (--fake-script or AGENT_FAKE_SCRIPT)')
+        from agent.fake_model import FakeModelClient
+
+        inner = FakeModelClient.from_file(fake_script)
+    else:
+        inner = get_client()
+    if replay_mode == 'passthrough':
+        return inner
+    return ReplayClient(inner, ResponseStore(replay_dir), mode=replay_mode, verbose=verbose)
 
-    When a user asks a question or makes a request, make a function call plan. You can perform the following operations:
 
-    - List files and directories
-    - Read file contents
-    - Execute Python files with optional arguments
-    - Write or overwrite files
+def generate_content(prompt: str, verbose: bool = False):
+    """Run a fresh agent session for the given prompt until the model answers.
 
-    All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
+    Returns: (text, prompt_tokens, response_tokens, done), with token counts summed over the session
     """
+    from agent.session import AgentSession
 
-    # Build the typed messages list: only the user prompt is included in contents.
-    # The system instruction is passed separately via GenerateContentConfig.system_instruction
-    messages = [
-        types.Content(role="user", parts=[types.Part(text=prompt)]),
-    ]
+    session = AgentSession(get_client(), verbose=verbose)
+    text = session.run(prompt)
+    return text, session.prompt_tokens, session.response_tokens, session.done
+
+
+def run_batch_file(path: str, concurrency: int = 4, verbose: bool = False, context_budget: int = DEFAULT_TOKEN_BUDGET,
+                   client=None, max_turns: int = DEFAULT_MAX_TURNS, max_tokens: int = None):
+    """Run the prompts of an NDJSON file (or stdin for "-") concurrently.
+
+    Results are written to stdout as NDJSON; tool progress messages are sent
+    to stderr so they do not interleave with the results.
+    """
+    import asyncio
+    from agent.batch import run_batch
+
+    client = client or get_client()
+    out = sys.stdout
+    source = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            asyncio.run(run_batch(client, source, out, concurrency=concurrency, max_turns=max_turns,
+                                  max_tokens=max_tokens, verbose=verbose, context_budget=context_budget))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def finish_tracing(trace_path: str = None, profile: bool = False):
+    """Write the collected spans to trace_path and/or print the per-span summary to stderr."""
+    if trace_path:
+        tracer.write(trace_path)
+        print(f"Trace written to {trace_path} ({len(tracer.events)} spans)", file=sys.stderr)
+    if profile:
+        print(tracer.summary(), file=sys.stderr)
 
-    # Tool-invocation loop: keep calling the model with the full messages list
-    # and execute any function calls the model requests until it stops.
-    while True:
-        # Call the model with retries/backoff to handle transient server-side errors
-        max_attempts = 5
-        attempt = 0
-        while True:
-            try:
-                response = client.models.generate_content(
-                    model='gemini-2.0-flash-001',
-                    contents=messages,
-                    config=types.GenerateContentConfig(system_instruction=system_prompt, tools=[available_functions]),
-                )
-                break
-            except Exception as e:
-                attempt += 1
-                # For transient errors (like 503/429), retry with exponential backoff
-                if attempt >= max_attempts:
-                    # Re-raise the exception after exhausting retries
-                    raise
-                backoff = 2 ** (attempt - 1)
-                if verbose:
-                    print(f"Transient error calling model (attempt {attempt}/{max_attempts}): {e}. Retrying in {backoff}s...")
-                time.sleep(backoff)
-                continue
-
-        # Some client implementations return usage_metadata as an attribute or a dict.
-        usage = getattr(response, "usage_metadata", None)
-
-        # Append all candidates to the conversation as assistant messages so
-        # the model's chosen candidate(s) become part of the message history.
-        candidates = getattr(response, 'candidates', None)
-        if candidates:
-            for cand in candidates:
-                cand_content = getattr(cand, 'content', None) or getattr(cand, 'text', None)
-
-                # Normalize candidate content to a plain string. The API may return
-                # a nested Content object (with parts) or a dict; ensure we pass
-                # a string into types.Part(text=...).
-                cand_text = None
-                if isinstance(cand_content, str):
-                    cand_text = cand_content
-                else:
-                    # If it's a Content-like object with parts, extract text from parts
-                    if hasattr(cand_content, 'parts'):
-                        parts_texts = []
-                        for p in getattr(cand_content, 'parts') or []:
-                            t = getattr(p, 'text', None) or getattr(p, 'content', None)
-                            if t is not None:
-                                parts_texts.append(t)
-                        if parts_texts:
-                            cand_text = "\n".join(parts_texts)
-
-                    # As a fallback, JSON-serialize the candidate content
-                    if cand_text is None:
-                        try:
-                            cand_text = json.dumps(cand_content, default=str)
-                        except Exception:
-                            cand_text = str(cand_content)
-
-                if cand_text:
-                    messages.append(types.Content(role="assistant", parts=[types.Part(text=cand_text)]))
-
-        # Check for function calls
-        function_calls = getattr(response, 'function_calls', None)
-
-        # If there are function calls, execute the first one and append the tool response
-        if function_calls:
-            first_call = function_calls[0]
-            if verbose:
-                print(f"Calling function: {getattr(first_call, 'name', None)}({getattr(first_call, 'args', None)})")
-
-            # Execute the function using our helper
-            function_call_result = call_function(first_call, verbose=verbose)
-
-            # Ensure we got a types.Content back
-            if not (hasattr(function_call_result, 'parts') and function_call_result.parts):
-                raise RuntimeError('Invalid function result returned by call_function')
-
-            # Extract the function response payload
-            part = function_call_result.parts[0]
-            function_response = getattr(part, 'function_response', None)
-            if function_response is None:
-                raise RuntimeError('Invalid function result: missing function_response')
-
-            response_payload = getattr(function_response, 'response', None)
-            if response_payload is None:
-                raise RuntimeError('Invalid function result: missing response payload')
-
-            # Append the tool response as a tool message so the model can continue.
-            tool_text = types.Part.from_function_response(name=part.function_response.name, response=response_payload)
-            tool_content = types.Content(role="tool", parts=[tool_text])
-            messages.append(tool_content)
-
-            # Also append the function response as a user-role message (serialized)
-            # so the model sees the function result as part of the conversation.
-            user_text = types.Part(text=json.dumps(response_payload))
-            user_content = types.Content(role="user", parts=[user_text])
-            messages.append(user_content)
-
-            # Loop to call the model again with the updated messages
-            continue
-
-        # No function calls requested — break and proceed to extract text and usage
-        break
-
-    if usage is None:
-        prompt_tokens = "N/A"
-        response_tokens = "N/A"
-    else:
-        if hasattr(usage, 'prompt_token_count'):
-            prompt_tokens = usage.prompt_token_count
-        elif isinstance(usage, dict) and 'prompt_token_count' in usage:
-            prompt_tokens = usage['prompt_token_count']
-        else:
-            prompt_tokens = "N/A"
-
-        if hasattr(usage, 'candidates_token_count'):
-            response_tokens = usage.candidates_token_count
-        elif isinstance(usage, dict) and 'candidates_token_count' in usage:
-            response_tokens = usage['candidates_token_count']
-        else:
-            response_tokens = "N/A"
-
-    # Extract final text/candidate from the last model response
-    text = getattr(response, 'text', None)
-    had_text = text is not None
-    if text is None:
-        candidates = getattr(response, 'candidates', None)
-        if candidates and len(candidates) > 0:
-            text = getattr(candidates[0], 'content', None) or getattr(candidates[0], 'text', None)
-
-    # Return an extra flag (had_text) that is True when response.text was present
-    return (text or ""), prompt_tokens, response_tokens, had_text
 
 def main():
     # Parse command-line arguments: a single positional prompt and an optional --verbose flag.
     parser = argparse.ArgumentParser(description="Generate content from Gemini model.")
-    parser.add_argument('prompt', help='The user prompt as a single quoted string')
+    parser.add_argument('prompt', nargs='?', help='The user prompt as a single quoted string')
     parser.add_argument('--verbose', action='store_true', help='Print prompt and token counts')
+    parser.add_argument('--stream', action='store_true', help='Print the model output as it is generated')
+    parser.add_argument('--context-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f'Approximate prompt-token budget before old tool output is compacted; 0 disables (default: {DEFAULT_TOKEN_BUDGET})')
+    parser.add_argument('--batch', metavar='FILE', help='Run every prompt in an NDJSON file ("-" for stdin) and write NDJSON results to stdout')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of sessions run at once in --batch mode (default: 4)')
+    parser.add_argument('--replay-mode', choices=REPLAY_MODES, default=os.environ.get('AGENT_REPLAY_MODE', 'passthrough'),
+                        help='record model responses to --replay-dir, answer only from them (replay), or neither (default: passthrough)')
+    parser.add_argument('--replay-dir', default=DEFAULT_REPLAY_DIR, help=f'Directory of recorded responses (default: {DEFAULT_REPLAY_DIR})')
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get('AGENT_BACKEND', 'gemini'),
+                        help='Model backend: the Gemini API, or a local fake that plays back --fake-script (default: gemini)')
+    parser.add_argument('--fake-script', default=os.environ.get('AGENT_FAKE_SCRIPT'),
+                        help='JSON script of turns for the fake backend')
+    parser.add_argument('--max-turns', type=int, default=DEFAULT_MAX_TURNS,
+                        help=f'Stop a session after this many model turns (default: {DEFAULT_MAX_TURNS})')
+    parser.add_argument('--max-tokens', type=int,
+                        help='Stop a session before a model call would take its total token usage past this')
+    parser.add_argument('--trace', metavar='FILE', help='Write a Chrome/Perfetto trace of model calls, retries and tools to FILE')
+    parser.add_argument('--profile', action='store_true', help='Print time spent per stage when the run ends')
     args = parser.parse_args()
 
+    if args.trace or args.profile:
+        tracer.enable()
+        atexit.register(finish_tracing, args.trace, args.profile)
+
+    try:
+        client = make_client(args.backend, args.fake_script, args.replay_mode, args.replay_dir, verbose=args.verbose)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.batch:
+        run_batch_file(args.batch, concurrency=args.concurrency, verbose=args.verbose, context_budget=args.context_budget,
+                       client=client, max_turns=args.max_turns, max_tokens=args.max_tokens)
+        return
+
+    if args.prompt is None:
+        parser.error('a prompt is required unless --batch is given')
+
     prompt = args.prompt
 
-    # Call generate_content repeatedly to allow the agent to iterate on the prompt.
-    # Limit to 20 iterations to avoid infinite loops.
-    max_iters = 20
-    for i in range(max_iters):
+    from agent.session import AgentSession
+    from functions.call_function import tool_cache
+
+    # Drive one session: each iteration is a single model turn that continues
+    # the same conversation. Stop once the model answers without requesting a
+    # function call, or when the turn or token budget runs out.
+    session = AgentSession(client, verbose=args.verbose, context_budget=args.context_budget, stream=args.stream,
+                           max_turns=args.max_turns, max_tokens=args.max_tokens)
+    session.add_user_message(prompt)
+
+    while True:
+        turns = session.turns
         try:
-            response_text, prompt_tokens, response_tokens, had_text = generate_content(prompt, verbose=args.verbose)
+            done = session.step()
         except Exception as e:
             print(f"Error during generation: {e}")
             break
 
-        print(f"[Iteration {i+1}]")
-        print(response_text)
-
-        if args.verbose:
+        if args.verbose and session.turns > turns:
             # Print the user's prompt and token counts only when verbose is requested.
+            usage = session.turn_usage[-1]
+            print(f"[Iteration {session.turns}]")
             print(f'User prompt: "{prompt}"')
-            print(f"Prompt tokens: {prompt_tokens}")
-            print(f"Response tokens: {response_tokens}")
-
-        # If the model returned a final response in response.text, we're done
-        if had_text:
+            print(f"Prompt tokens: {usage.prompt} (cached: {usage.cached}, session: {session.usage.prompt})")
+            print(f"Response tokens: {usage.candidates} (session: {session.usage.candidates})")
+
+        if done:
+            if session.done:
+                # In --stream mode the answer has already been printed as it arrived.
+                if not args.stream:
+                    print(session.text)
+            elif session.stop_reason == 'max_turns':
+                print(f"Stopped after {session.turns} turns without a final response (--max-turns).")
+            else:
+                print(f"Stopped after {session.turns} turns and {session.usage.total} tokens "
+                      f"without a final response (--max-tokens {args.max_tokens}).")
             break
 
+    if args.verbose:
+        print(format_usage_table(session.turn_usage))
+        print(f"Tool cache: {tool_cache.stats()}")
+        if isinstance(client, ReplayClient):
+            print(f"Replay: {client.stats()}")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
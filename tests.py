@@ -1,4 +1,10 @@
+import os
 from functions.run_python_file import run_python_file
+from functions.get_file_content import get_file_content
+from functions.get_files_info import get_files_info
+from functions.search_files import search_files
+from functions.write_file import write_file
+from functions.write_files import write_files
 
 
 def print_result(case_label, result):
@@ -38,3 +44,60 @@ if __name__ == '__main__':
     # 6) non-py file
     res = run_python_file('calculator', 'lorem.txt')
     print_result('run_python_file("calculator", "lorem.txt")', res)
+
+    # 7) ranged reads: a byte range and a line range
+    res = get_file_content('calculator', 'pkg/calculator.py', offset=0, length=15)
+    print_result('get_file_content("calculator", "pkg/calculator.py", offset=0, length=15)', res)
+
+    res = get_file_content('calculator', 'pkg/calculator.py', start_line=3, end_line=5)
+    print_result('get_file_content("calculator", "pkg/calculator.py", start_line=3, end_line=5)', res)
+
+    # 8) line range past the end of the file
+    res = get_file_content('calculator', 'pkg/calculator.py', start_line=1000)
+    print_result('get_file_content("calculator", "pkg/calculator.py", start_line=1000)', res)
+
+    # 9) recursive listing filtered by a glob, one page at a time
+    res = get_files_info('calculator', '.', recursive=True, include=['*.py'], limit=2)
+    print_result('get_files_info("calculator", ".", recursive=True, include=["*.py"], limit=2)', res)
+
+    res = get_files_info('calculator', '.', recursive=True, include=['*.py'], limit=2, cursor='2')
+    print_result('get_files_info("calculator", ".", recursive=True, include=["*.py"], limit=2, cursor="2")', res)
+
+    # 10) indexed search, literal and regex
+    res = search_files('calculator', 'Calculator')
+    print_result('search_files("calculator", "Calculator")', res)
+
+    res = search_files('calculator', r'def _\w+', regex=True, include=['*.py'])
+    print_result('search_files("calculator", r"def _\w+", regex=True, include=["*.py"])', res)
+
+    # 11) patch-style edits on a scratch file, then clean up
+    write_file('calculator', 'scratch_edit.txt', 'one\ntwo\nthree\n')
+    res = write_file('calculator', 'scratch_edit.txt', mode='patch', patch='@@ -2,2 +2,2 @@\n two\n-three\n+THREE\n')
+    print_result('write_file("calculator", "scratch_edit.txt", mode="patch", ...)', res)
+
+    res = write_file('calculator', 'scratch_edit.txt', mode='replace', edits=[{'search': 'missing', 'replace': 'x'}])
+    print_result('write_file("calculator", "scratch_edit.txt", mode="replace", edits=[missing])', res)
+
+    res = get_file_content('calculator', 'scratch_edit.txt')
+    print_result('get_file_content("calculator", "scratch_edit.txt")', res)
+    os.remove(os.path.join('calculator', 'scratch_edit.txt'))
+
+    # 12) multi-file writes: one that applies, one that fails and leaves both files unchanged
+    ops = [
+        {'file_path': 'scratch_a.txt', 'content': 'a\n'},
+        {'file_path': 'scratch_b.txt', 'content': 'b\n'},
+    ]
+    res = write_files('calculator', ops)
+    print_result('write_files("calculator", [scratch_a.txt, scratch_b.txt])', res)
+
+    ops = [
+        {'file_path': 'scratch_a.txt', 'content': 'changed\n'},
+        {'file_path': 'scratch_b.txt', 'mode': 'replace', 'edits': [{'search': 'missing', 'replace': 'x'}]},
+    ]
+    res = write_files('calculator', ops)
+    print_result('write_files("calculator", [overwrite scratch_a.txt, bad replace scratch_b.txt])', res)
+
+    res = get_file_content('calculator', 'scratch_a.txt')
+    print_result('get_file_content("calculator", "scratch_a.txt")', res)
+    for name in ('scratch_a.txt', 'scratch_b.txt'):
+        os.remove(os.path.join('calculator', name))